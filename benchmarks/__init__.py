@@ -0,0 +1,7 @@
+"""性能基准：合成数据集生成与各环节的耗时/内存测量
+
+    python -m benchmarks.synthetic /tmp/bench_dataset --cases 200 --models 3 --reviews 2
+    python -m benchmarks.run --cases 200 --models 3 --reviews 2
+    python -m benchmarks.load_test --users 8 --cases-per-user 5
+    python -m benchmarks.startup --repeat 5
+"""
@@ -0,0 +1,98 @@
+"""在基准中使用AppTest时的适配，使测得的耗时与Streamlit服务器上的情况一致
+
+不导入numpy等应用依赖，冷启动测量（benchmarks.startup）的子进程可以直接使用。
+"""
+import contextlib
+import functools
+import threading
+
+
+def share_script_cache():
+    """让所有AppTest运行共享同一份编译后的脚本
+
+    AppTest每次运行都新建ScriptCache、重新解析和编译整个脚本，而服务器上所有会话共享一个已编译的脚本。
+    不共享时测得的耗时主要是编译时间，多个线程同时编译还会触发CPython的AST并发问题。
+    """
+    from streamlit.runtime.scriptrunner import script_cache
+
+    if getattr(script_cache.ScriptCache.get_bytecode, 'shared', False):
+        return
+    lock = threading.Lock()
+    compiled = {}
+    original = script_cache.ScriptCache.get_bytecode
+
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in compiled:
+                compiled[script_path] = original(self, script_path)
+            return compiled[script_path]
+
+    get_bytecode.shared = True
+    script_cache.ScriptCache.get_bytecode = get_bytecode
+
+
+def share_runtime():
+    """让并发的AppTest会话共享同一个Runtime
+
+    AppTest在每次运行开始时设置全局的Runtime._instance、结束时清空，并发运行时一个会话结束
+    会让其它仍在运行的会话失去Runtime（媒体文件、缓存）。服务器上所有会话共享同一个Runtime，
+    这里固定使用第一个创建的Runtime。
+
+    AppTest运行期间还用unittest.mock.patch替换全局的config.get_option，使global.appTest为True，
+    控件据此在会话状态中保存测试数据（选项的format_func等）。并发运行时先结束的会话会恢复
+    原函数，其它会话中随后创建的控件不保存测试数据，读取控件时出现KeyError('$$ID-...')。
+    这里把global.appTest固定为True，不再在每次运行时替换。
+    """
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    if getattr(Runtime.instance, 'shared', False):
+        return
+    lock = threading.Lock()
+    shared = []
+
+    def current(cls):
+        with lock:
+            if not shared and cls._instance is not None:
+                shared.append(cls._instance)
+            return shared[0] if shared else None
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    instance.shared = True
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+
+def fragment_id(at, name):
+    """AppTest会话中已注册的片段ID（按被@st.fragment装饰的函数名查找），未找到时返回None"""
+    for fragment_id, wrapped in list(at._fragment_storage._fragments.items()):
+        for cell in wrapped.__closure__ or ():
+            if getattr(cell.cell_contents, '__name__', None) == name:
+                return fragment_id
+    return None
+
+
+@contextlib.contextmanager
+def fragment_rerun(fragment_id):
+    """with块中的AppTest.run()只重跑指定片段，与浏览器中片段内的控件触发的rerun相同
+
+    AppTest本身每次都重跑整个脚本；这里在它创建的RerunData中加入片段队列。
+    重跑后AppTest的元素树只包含该片段的输出。
+    """
+    from streamlit.testing.v1 import local_script_runner
+
+    original = local_script_runner.RerunData
+    local_script_runner.RerunData = functools.partial(original, fragment_id_queue=[fragment_id])
+    try:
+        yield
+    finally:
+        local_script_runner.RerunData = original
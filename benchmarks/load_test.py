@@ -0,0 +1,286 @@
+"""并发评分者负载测试：在本机用多个AppTest会话模拟同时评分的用户
+
+每个模拟用户在自己的线程中驱动一个无界面会话，循环执行：
+上传病例（或在数据集模式下选择病例）→ 选择模型 → 打分 → 保存到服务器。
+所有会话运行在同一进程中，共享应用的进程级缓存和存储，与一个Streamlit服务器进程的情况一致。
+
+    python -m benchmarks.load_test --users 8 --cases-per-user 5
+    python -m benchmarks.load_test --users 16 --mode dataset --cases 100 --think-time 0.5
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.apptest import share_runtime, share_script_cache
+from benchmarks.run import APP_PATH, isolate_state, max_rss_mb
+from benchmarks.synthetic import add_arguments, dataset_options, generate_dataset
+
+INTERACTIONS = ("open_case", "select_model", "score", "save")
+MIME_TYPES = {'.json': "application/json", '.jpg': "image/jpeg", '.png': "image/png"}
+
+
+def current_rss_mb():
+    """当前常驻内存（MB），无法读取/proc时返回峰值"""
+    try:
+        with open("/proc/self/status", encoding='ascii') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return max_rss_mb()
+
+
+def directory_size_mb(path):
+    """目录的实际磁盘占用（MB），硬链接到同一文件的只计一次"""
+    sizes = {}
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            sizes[(stat.st_dev, stat.st_ino)] = stat.st_size
+    return sum(sizes.values()) / 2 ** 20
+
+
+def case_files(folder_path):
+    """病例文件夹中的文件，格式为AppTest上传控件需要的(文件名, 内容, MIME类型)"""
+    files = []
+    for name in sorted(os.listdir(folder_path)):
+        extension = os.path.splitext(name)[1]
+        if extension in MIME_TYPES:
+            with open(os.path.join(folder_path, name), 'rb') as f:
+                files.append((name, f.read(), MIME_TYPES[extension]))
+    return files
+
+
+class LoadTestResults:
+    """各交互的耗时样本、错误和资源占用采样（线程安全）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in INTERACTIONS}
+        self.errors = []
+        self.rss_samples = []
+        self.disk_samples = []
+
+    def record(self, interaction, seconds):
+        with self.lock:
+            self.latencies[interaction].append(seconds * 1000)
+
+    def error(self, user, message):
+        with self.lock:
+            self.errors.append(f"用户{user}: {message}")
+
+
+class SimulatedGrader(threading.Thread):
+    """一个模拟评分者：独立的AppTest会话"""
+
+    def __init__(self, user, cases, mode, dataset_root, save_path, think_time, timeout, results, start_barrier):
+        super().__init__(name=f"grader-{user}", daemon=True)
+        self.user = user
+        self.cases = cases
+        self.mode = mode
+        self.dataset_root = dataset_root
+        self.save_path = save_path
+        self.think_time = think_time
+        self.timeout = timeout
+        self.results = results
+        self.start_barrier = start_barrier
+        self.rng = random.Random(user)
+        self.saved = 0
+
+    def step(self, interaction, action):
+        """执行一次交互并重跑脚本，记录耗时；出现异常或找不到控件时返回False"""
+        start = time.perf_counter()
+        try:
+            action()
+        except KeyError as e:
+            self.results.error(self.user, f"{interaction}: 未找到控件 {e}")
+            return False
+        self.at.run()
+        self.results.record(interaction, time.perf_counter() - start)
+        if self.at.exception:
+            self.results.error(self.user, f"{interaction}: {self.at.exception[0].message}")
+            return False
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        return True
+
+    def setup(self):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=self.timeout)
+        self.at.run()
+        self.at.sidebar.text_input(key="username_input").set_value(f"load_user_{self.user}")
+        # review文件写到临时目录，不写入数据集的病例文件夹
+        self.at.sidebar.text_input(key="save_path_input").set_value(self.save_path)
+        if self.mode == "dataset":
+            self.at.sidebar.radio(key="data_source").set_value("数据集目录")
+            self.at.run()
+            self.at.sidebar.text_input(key="dataset_root_input").set_value(self.dataset_root)
+        self.at.run()
+
+    def open_case(self, folder):
+        if self.mode == "dataset":
+            return self.step("open_case", lambda: self.at.sidebar.selectbox(key="case_selection").set_value(folder))
+        files = case_files(os.path.join(self.dataset_root, folder))
+        return self.step("open_case", lambda: self.at.sidebar.file_uploader[0].set_value(files))
+
+    def grade_case(self, folder):
+        if not self.open_case(folder):
+            return
+        try:
+            models = self.at.sidebar.radio(key="model_selection").options
+        except KeyError:
+            self.results.error(self.user, "open_case: 未找到模型选择控件")
+            return
+        model_name = self.rng.choice(models)
+        if not self.step("select_model", lambda: self.at.sidebar.radio(key="model_selection").set_value(model_name)):
+            return
+        score = self.rng.randint(0, 5)
+        if not self.step("score", lambda: self.at.slider(key=f"peer_score_{model_name}").set_value(score)):
+            return
+        save_buttons = [button for button in self.at.button if "保存到服务器" in button.label]
+        if not save_buttons:
+            self.results.error(self.user, "未找到保存按钮")
+            return
+        if self.step("save", save_buttons[0].click):
+            self.saved += 1
+
+    def run(self):
+        try:
+            self.setup()
+        except Exception as e:
+            self.results.error(self.user, f"setup: {e!r}")
+            self.cases = []
+        # 初始化失败的会话也要到达屏障，否则其他会话会一直等待
+        self.start_barrier.wait()
+        try:
+            for folder in self.cases:
+                self.grade_case(folder)
+        except Exception as e:
+            self.results.error(self.user, repr(e))
+
+
+def sample_resources(results, paths, stop, interval):
+    while not stop.wait(interval):
+        with results.lock:
+            results.rss_samples.append(current_rss_mb())
+            results.disk_samples.append(sum(directory_size_mb(path) for path in paths))
+
+
+def saved_review_count(db_path):
+    try:
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+
+
+def print_report(results, elapsed, users, expected_saves, saved_in_store, rss_start, disk_start):
+    print(f"\n{users} 个并发用户，用时 {elapsed:.1f} 秒")
+    print(f"{'交互':<16}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'最大(ms)':>10}")
+    total = 0
+    for name in INTERACTIONS:
+        values = np.array(results.latencies[name])
+        total += len(values)
+        if len(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            print(f"{name:<16}{len(values):>8}{p50:>10.0f}{p95:>10.0f}{p99:>10.0f}{values.max():>10.0f}")
+    print(f"吞吐量: {total / elapsed:.1f} 次交互/秒")
+    rss = results.rss_samples or [rss_start]
+    disk = results.disk_samples or [disk_start]
+    print(f"进程RSS: 开始 {rss_start:.0f} MB，峰值 {max(rss):.0f} MB，结束 {rss[-1]:.0f} MB")
+    print(f"临时目录: 开始 {disk_start:.1f} MB，峰值 {max(disk):.1f} MB，结束 {disk[-1]:.1f} MB")
+    print(f"保存: 点击 {expected_saves} 次，评分存储中 {saved_in_store} 条")
+    if results.errors:
+        print(f"错误 {len(results.errors)} 个：")
+        for message in results.errors[:20]:
+            print(f"  {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发评分者负载测试")
+    parser.add_argument("--users", type=int, default=4, help="并发用户数")
+    parser.add_argument("--cases-per-user", type=int, default=5, help="每个用户评分的病例数")
+    parser.add_argument("--mode", choices=["upload", "dataset"], default="upload",
+                        help="upload：每个病例通过上传控件提交文件；dataset：在数据集目录中选择病例")
+    parser.add_argument("--think-time", type=float, default=0.0, help="两次交互之间的平均停顿（秒）")
+    parser.add_argument("--timeout", type=float, default=120, help="每次脚本运行的超时（秒）")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="资源采样间隔（秒）")
+    parser.add_argument("--dataset", help="使用已有的数据集目录（不指定时生成合成数据集）")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    add_arguments(parser)
+    parser.set_defaults(cases=20, image_size=[1024, 1024])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="score_load_")
+    isolate_state(work_dir)
+    # 评分由后台队列批量写入，缩短刷新间隔以便结束时统计
+    os.environ.setdefault("SCORE_REVIEW_FLUSH_INTERVAL", "0.5")
+    try:
+        if args.dataset:
+            dataset_root = os.path.abspath(args.dataset)
+            folders = sorted(name for name in os.listdir(dataset_root)
+                             if not name.startswith('.') and os.path.isdir(os.path.join(dataset_root, name)))
+        else:
+            dataset_root = os.path.join(work_dir, "dataset")
+            folders = generate_dataset(dataset_root, **dataset_options(args))
+        sys.path.insert(0, os.path.dirname(APP_PATH))
+        share_script_cache()
+        share_runtime()
+
+        results = LoadTestResults()
+        rng = random.Random(0)
+        barrier = threading.Barrier(args.users + 1)
+        graders = [
+            SimulatedGrader(user, rng.sample(folders, min(args.cases_per_user, len(folders))), args.mode,
+                            dataset_root, os.environ["SCORE_REVIEW_SAVE_ROOT"], args.think_time, args.timeout,
+                            results, barrier)
+            for user in range(args.users)
+        ]
+        for grader in graders:
+            grader.start()
+        # 所有会话完成首次运行后同时开始
+        barrier.wait()
+
+        watched = [os.environ["SCORE_UPLOAD_DIR"], os.environ["SCORE_IMAGE_CACHE_DIR"],
+                   os.path.dirname(os.environ["SCORE_REVIEW_DB"])]
+        rss_start = current_rss_mb()
+        disk_start = sum(directory_size_mb(path) for path in watched[:2])
+        stop = threading.Event()
+        sampler = threading.Thread(target=sample_resources, daemon=True,
+                                   args=(results, watched[:2], stop, args.sample_interval))
+        sampler.start()
+        start = time.perf_counter()
+        for grader in graders:
+            grader.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+
+        expected_saves = sum(grader.saved for grader in graders)
+        deadline = time.time() + 10
+        while saved_review_count(os.environ["SCORE_REVIEW_DB"]) < expected_saves and time.time() < deadline:
+            time.sleep(0.2)
+        print_report(results, elapsed, args.users, expected_saves,
+                     saved_review_count(os.environ["SCORE_REVIEW_DB"]), rss_start, disk_start)
+    finally:
+        if args.keep:
+            print(f"临时目录: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
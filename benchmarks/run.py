@@ -0,0 +1,233 @@
+"""运行性能基准：生成合成数据集，测量各环节的耗时、吞吐量和内存
+
+    python -m benchmarks.run --cases 200 --models 3 --reviews 2 --image-size 2048 2048
+    python -m benchmarks.run --dataset /path/to/dataset --json results.json
+
+评分存储、review文件、数据集索引、上传存储和图像缓存都放在临时目录中，不影响正式数据。
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.apptest import fragment_id, fragment_rerun, share_script_cache
+from benchmarks.synthetic import add_arguments, case_uploads, dataset_options, generate_dataset
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+def isolate_state(work_dir):
+    """导入应用之前把所有持久化路径指向临时目录"""
+    os.environ["SCORE_REVIEW_DB"] = os.path.join(work_dir, "reviews.sqlite3")
+    os.environ["SCORE_UPLOAD_DIR"] = os.path.join(work_dir, "uploads")
+    os.environ["SCORE_IMAGE_CACHE_DIR"] = os.path.join(work_dir, "image_cache")
+    os.environ["SCORE_REVIEW_SAVE_ROOT"] = os.path.join(work_dir, "saved_reviews")
+    # --dataset指定的真实数据集中不写入索引数据库
+    os.environ["SCORE_INDEX_DIR"] = os.path.join(work_dir, "index")
+    os.environ.setdefault("SCORE_TIMING_WINDOW", "100000")
+
+
+def max_rss_mb():
+    """进程的峰值常驻内存（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 2 ** 20 if sys.platform == "darwin" else usage / 1024
+
+
+def measure(name, unit, items, func, trace_memory=False, setup=None):
+    """对items中的每一项调用func并计时，返回结果字典；setup(item)在每次调用前执行，不计入耗时"""
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    durations = []
+    setup_time = 0.0
+    start = time.perf_counter()
+    for item in items:
+        if setup is not None:
+            setup_start = time.perf_counter()
+            setup(item)
+            setup_time += time.perf_counter() - setup_start
+        item_start = time.perf_counter()
+        func(item)
+        durations.append(time.perf_counter() - item_start)
+    total = time.perf_counter() - start - setup_time
+    peak_mb = None
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    milliseconds = np.array(durations) * 1000
+    return {
+        'name': name,
+        'count': len(durations),
+        'throughput': len(durations) / total if total else float('inf'),
+        'unit': unit,
+        'p50_ms': float(np.percentile(milliseconds, 50)) if len(durations) else 0.0,
+        'p95_ms': float(np.percentile(milliseconds, 95)) if len(durations) else 0.0,
+        'peak_alloc_mb': peak_mb,
+        'max_rss_mb': max_rss_mb(),
+    }
+
+
+def bench_load_folder_data(app, dataset_root, folders, trace_memory):
+    def load(folder):
+        app.load_folder_data(os.path.join(dataset_root, folder))
+    return measure("load_folder_data", "病例/秒", folders, load, trace_memory)
+
+
+def bench_create_from_uploads(app, dataset_root, folders, trace_memory):
+    uploads = [case_uploads(os.path.join(dataset_root, folder)) for folder in folders]
+
+    def load(files):
+        # 与应用中处理上传的调用相同：解析后放入共享缓存并设为当前病例
+        app.set_current_data(app.create_data_from_uploaded_files(files))
+
+    # 脚本外访问会话状态时Streamlit每次都记录"missing ScriptRunContext"警告，不计入耗时
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+    cache = app.get_case_cache()
+    results = [measure("create_data_from_uploaded_files（首次）", "病例/秒", uploads, load, trace_memory)]
+    # 内容未变的rerun：先加载一次（不计时），再计时同一上传的下一次加载，命中共享缓存
+    hits = cache.hits
+    results.append(measure("create_data_from_uploaded_files（rerun）", "病例/秒", uploads, load, trace_memory,
+                           setup=load))
+    results[-1]['cache_hits'] = cache.hits - hits
+    return results
+
+
+def bench_next_review_number(app, dataset_root, folders, models, trace_memory):
+    items = [(os.path.join(dataset_root, folder), f"model_{model}") for folder in folders for model in range(models)]
+    return measure("get_next_review_number", "次/秒", items,
+                   lambda item: app.get_next_review_number(item[0], item[1], "user_0"), trace_memory)
+
+
+def bench_save_review(app, dataset_root, folders, work_dir, trace_memory):
+    store = app.ReviewStore(os.environ["SCORE_REVIEW_DB"])
+    data = {'case_name': "benchmark"}
+
+    def save(folder):
+        # 写到临时目录，不改动数据集
+        review_data = app.build_review_data(data, "model_0", 3)
+        app.save_review(os.path.join(dataset_root, folder), "model_0", "bench_user", review_data,
+                        save_path=os.path.join(work_dir, "saved", folder), store=store)
+    return measure("save_review", "条/秒", folders, save, trace_memory)
+
+
+def bench_render(dataset_root, folders, timeout):
+    """无界面完整渲染：在AppTest中以数据集模式依次打开各病例（含display_main_interface）"""
+    from streamlit.testing.v1 import AppTest
+
+    share_script_cache()
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+    at.sidebar.radio(key="data_source").set_value("数据集目录")
+    at.sidebar.text_input(key="username_input").set_value("bench_user")
+    at.run()
+    # 数据集目录输入框在切换到数据集模式后才出现
+    at.sidebar.text_input(key="dataset_root_input").set_value(dataset_root)
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    def open_case(folder):
+        at.sidebar.selectbox(key="case_selection").set_value(folder)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    def rerun(_):
+        at.run()
+
+    results = [
+        measure("完整渲染（切换病例）", "次/秒", folders, open_case),
+        measure("完整渲染（同一病例rerun）", "次/秒", range(min(len(folders), 20)), rerun),
+    ]
+
+    # 拖动打分滑块：整页重跑（打分面板不是片段时）与只重跑打分面板片段
+    slider_key = f"peer_score_{at.sidebar.radio(key='model_selection').value}"
+    scoring_fragment = fragment_id(at, "display_scoring_pane")
+
+    def move_slider(i):
+        at.slider(key=slider_key).set_value(i % 6)
+        at.run()
+
+    def move_slider_in_fragment(i):
+        with fragment_rerun(scoring_fragment):
+            move_slider(i)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    moves = range(1, min(len(folders), 20) + 1)
+    results.append(measure("打分滑块（整页重跑）", "次/秒", moves, move_slider))
+    if scoring_fragment is not None:
+        results.append(measure("打分滑块（只重跑打分面板片段）", "次/秒", moves, move_slider_in_fragment))
+    return results
+
+
+def print_results(results):
+    print(f"{'基准':<40}{'次数':>8}{'吞吐量':>14}{'p50(ms)':>10}{'p95(ms)':>10}{'峰值分配(MB)':>14}{'RSS(MB)':>10}")
+    for result in results:
+        peak = "-" if result['peak_alloc_mb'] is None else f"{result['peak_alloc_mb']:.1f}"
+        print(f"{result['name']:<40}{result['count']:>8}"
+              f"{result['throughput']:>10.1f} {result['unit']:<4}"
+              f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{peak:>14}{result['max_rss_mb']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报告评估系统性能基准")
+    parser.add_argument("--dataset", help="使用已有的数据集目录（不指定时生成合成数据集）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的数据集和临时目录")
+    parser.add_argument("--trace-memory", action="store_true", help="用tracemalloc统计峰值分配（会拖慢计时）")
+    parser.add_argument("--skip-render", action="store_true", help="跳过AppTest完整渲染")
+    parser.add_argument("--render-cases", type=int, default=20, help="完整渲染测量的病例数")
+    parser.add_argument("--timeout", type=float, default=120, help="每次AppTest运行的超时（秒）")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="score_bench_")
+    isolate_state(work_dir)
+    try:
+        options = dataset_options(args)
+        if args.dataset:
+            dataset_root = os.path.abspath(args.dataset)
+            folders = sorted(name for name in os.listdir(dataset_root)
+                             if not name.startswith('.') and os.path.isdir(os.path.join(dataset_root, name)))
+        else:
+            dataset_root = os.path.join(work_dir, "dataset")
+            start = time.perf_counter()
+            folders = generate_dataset(dataset_root, **options)
+            print(f"生成 {len(folders)} 个病例用时 {time.perf_counter() - start:.1f} 秒: {dataset_root}")
+
+        # 导入应用模块（需在isolate_state之后，配置在导入时读取）
+        sys.path.insert(0, os.path.dirname(APP_PATH))
+        import streamlit_app as app
+
+        results = [bench_load_folder_data(app, dataset_root, folders, args.trace_memory)]
+        results += bench_create_from_uploads(app, dataset_root, folders, args.trace_memory)
+        results.append(bench_next_review_number(app, dataset_root, folders, args.models, args.trace_memory))
+        results.append(bench_save_review(app, dataset_root, folders, work_dir, args.trace_memory))
+        if not args.skip_render:
+            results += bench_render(dataset_root, folders[:args.render_cases], args.timeout)
+
+        print_results(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'dataset': options if not args.dataset else dataset_root, 'results': results},
+                          f, ensure_ascii=False, indent=2)
+    finally:
+        if args.keep:
+            print(f"临时目录: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
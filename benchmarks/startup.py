@@ -0,0 +1,124 @@
+"""冷启动与每次rerun的固定开销
+
+每一项都在新的子进程中测量，不受本进程已导入模块的影响：
+    导入耗时：import streamlit之后再导入应用模块（不运行main）
+    首屏：新进程中AppTest的第一次运行（含导入依赖和建立共享对象）、之后的后台预热和rerun
+    模块级代码：重复执行已编译的脚本（不运行main），即每次rerun都要付出的固定开销
+
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --app /tmp/old/streamlit_app.py   # 对比旧版本
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.run import APP_PATH, isolate_state
+
+IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+import streamlit
+start = time.perf_counter()
+import streamlit_app
+print(json.dumps({{'import_ms': (time.perf_counter() - start) * 1000}}))
+"""
+
+MODULE_PROBE = """
+import json, sys, time
+import streamlit
+with open({app_path!r}, encoding='utf-8') as f:
+    code = compile(f.read(), {app_path!r}, 'exec')
+exec(code, {{'__name__': 'startup_probe'}})
+durations = []
+for _ in range({runs}):
+    start = time.perf_counter()
+    exec(code, {{'__name__': 'startup_probe'}})
+    durations.append((time.perf_counter() - start) * 1000)
+print(json.dumps({{'module_ms': sorted(durations)[len(durations) // 2]}}))
+"""
+
+PAINT_PROBE = """
+import json, sys, threading, time
+sys.path.insert(0, {bench_dir!r})
+from benchmarks.apptest import share_script_cache
+from streamlit.testing.v1 import AppTest
+share_script_cache()
+at = AppTest.from_file({app_path!r}, default_timeout=120)
+start = time.perf_counter()
+at.run()
+first = (time.perf_counter() - start) * 1000
+# 首屏之后应用在后台预热，等预热结束再测rerun
+start = time.perf_counter()
+for thread in threading.enumerate():
+    if thread.name == "warmup":
+        thread.join()
+warmup = (time.perf_counter() - start) * 1000
+durations = []
+for _ in range({runs}):
+    start = time.perf_counter()
+    at.run()
+    durations.append((time.perf_counter() - start) * 1000)
+print(json.dumps({{'first_paint_ms': first, 'warmup_ms': warmup, 'rerun_ms': sorted(durations)[len(durations) // 2],
+                   'exceptions': [e.message for e in at.exception]}}))
+"""
+
+
+def run_probe(source, env, cwd):
+    """在新的Python进程中运行探测脚本，返回其最后一行输出的JSON
+
+    工作目录为脚本所在目录，与在该目录执行streamlit run一样读取其中的.streamlit/config.toml。
+    """
+    result = subprocess.run([sys.executable, "-c", source], env=env, cwd=cwd, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动与rerun固定开销")
+    parser.add_argument("--repeat", type=int, default=5, help="每项测量的新进程数")
+    parser.add_argument("--reruns", type=int, default=20, help="每个进程中测量的rerun次数")
+    parser.add_argument("--app", default=APP_PATH, help="要测量的脚本，例如旧版本的副本（用于前后对比）")
+    args = parser.parse_args()
+
+    samples = {}
+    # 探测进程共用的临时目录（评分存储、上传存储、图像缓存），结束后删除
+    with tempfile.TemporaryDirectory(prefix="score_startup_") as work_dir:
+        isolate_state(work_dir)
+        env = dict(os.environ, PYTHONWARNINGS="ignore")
+        app_path = os.path.abspath(args.app)
+        probes = {
+            'import_ms': IMPORT_PROBE.format(app_dir=os.path.dirname(app_path)),
+            'module_ms': MODULE_PROBE.format(app_path=app_path, runs=args.reruns),
+            'paint': PAINT_PROBE.format(bench_dir=os.path.dirname(APP_PATH), app_path=app_path, runs=args.reruns),
+        }
+        for _ in range(args.repeat):
+            for name, source in probes.items():
+                result = run_probe(source, env, os.path.dirname(app_path))
+                if result.get('exceptions'):
+                    raise RuntimeError(result['exceptions'][0])
+                for key, value in result.items():
+                    if key != 'exceptions':
+                        samples.setdefault(key, []).append(value)
+
+    labels = {
+        'import_ms': "导入应用模块（import streamlit之后）",
+        'first_paint_ms': "首屏（新进程第一次运行）",
+        'warmup_ms': "首屏之后的后台预热",
+        'rerun_ms': "rerun（无病例）",
+        'module_ms': "模块级代码（每次rerun）",
+    }
+    print(f"{'项目':<36}{'中位数(ms)':>12}{'最小(ms)':>12}")
+    for key, label in labels.items():
+        if key not in samples:
+            continue
+        values = np.array(samples[key])
+        print(f"{label:<36}{np.median(values):>12.1f}{values.min():>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""合成数据集生成器
+
+生成与真实数据集相同布局的病例文件夹：
+report.json、{model}_predict.json、{model}_review_{user}_{N}.json 和 image_{n}.jpg/png。
+"""
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image
+
+FINDING_SENTENCES = [
+    "The lungs are clear without focal consolidation.",
+    "There is a small left pleural effusion.",
+    "No pneumothorax is seen.",
+    "Heart size is mildly enlarged.",
+    "Mild pulmonary edema is present.",
+    "Patchy opacity in the right lower lobe may represent atelectasis.",
+    "There is a 1 cm nodule in the left upper lobe.",
+    "Degenerative changes of the thoracic spine.",
+    "No acute osseous abnormality.",
+    "Support devices are unchanged in position.",
+]
+
+
+def synthetic_text(rng, words):
+    """约words个单词的报告文本"""
+    sentences = []
+    while sum(len(sentence.split()) for sentence in sentences) < words:
+        sentences.append(rng.choice(FINDING_SENTENCES))
+    return " ".join(sentences)
+
+
+def synthetic_image(rng, path, size, bit_depth=8):
+    """类似X光片的灰度图像（平滑渐变加噪声）；bit_depth为16时保存为16位PNG"""
+    height, width = size
+    y, x = np.mgrid[0:height, 0:width]
+    base = 0.5 + 0.3 * np.sin(x / width * np.pi) * np.cos(y / height * np.pi)
+    noise = np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 0.05, size)
+    pixels = np.clip(base + noise, 0, 1)
+    if bit_depth == 16:
+        Image.fromarray((pixels * 65535).astype(np.uint16)).save(path)
+    else:
+        Image.fromarray((pixels * 255).astype(np.uint8)).save(path, quality=90)
+
+
+def generate_case(rng, folder_path, case_index, models, reviews, image_size, views, report_words, bit_depth):
+    os.makedirs(folder_path, exist_ok=True)
+    report = {
+        'subject_id': f"{10000000 + case_index}",
+        'study_id': f"{50000000 + case_index}",
+        'findings': synthetic_text(rng, report_words),
+        'impression': synthetic_text(rng, max(report_words // 4, 5)),
+    }
+    with open(os.path.join(folder_path, "report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    extension = "png" if bit_depth == 16 else "jpg"
+    for view in range(1, views + 1):
+        synthetic_image(rng, os.path.join(folder_path, f"image_{view}.{extension}"), image_size, bit_depth)
+
+    case_name = f"{report['subject_id']}_{report['study_id']}"
+    for model in range(models):
+        model_name = f"model_{model}"
+        prediction = {
+            'findings': synthetic_text(rng, report_words),
+            'impression': synthetic_text(rng, max(report_words // 4, 5)),
+            'logits': [rng.random() for _ in range(64)],
+        }
+        with open(os.path.join(folder_path, f"{model_name}_predict.json"), 'w', encoding='utf-8') as f:
+            json.dump(prediction, f)
+        for review in range(reviews):
+            review_data = {
+                'model_name': model_name,
+                'peer_score': rng.randint(0, 5),
+                'timestamp': "synthetic",
+                'case_name': case_name,
+                'username': f"user_{review}",
+                'review_number': 0,
+            }
+            with open(os.path.join(folder_path, f"{model_name}_review_user_{review}_0.json"), 'w',
+                      encoding='utf-8') as f:
+                json.dump(review_data, f, indent=2)
+
+
+def generate_dataset(root, cases, models=3, reviews=1, image_size=(1024, 1024), views=1,
+                     report_words=80, bit_depth=8, seed=0):
+    """在root下生成cases个病例文件夹（case_00000, case_00001, ...），返回文件夹名列表
+
+    每个病例有models个模型的预测，每个模型有reviews个不同用户的review；
+    image_size为(高, 宽)，views为每个病例的图像数。
+    """
+    rng = random.Random(seed)
+    folders = []
+    for case_index in range(cases):
+        folder = f"case_{case_index:05d}"
+        generate_case(rng, os.path.join(root, folder), case_index, models, reviews,
+                      image_size, views, report_words, bit_depth)
+        folders.append(folder)
+    return folders
+
+
+class SyntheticUpload:
+    """模拟st.file_uploader返回的UploadedFile（name、size、file_id、getvalue）"""
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.size = len(self.data)
+        self.file_id = f"{path}:{self.size}"
+
+    def getvalue(self):
+        return self.data
+
+
+def case_uploads(folder_path):
+    """病例文件夹中所有文件对应的模拟上传文件"""
+    return [SyntheticUpload(os.path.join(folder_path, name)) for name in sorted(os.listdir(folder_path))
+            if os.path.isfile(os.path.join(folder_path, name))]
+
+
+def add_arguments(parser):
+    parser.add_argument("--cases", type=int, default=100, help="病例数")
+    parser.add_argument("--models", type=int, default=3, help="每个病例的模型数")
+    parser.add_argument("--reviews", type=int, default=1, help="每个模型已有的review数")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1024, 1024], metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--views", type=int, default=1, help="每个病例的图像数")
+    parser.add_argument("--report-words", type=int, default=80, help="findings的大致单词数")
+    parser.add_argument("--bit-depth", type=int, choices=[8, 16], default=8, help="16时生成16位PNG")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def dataset_options(args):
+    return {
+        'cases': args.cases,
+        'models': args.models,
+        'reviews': args.reviews,
+        'image_size': tuple(args.image_size),
+        'views': args.views,
+        'report_words': args.report_words,
+        'bit_depth': args.bit_depth,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成数据集")
+    parser.add_argument("root", help="输出目录")
+    add_arguments(parser)
+    args = parser.parse_args()
+    folders = generate_dataset(args.root, **dataset_options(args))
+    print(f"已生成 {len(folders)} 个病例: {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""可在子进程中运行的批处理函数
+
+streamlit_app.py 由 Streamlit 作为 __main__ 脚本执行，其中定义的函数无法被
+进程池序列化，因此需要在进程池中运行的函数放在这个可导入的模块中。
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+from datetime import datetime
+
+# numpy和PIL只在图像处理函数中导入：应用首屏和只计算文本指标的子进程不必加载它们
+
+
+def file_sha256(path):
+    """文件内容的SHA-256"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def rendition_name(digest, max_side):
+    """显示尺寸图像的缓存文件名"""
+    return f"{digest}_{max_side}.jpg"
+
+
+def buffer_name(digest, max_side):
+    """解码后灰度数组的缓存文件名，max_side为空表示原始分辨率"""
+    return f"{digest}_{max_side or 'full'}.npy"
+
+
+def is_high_bit_depth(image):
+    """16位（及32位整数）灰度图像，例如16位PNG"""
+    return image.mode.startswith('I')
+
+
+def render_rendition(source_path, target_path, max_side):
+    """生成长边不超过max_side的JPEG，先写临时文件再原子替换"""
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(source_path)
+    if is_high_bit_depth(image):
+        # 16位图像先按最大值线性缩放到8位，否则转换时会被截断
+        image = image.convert('I')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        pixels = np.asarray(image, dtype=np.float32)
+        image = Image.fromarray((pixels * (255 / max(float(pixels.max()), 1.0))).astype(np.uint8))
+    else:
+        # JPEG可在解码阶段直接降采样，避免解码整幅大图
+        image.draft('RGB', (max_side, max_side))
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=".part")
+    with os.fdopen(fd, 'wb') as f:
+        image.save(f, format='JPEG', quality=90)
+    os.replace(tmp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def decode_buffer(source_path, target_path, max_side=None):
+    """把图像解码为灰度数组（8位图像为uint8，16位图像为uint16）保存为.npy，以便内存映射读取
+    
+    max_side为空时保持原始分辨率，否则缩小到长边不超过max_side。
+    """
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(source_path)
+    if is_high_bit_depth(image):
+        image, dtype = image.convert('I'), np.uint16
+    else:
+        if max_side:
+            image.draft('L', (max_side, max_side))
+        image, dtype = image.convert('L'), np.uint8
+    if max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    pixels = np.asarray(image)
+    if pixels.dtype != dtype:
+        pixels = np.clip(pixels, 0, np.iinfo(dtype).max).astype(dtype)
+    
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=".part")
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, pixels)
+    os.replace(tmp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def prepare_rendition(source_path, cache_dir, max_side):
+    """为图像生成缓存的显示尺寸版本（已存在时跳过），返回缓存文件路径"""
+    target_path = os.path.join(cache_dir, rendition_name(file_sha256(source_path), max_side))
+    if not os.path.exists(target_path):
+        render_rendition(source_path, target_path, max_side)
+    return target_path
+
+
+def parse_review_file_name(filename, model_name):
+    """解析{model_name}_review_{username}_{N}.json，返回(username, N)，格式不符时返回None"""
+    prefix = f"{model_name}_review_"
+    if not filename.startswith(prefix) or not filename.endswith('.json'):
+        return None
+    parts = filename[len(prefix):-len('.json')].rsplit('_', 1)
+    if len(parts) != 2 or not parts[1].isdigit() or not parts[0]:
+        return None
+    return parts[0], int(parts[1])
+
+
+def review_timestamp(value, fallback):
+    """导出用的评分时间：review中记录的ISO时间有效时直接使用，否则使用fallback（Unix时间戳）
+    
+    早期版本把当前工作目录写入了timestamp字段，这类记录以数据库的写入时间或文件修改时间代替。
+    """
+    if isinstance(value, str):
+        try:
+            datetime.fromisoformat(value)
+            return value
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(fallback).isoformat(timespec='seconds')
+
+
+def read_review_rows(dataset_root, entries):
+    """读取一批review文件，entries为[(病例文件夹, 病例名称, 模型名称, 文件名)]
+    
+    返回(行列表, 错误列表)，每行为(case_name, model_name, username, review_number, peer_score, timestamp)。
+    """
+    rows, errors = [], []
+    for folder, case_name, model_name, name in entries:
+        parsed = parse_review_file_name(name, model_name)
+        if parsed is None:
+            continue
+        try:
+            with open(os.path.join(dataset_root, folder, name), 'r', encoding='utf-8') as f:
+                review = json.load(f)
+                modified = os.fstat(f.fileno()).st_mtime
+        except (OSError, ValueError) as e:
+            errors.append(f"{folder}/{name}: {e}")
+            continue
+        rows.append((
+            review.get('case_name') or case_name, model_name, parsed[0], parsed[1],
+            review.get('peer_score'), review_timestamp(review.get('timestamp'), modified)
+        ))
+    return rows, errors
+
+
+# 自动指标的算法版本，修改指标计算方式时递增以使缓存的结果失效
+METRICS_VERSION = 1
+
+# 自动指标：英文按单词、中文按单字切分
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿]")
+SENTENCE_PATTERN = re.compile(r"[^.。;；，!！?？\n]+")
+# 常见影像所见关键词（规范名 -> 中英文写法），以及其前方的否定词
+FINDING_KEYWORDS = {
+    'pneumothorax': ('pneumothorax', '气胸'),
+    'effusion': ('effusion', '积液'),
+    'consolidation': ('consolidation', '实变'),
+    'pneumonia': ('pneumonia', '肺炎'),
+    'atelectasis': ('atelectasis', '肺不张'),
+    'edema': ('edema', 'oedema', '水肿'),
+    'cardiomegaly': ('cardiomegaly', '心影增大', '心脏增大'),
+    'nodule': ('nodule', 'mass', '结节', '肿块'),
+    'opacity': ('opacity', 'opacities', '密度增高影', '阴影'),
+    'fracture': ('fracture', '骨折'),
+    'emphysema': ('emphysema', '肺气肿'),
+    'fibrosis': ('fibrosis', '纤维化'),
+}
+NEGATION_PATTERN = re.compile(r"\b(no|not|without|negative for|free of|resolved)\b|未见|无|没有|排除|未发现")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def token_f1(reference, candidate):
+    """词袋重合的F1"""
+    overlap = sum((Counter(reference) & Counter(candidate)).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / len(candidate), overlap / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def lcs_length(a, b):
+    """最长公共子序列长度（位并行算法，每个b中的词一次整数运算）"""
+    masks = {}
+    for i, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for token in b:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count('1')
+
+
+def rouge_l(reference, candidate):
+    """ROUGE-L F1"""
+    lcs = lcs_length(reference, candidate)
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(candidate), lcs / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def bleu(reference, candidate, max_n=4):
+    """句子级BLEU（1-4元，n>1时加一平滑，含长度惩罚）"""
+    if not candidate:
+        return 0.0
+    log_precision = 0.0
+    for n in range(1, max_n + 1):
+        candidate_ngrams = Counter(zip(*[candidate[i:] for i in range(n)]))
+        reference_ngrams = Counter(zip(*[reference[i:] for i in range(n)]))
+        matches = sum((candidate_ngrams & reference_ngrams).values())
+        total = max(len(candidate) - n + 1, 0)
+        if n == 1:
+            if not matches:
+                return 0.0
+            log_precision += math.log(matches / total)
+        else:
+            log_precision += math.log((matches + 1) / (total + 1))
+    brevity = min(0.0, 1 - len(reference) / len(candidate))
+    return math.exp(brevity + log_precision / max_n)
+
+
+def keyword_findings(text):
+    """文本提到的关键词及其阳性/阴性：{规范名: True(阳性)/False(否定)}；同一词阳性优先"""
+    found = {}
+    for sentence in SENTENCE_PATTERN.findall(text.lower()):
+        for keyword, spellings in FINDING_KEYWORDS.items():
+            positions = [sentence.find(spelling) for spelling in spellings if spelling in sentence]
+            if not positions:
+                continue
+            negated = NEGATION_PATTERN.search(sentence[:min(positions)]) is not None
+            found[keyword] = found.get(keyword, False) or not negated
+    return found
+
+
+def keyword_agreement(reference_text, candidate_text):
+    """关键词一致率：两份文本提到的关键词中，阳性/阴性/未提及判断一致的比例；都未提及时为None"""
+    reference, candidate = keyword_findings(reference_text), keyword_findings(candidate_text)
+    keywords = set(reference) | set(candidate)
+    if not keywords:
+        return None
+    return sum(reference.get(k) == candidate.get(k) for k in keywords) / len(keywords)
+
+
+def report_metrics(reference_text, candidate_text):
+    """模型预测相对原始报告的自动指标"""
+    reference, candidate = tokenize(reference_text), tokenize(candidate_text)
+    if not reference or not candidate:
+        scores = {'token_f1': 0.0, 'rouge_l': 0.0, 'bleu': 0.0}
+    else:
+        scores = {
+            'token_f1': token_f1(reference, candidate),
+            'rouge_l': rouge_l(reference, candidate),
+            'bleu': bleu(reference, candidate),
+        }
+    scores['keyword_agreement'] = keyword_agreement(reference_text, candidate_text)
+    return scores
+
+
+def compute_metrics(jobs):
+    """批量计算自动指标，jobs为[(病例文件夹, 模型, 内容哈希, 报告文本, 预测文本)]"""
+    return [
+        (folder, model_name, content_hash, report_metrics(reference_text, candidate_text))
+        for folder, model_name, content_hash, reference_text, candidate_text in jobs
+    ]
@@ -1,17 +1,118 @@
 import streamlit as st
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import json
 import os
-from pathlib import Path
-from PIL import Image
 import glob
 import base64
 import tempfile
+import hashlib
+import shutil
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import atexit
+import itertools
+import contextlib
+import functools
+from collections import OrderedDict, deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# numpy、PIL、tarfile/zipfile/csv和进程池只在用到的函数中导入，首屏（尚未打开病例）不必加载它们
+import score_workers
+
+# 数据集目录模式配置（可通过环境变量覆盖）
+DEFAULT_DATASET_ROOT = os.environ.get("SCORE_DATASET_ROOT", "")
+INDEX_DB_NAME = ".score_index.sqlite3"
+# 索引数据库默认放在数据集目录中；指定目录时放在该目录下（按数据集路径区分），数据集目录只读时也可使用
+INDEX_DIR = os.environ.get("SCORE_INDEX_DIR", "")
+INDEX_REFRESH_INTERVAL = float(os.environ.get("SCORE_INDEX_REFRESH_INTERVAL", "60"))
+
+# 上传文件存储配置：磁盘配额（MB）与会话空闲超时（秒）
+UPLOAD_STORE_DIR = os.environ.get("SCORE_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "score_uploads"))
+UPLOAD_QUOTA_MB = float(os.environ.get("SCORE_UPLOAD_QUOTA_MB", "2048"))
+UPLOAD_PARSED_CACHE_SIZE = int(os.environ.get("SCORE_UPLOAD_PARSED_CACHE_SIZE", "256"))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SCORE_SESSION_IDLE_TIMEOUT", "3600"))
+
+# 图像显示缓存配置：显示尺寸与多视图缩略图尺寸（长边像素）、缩略图生成线程数、磁盘配额（MB）
+DISPLAY_IMAGE_SIZE = int(os.environ.get("SCORE_DISPLAY_IMAGE_SIZE", "1024"))
+THUMBNAIL_SIZE = int(os.environ.get("SCORE_THUMBNAIL_SIZE", "192"))
+THUMBNAIL_WORKERS = int(os.environ.get("SCORE_THUMBNAIL_WORKERS", "4"))
+IMAGE_CACHE_DIR = os.environ.get("SCORE_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "score_image_cache"))
+IMAGE_CACHE_QUOTA_MB = float(os.environ.get("SCORE_IMAGE_CACHE_QUOTA_MB", "1024"))
+
+# 病例预取配置：预取深度（病例数）、线程数与内存预算（MB）
+PREFETCH_DEPTH = int(os.environ.get("SCORE_PREFETCH_DEPTH", "3"))
+PREFETCH_WORKERS = int(os.environ.get("SCORE_PREFETCH_WORKERS", "2"))
+PREFETCH_MEMORY_MB = float(os.environ.get("SCORE_PREFETCH_MEMORY_MB", "256"))
+
+# 全文检索的查询词：双引号括起的短语或不含空白的词；以及需要额外建双字索引的非ASCII字符串
+SEARCH_TERM_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+CJK_RUN_PATTERN = re.compile(r'[^\x00-\x7f]{2,}')
+
+# 自动指标（模型预测相对原始报告）：名称与显示标签，以及每批计算的预测数
+METRIC_NAMES = ('token_f1', 'rouge_l', 'bleu', 'keyword_agreement')
+METRIC_LABELS = {'token_f1': "词重合F1", 'rouge_l': "ROUGE-L", 'bleu': "BLEU", 'keyword_agreement': "关键词一致率"}
+METRICS_CHUNK_SIZE = int(os.environ.get("SCORE_METRICS_CHUNK_SIZE", "500"))
+
+# 批量导入：每导入多少个病例增量刷新一次索引
+INGEST_INDEX_BATCH = int(os.environ.get("SCORE_INGEST_INDEX_BATCH", "500"))
+
+# 评分结果导出：每批读取的review文件数
+EXPORT_CHUNK_SIZE = int(os.environ.get("SCORE_EXPORT_CHUNK_SIZE", "2000"))
+EXPORT_COLUMNS = ('case_name', 'model_name', 'username', 'review_number', 'peer_score', 'timestamp')
+
+# 每个病例缓存的模型预测数（最近查看的模型），以及跨会话共享缓存中保留的无引用病例数
+MODEL_CACHE_SIZE = int(os.environ.get("SCORE_MODEL_CACHE_SIZE", "4"))
+CASE_CACHE_SIZE = int(os.environ.get("SCORE_CASE_CACHE_SIZE", "32"))
+
+# 病例浏览器每页显示的病例数（选择框只包含当前页）
+CASE_PAGE_SIZE = int(os.environ.get("SCORE_CASE_PAGE_SIZE", "500"))
+
+# 评分结果存储（SQLite数据库路径）
+REVIEW_DB_PATH = os.environ.get(
+    "SCORE_REVIEW_DB", os.path.join(os.path.expanduser("~"), ".score_interface", "reviews.sqlite3")
+)
+
+# 服务器端保存：后台批量写入的日志路径、批大小、刷新间隔（秒），是否同时写出review文件，
+# 以及上传病例的默认保存根目录（按case_name分子目录）
+REVIEW_JOURNAL_PATH = os.environ.get("SCORE_REVIEW_JOURNAL", REVIEW_DB_PATH + ".journal")
+REVIEW_BATCH_SIZE = int(os.environ.get("SCORE_REVIEW_BATCH_SIZE", "50"))
+REVIEW_FLUSH_INTERVAL = float(os.environ.get("SCORE_REVIEW_FLUSH_INTERVAL", "2"))
+REVIEW_WRITE_FILES = os.environ.get("SCORE_REVIEW_WRITE_FILES", "1") != "0"
+# 连续写入失败这么多次的review移到单独的失败日志（日志路径加.failed），不再阻塞队列
+REVIEW_MAX_ATTEMPTS = int(os.environ.get("SCORE_REVIEW_MAX_ATTEMPTS", "3"))
+REVIEW_SAVE_ROOT = os.environ.get(
+    "SCORE_REVIEW_SAVE_ROOT", os.path.join(os.path.expanduser("~"), ".score_interface", "reviews")
+)
+
+# 多评分者任务分配：每个(病例, 模型)需要的评分人数，以及任务租约时长（秒）
+REVIEWS_PER_TASK = int(os.environ.get("SCORE_REVIEWS_PER_TASK", "1"))
+TASK_LEASE_SECONDS = float(os.environ.get("SCORE_TASK_LEASE_SECONDS", "600"))
+
+# 性能计时：每个阶段保留的最近样本数，以及计时记录的JSON Lines文件路径（设置环境变量时每次运行后自动追加）
+TIMING_WINDOW = int(os.environ.get("SCORE_TIMING_WINDOW", "500"))
+TIMING_LOG_PATH = os.environ.get(
+    "SCORE_TIMING_LOG", os.path.join(os.path.expanduser("~"), ".score_interface", "timings.jsonl")
+)
+TIMING_LOG_AUTO = "SCORE_TIMING_LOG" in os.environ
+
+# 预热：第一个会话首屏之后在后台建立共享对象、刷新默认数据集的索引并预取前几个病例
+WARMUP_ENABLED = os.environ.get("SCORE_WARMUP", "1") != "0"
+WARMUP_CASES = int(os.environ.get("SCORE_WARMUP_CASES", "8"))
+
+# PEER评分等级数（0-5分）
+SCORE_LEVELS = 6
 
 # 页面配置
+# 图标用Material图标：emoji图标要先加载Streamlit的emoji目录（新进程首屏约130毫秒，改由后台预热加载）
 st.set_page_config(
     page_title="报告评分系统",
-    page_icon="📊",
+    page_icon=":material/analytics:",
     layout="wide",
     initial_sidebar_state="expanded"
 )
@@ -144,482 +245,3799 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def load_folder_data(folder_path):
-    """加载文件夹中的所有数据"""
-    data = {}
+class ProcessResources:
+    """进程内共享对象的注册表：{键: 对象}，同一个键只创建一次（不同的键可以同时创建）"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.building = {}  # 键 -> 创建时持有的锁
+    
+    def get(self, key, build):
+        with self.lock:
+            if key in self.values:
+                return self.values[key]
+            key_lock = self.building.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if key in self.values:
+                    return self.values[key]
+            value = build()
+            with self.lock:
+                self.values[key] = value
+                self.building.pop(key, None)
+            return value
+
+@st.cache_resource(show_spinner=False)
+def get_process_resources():
+    """获取进程内共享对象的注册表"""
+    return ProcessResources()
+
+def process_resource(func):
+    """进程内共享对象的获取函数，按函数和参数各创建一次（代替@st.cache_resource）
+    
+    每次rerun都会重新执行整个脚本，st.cache_resource装饰时要读取并哈希函数源码（每个约0.5毫秒）。
+    所有获取函数共用一个注册表，每次rerun只有注册表经过st.cache_resource。
+    键中包含函数的代码对象，修改代码后会创建新的对象。
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        return get_process_resources().get((func.__qualname__, func.__code__, args), lambda: func(*args))
+    return wrapper
+
+def summarize_timings(samples):
+    """{阶段: 耗时样本(毫秒)} -> {阶段: (次数, p50, p95)}"""
+    import numpy as np
+    
+    summary = {}
+    for name, values in samples.items():
+        if values:
+            p50, p95 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95])
+            summary[name] = (len(values), float(p50), float(p95))
+    return summary
+
+class TimingStats:
+    """进程内各阶段耗时的滑动窗口统计；原始记录暂存在内存中，可追加写入JSON Lines文件"""
+    
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}  # 阶段 -> deque(耗时毫秒)
+        self.records = deque(maxlen=window * 20)  # 尚未写出的原始记录
+    
+    def record(self, name, elapsed_ms, session_id):
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append(elapsed_ms)
+            self.records.append({'ts': time.time(), 'session': session_id, 'span': name, 'ms': round(elapsed_ms, 3)})
+    
+    def summary(self):
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+        return summarize_timings(samples)
+    
+    def flush(self, path):
+        """把尚未写出的记录追加到path，返回写出的条数"""
+        with self.lock:
+            records = list(self.records)
+            self.records.clear()
+        if records:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+        return len(records)
+
+@process_resource
+def get_timing_stats():
+    """获取进程内共享的计时统计"""
+    return TimingStats(TIMING_WINDOW)
+
+@contextlib.contextmanager
+def timed(name):
+    """记录代码块耗时（也可用作函数装饰器），同时计入本进程和当前会话的统计
+    
+    在后台线程中（如病例预取）没有会话，只计入进程统计。
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        ctx = get_script_run_ctx(suppress_warning=True)
+        get_timing_stats().record(name, elapsed_ms, ctx.session_id if ctx else None)
+        if ctx is not None:
+            st.session_state.setdefault('timing_samples', {}).setdefault(
+                name, deque(maxlen=TIMING_WINDOW)
+            ).append(elapsed_ms)
+
+def display_timing_panel():
+    """侧边栏性能调试面板：本会话与本进程各阶段耗时的p50/p95"""
+    if not st.sidebar.toggle("🐞 性能调试", key="timing_debug"):
+        return
+    session = summarize_timings(st.session_state.get('timing_samples', {}))
+    process = get_timing_stats().summary()
+    rows = []
+    for name in sorted(process):
+        row = {"阶段": name}
+        for label, summary in (("会话", session), ("进程", process)):
+            count, p50, p95 = summary.get(name, (0, float('nan'), float('nan')))
+            row.update({f"{label}次数": count, f"{label}p50(ms)": round(p50, 1), f"{label}p95(ms)": round(p95, 1)})
+        rows.append(row)
+    with st.sidebar.expander("⏱️ 各阶段耗时", expanded=True):
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        if st.button("💾 写入计时记录"):
+            count = get_timing_stats().flush(TIMING_LOG_PATH)
+            st.caption(f"已追加 {count} 条记录到 {TIMING_LOG_PATH}")
+
+IMAGE_NUMBER_PATTERN = re.compile(r'image_(\d+)\.')
+
+def extract_image_number(filename):
+    """提取image_{n}文件名中的数字n，无法解析时排在最后"""
+    match = IMAGE_NUMBER_PATTERN.search(filename)
+    return int(match.group(1)) if match else float('inf')
+
+def case_name_from_report(report, fallback):
+    """从report.json中提取subject_id和study_id，生成case_name"""
+    if report:
+        subject_id = report.get('subject_id', 'unknown')
+        study_id = report.get('study_id', 'unknown')
+        return f"subject_{subject_id}_study_{study_id}"
+    return fallback
+
+def scan_case_folder(folder_path):
+    """单次列目录，归类病例文件夹中的图像、预测文件和review文件"""
+    images = []
+    models = {}
+    json_files = []
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            name = entry.name
+            if name.startswith('image_') and name.endswith(('.jpg', '.png')):
+                images.append(name)
+            elif name.endswith('_predict.json'):
+                models[name[:-len('_predict.json')]] = name
+            elif name.endswith('.json'):
+                json_files.append(entry)
+    images.sort(key=extract_image_number)
+    models = dict(sorted(models.items()))
+    
+    # review文件: {model_name}_review*.json，记录mtime以便选出最新的一个
+    review_files = {model_name: [] for model_name in models}
+    for entry in json_files:
+        for model_name in models:
+            if entry.name.startswith(f"{model_name}_review"):
+                review_files[model_name].append((entry.name, entry.stat().st_mtime))
+    
+    return {'images': images, 'models': models, 'review_files': review_files}
+
+def load_folder_data(folder_path, entry=None):
+    """加载文件夹中的所有数据（entry为病例索引中的记录，提供时不再扫描文件夹）"""
+    data = {'folder_path': folder_path, 'lock': threading.RLock()}
+    if entry is not None:
+        # 索引中记录的文件夹mtime，索引刷新后与之不同说明病例数据已过期
+        data['dir_mtime'] = entry.get('dir_mtime')
+    else:
+        with timed("folder.scan"):
+            entry = scan_case_folder(folder_path)
     
     # 读取原始报告
     report_file = os.path.join(folder_path, "report.json")
     if os.path.exists(report_file):
-        with open(report_file, 'r', encoding='utf-8') as f:
+        with timed("folder.report_json"), open(report_file, 'r', encoding='utf-8') as f:
             data['report'] = json.load(f)
     
-    # 从report.json中提取subject_id和study_id，生成case_name
-    if data.get('report'):
-        subject_id = data['report'].get('subject_id', 'unknown')
-        study_id = data['report'].get('study_id', 'unknown')
-        data['case_name'] = f"subject_{subject_id}_study_{study_id}"
-    else:
-        # 如果report.json不存在，使用文件夹名称作为case_name
-        folder_name = os.path.basename(folder_path)
-        data['case_name'] = folder_name
-    
-    # 读取图像文件 - 选择image_{n}.jpg中n最小的文件
-    image_files = glob.glob(os.path.join(folder_path, "image_*.jpg")) + glob.glob(os.path.join(folder_path, "image_*.png"))
-    if image_files:
-        # 提取文件名中的数字并排序，选择n最小的
-        def extract_number(filename):
-            import re
-            match = re.search(r'image_(\d+)\.', filename)
-            return int(match.group(1)) if match else float('inf')
-        
-        image_files.sort(key=extract_number)
-        data['image'] = image_files[0]  # 取n最小的图像文件
-    # 读取所有模型预测文件
-    predict_files = glob.glob(os.path.join(folder_path, "*_predict.json"))
-    data['models'] = {}
+    # 如果report.json不存在，使用文件夹名称作为case_name
+    data['case_name'] = case_name_from_report(data.get('report'), os.path.basename(folder_path))
     
-    for predict_file in predict_files:
-        model_name = os.path.basename(predict_file).replace("_predict.json", "")
-        with open(predict_file, 'r', encoding='utf-8') as f:
-            data['models'][model_name] = json.load(f)
+    # 图像文件按image_{n}中的n排序，默认显示n最小的视图
+    data['images'] = [os.path.join(folder_path, name) for name in entry['images']]
+    if data['images']:
+        data['image'] = data['images'][0]
     
-    # 检查是否已有review文件（支持新的命名规则）
+    # 模型预测文件只记录路径，选中模型时才读取（见get_model_report）
+    data['models'] = {
+        model_name: os.path.join(folder_path, predict_name)
+        for model_name, predict_name in entry['models'].items()
+    }
+    data['model_cache'] = OrderedDict()
+    
+    # 检查是否已有review文件（支持新的命名规则），按修改时间排序，最新的在最后
     data['reviews'] = {}
     data['review_files'] = {}
-    
     for model_name in data['models'].keys():
-        # 查找所有相关的review文件
-        review_pattern = os.path.join(folder_path, f"{model_name}_review*.json")
-        review_files = glob.glob(review_pattern)
-        
-        data['review_files'][model_name] = review_files
-        
-        # 如果有review文件，加载最新的一个
-        if review_files:
-            # 按修改时间排序，取最新的
-            latest_review = max(review_files, key=os.path.getmtime)
-            with open(latest_review, 'r', encoding='utf-8') as f:
-                data['reviews'][model_name] = json.load(f)
+        review_files = sorted(entry['review_files'].get(model_name, []), key=lambda item: item[1])
+        data['review_files'][model_name] = [os.path.join(folder_path, name) for name, _ in review_files]
     
     return data
 
-def get_next_review_number(folder_path, model_name, username):
-    """获取下一个review文件编号"""
-    pattern = os.path.join(folder_path, f"{model_name}_review_{username}_*.json")
-    existing_files = glob.glob(pattern)
+def get_model_report(data, model_name):
+    """读取模型预测的findings/impression（首次选中时读取，最近查看的模型保存在LRU中）
     
-    if not existing_files:
-        return 0
+    只保留显示需要的两个字段，预测文件中的其他辅助字段读取后即丢弃。
+    病例数据在会话间共享，缓存的读写都在病例数据自带的锁内进行。
+    """
+    with data['lock']:
+        cache = data['model_cache']
+        if model_name in cache:
+            cache.move_to_end(model_name)
+            return cache[model_name]
     
-    # 提取现有的编号
-    numbers = []
-    for file_path in existing_files:
-        filename = os.path.basename(file_path)
-        # 提取编号部分
-        try:
-            # 格式: {model_name}_review_{username}_{N}.json
-            parts = filename.replace('.json', '').split('_')
-            if len(parts) >= 4 and parts[-1].isdigit():
-                numbers.append(int(parts[-1]))
-        except:
-            continue
+    def load():
+        with timed("model.predict_json"), open(data['models'][model_name], 'r', encoding='utf-8') as f:
+            prediction = json.load(f)
+        return {
+            'findings': prediction.get('findings', ''),
+            'impression': prediction.get('impression', ''),
+        }
     
-    return max(numbers) + 1 if numbers else 0
+    # 上传病例的预测按内容哈希共享：其他上传中相同的预测文件只解析一次
+    digest = data.get('model_digests', {}).get(model_name)
+    report = get_upload_store().parsed_content(digest, 'prediction', load) if digest else load()
+    with data['lock']:
+        cache[model_name] = report
+        while len(cache) > MODEL_CACHE_SIZE:
+            cache.popitem(last=False)
+    return report
 
-def save_review(folder_path, model_name, username, review_data, save_path=None):
-    """保存review文件"""
-    if not username.strip():
-        raise ValueError("用户名不能为空")
+def get_previous_review(data, model_name):
+    """返回模型最新的review，没有时返回空字典
     
-    # 使用指定的保存路径，如果没有指定则使用默认路径
-    if save_path and save_path.strip():
-        target_path = save_path.strip()
-    else:
-        target_path = folder_path
+    优先返回本会话刚提交的评分；否则在首次访问时读取最新的review文件（结果在会话间共享）。
+    """
+    session_review = st.session_state.get('session_reviews', {}).get((case_key(data), model_name))
+    if session_review is not None:
+        return session_review
     
-    # 确保保存路径存在
-    os.makedirs(target_path, exist_ok=True)
+    with data['lock']:
+        if model_name in data['reviews']:
+            return data['reviews'][model_name]
+    review_files = data.get('review_files', {}).get(model_name)
+    if not review_files:
+        return {}
+    try:
+        with open(review_files[-1], 'r', encoding='utf-8') as f:
+            review = json.load(f)
+    except (OSError, ValueError) as e:
+        st.error(f"读取review文件失败: {e}")
+        return {}
+    with data['lock']:
+        data['reviews'][model_name] = review
+    return review
+
+def is_model_reviewed(data, model_name):
+    """模型是否已有review（已保存的文件或本会话提交的评分）"""
+    if (case_key(data), model_name) in st.session_state.get('session_reviews', {}):
+        return True
+    return bool(data.get('review_files', {}).get(model_name))
+
+def index_db_path(dataset_root):
+    """数据集索引数据库的路径"""
+    if not INDEX_DIR:
+        return os.path.join(dataset_root, INDEX_DB_NAME)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    digest = hashlib.sha256(dataset_root.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(INDEX_DIR, f"{os.path.basename(dataset_root) or 'dataset'}_{digest}.sqlite3")
+
+class CaseIndex:
+    """数据集目录的持久化病例索引（SQLite），按病例文件夹的mtime增量刷新
     
-    # 获取下一个编号
-    review_number = get_next_review_number(target_path, model_name, username)
+    打开病例或列出数据集时只查询索引，不再遍历文件系统。
+    索引中的路径均相对于数据集目录保存。
+    """
     
-    # 生成文件名
-    review_file = os.path.join(target_path, f"{model_name}_review_{username}_{review_number}.json")
+    def __init__(self, dataset_root):
+        self.dataset_root = os.path.abspath(dataset_root)
+        self.db_path = index_db_path(self.dataset_root)
+        self.lock = threading.RLock()
+        self.last_refresh = 0.0
+        self.last_changed = []
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cases (
+                folder TEXT PRIMARY KEY,
+                case_name TEXT NOT NULL,
+                dir_mtime REAL NOT NULL,
+                images TEXT NOT NULL,
+                models TEXT NOT NULL,
+                n_models INTEGER NOT NULL,
+                n_reviewed INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS review_files (
+                folder TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                name TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                PRIMARY KEY (folder, name)
+            );
+            CREATE INDEX IF NOT EXISTS idx_cases_name ON cases(case_name);
+            CREATE TABLE IF NOT EXISTS folder_changes (
+                folder TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_folder_changes_generation ON folder_changes(generation);
+        """)
+        # 报告与模型预测的findings/impression全文索引：trigram分词可检索至少3个字符的子串；
+        # trigram无法匹配的双字中文词，另把中文的每个双字组合写成"[xx]"存入case_grams（rowid与case_text一致）
+        has_text_index = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'case_text'"
+        ).fetchone()
+        if not has_text_index:
+            self.conn.executescript("""
+                CREATE VIRTUAL TABLE case_text USING fts5(
+                    folder UNINDEXED, source UNINDEXED, findings, impression, tokenize = 'trigram'
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS case_grams USING fts5(grams, tokenize = 'trigram');
+            """)
+            # 旧索引中已有的病例需要重新扫描以补充全文索引
+            self.conn.execute("UPDATE cases SET dir_mtime = -1")
+        # 全文索引中folder列不建索引，按病例删除时经由case_text_rows（有folder索引）找到对应的rowid
+        has_text_rows = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'case_text_rows'"
+        ).fetchone()
+        if not has_text_rows:
+            self.conn.executescript("""
+                CREATE TABLE case_text_rows (text_rowid INTEGER PRIMARY KEY, folder TEXT NOT NULL);
+                CREATE INDEX idx_case_text_rows_folder ON case_text_rows(folder);
+                INSERT INTO case_text_rows SELECT rowid, folder FROM case_text;
+            """)
+        # 模型预测相对原始报告的自动指标，content_hash不变时不重新计算
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS case_metrics (
+                folder TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                token_f1 REAL,
+                rouge_l REAL,
+                bleu REAL,
+                keyword_agreement REAL,
+                PRIMARY KEY (folder, model_name)
+            )
+        """)
+        self.conn.commit()
+        self.model_names_cache = None
     
-    # 添加额外信息到review_data
-    review_data['username'] = username
-    review_data['review_number'] = review_number
+    def is_stale(self):
+        """距上次刷新超过INDEX_REFRESH_INTERVAL秒"""
+        return time.time() - self.last_refresh > INDEX_REFRESH_INTERVAL
+    
+    def refresh(self):
+        """增量刷新索引：只重新扫描mtime发生变化的病例文件夹，返回更新的病例数"""
+        with self.lock:
+            known = dict(self.conn.execute("SELECT folder, dir_mtime FROM cases"))
+            changed = []
+            with os.scandir(self.dataset_root) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.') or not entry.is_dir():
+                        continue
+                    dir_mtime = entry.stat().st_mtime
+                    if known.pop(entry.name, None) != dir_mtime:
+                        self._index_folder(entry.name, dir_mtime)
+                        changed.append(entry.name)
+            
+            # 删除已不存在的病例文件夹
+            for folder in known:
+                self._remove_folder(folder)
+                self.conn.execute("DELETE FROM case_metrics WHERE folder = ?", (folder,))
+            if changed or known:
+                # 本次刷新中变化的文件夹记为新的一代，供review_file_changes增量读取
+                generation = self.conn.execute(
+                    "SELECT COALESCE(MAX(generation), 0) + 1 FROM folder_changes"
+                ).fetchone()[0]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO folder_changes VALUES (?, ?)",
+                    [(folder, generation) for folder in itertools.chain(changed, known)]
+                )
+            self.conn.commit()
+            self.last_refresh = time.time()
+            self.last_changed = changed
+            if changed or known:
+                self.model_names_cache = None
+            return len(changed)
     
-    with open(review_file, 'w', encoding='utf-8') as f:
-        json.dump(review_data, f, ensure_ascii=False, indent=2)
+    def _remove_folder(self, folder):
+        self.conn.execute("DELETE FROM cases WHERE folder = ?", (folder,))
+        self.conn.execute("DELETE FROM review_files WHERE folder = ?", (folder,))
+        rowids = self.conn.execute(
+            "SELECT text_rowid FROM case_text_rows WHERE folder = ?", (folder,)
+        ).fetchall()
+        if rowids:
+            self.conn.executemany("DELETE FROM case_grams WHERE rowid = ?", rowids)
+            self.conn.executemany("DELETE FROM case_text WHERE rowid = ?", rowids)
+            self.conn.execute("DELETE FROM case_text_rows WHERE folder = ?", (folder,))
     
-    return review_file
-
-def create_data_from_uploaded_files(uploaded_files):
-    """从上传的文件创建数据"""
-    data = {}
+    def _index_folder(self, folder, dir_mtime):
+        folder_path = os.path.join(self.dataset_root, folder)
+        entry = scan_case_folder(folder_path)
+        
+        report = None
+        report_file = os.path.join(folder_path, "report.json")
+        if os.path.exists(report_file):
+            try:
+                with open(report_file, 'r', encoding='utf-8') as f:
+                    report = json.load(f)
+            except (OSError, ValueError):
+                report = None
+        
+        self._remove_folder(folder)
+        n_reviewed = sum(1 for files in entry['review_files'].values() if files)
+        self.conn.execute(
+            "INSERT INTO cases VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (folder, case_name_from_report(report, folder), dir_mtime,
+             json.dumps(entry['images']), json.dumps(entry['models'], ensure_ascii=False),
+             len(entry['models']), n_reviewed)
+        )
+        self.conn.executemany(
+            "INSERT INTO review_files VALUES (?, ?, ?, ?)",
+            [(folder, model_name, name, mtime)
+             for model_name, files in entry['review_files'].items()
+             for name, mtime in files]
+        )
+        
+        texts = [('report', report)]
+        for model_name, predict_file in entry['models'].items():
+            try:
+                with open(os.path.join(folder_path, predict_file), 'r', encoding='utf-8') as f:
+                    texts.append((model_name, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        for source, content in texts:
+            if not isinstance(content, dict):
+                continue
+            findings, impression = str(content.get('findings') or ''), str(content.get('impression') or '')
+            rowid = self.conn.execute(
+                "INSERT INTO case_text VALUES (?, ?, ?, ?)", (folder, source, findings, impression)
+            ).lastrowid
+            self.conn.execute("INSERT INTO case_text_rows VALUES (?, ?)", (rowid, folder))
+            grams = "".join(
+                f"[{run[i:i + 2]}]"
+                for run in CJK_RUN_PATTERN.findall(findings + "\n" + impression)
+                for i in range(len(run) - 1)
+            )
+            if grams:
+                self.conn.execute("INSERT INTO case_grams (rowid, grams) VALUES (?, ?)", (rowid, grams))
     
-    # 创建临时目录来存储上传的文件
-    temp_dir = tempfile.mkdtemp()
+    def _case_query(self, query=None, sort_metric=None):
+        """病例列表查询的FROM/WHERE部分、ORDER BY部分和参数"""
+        sql = " FROM cases c"
+        params = []
+        if sort_metric is not None:
+            if sort_metric not in METRIC_NAMES:
+                raise ValueError(f"未知的指标: {sort_metric}")
+            sql += (f" LEFT JOIN (SELECT folder, MIN({sort_metric}) AS score FROM case_metrics"
+                    " GROUP BY folder) m ON m.folder = c.folder")
+        if query and query.strip():
+            sql += " WHERE c.case_name LIKE ? OR c.folder LIKE ?"
+            params += [f"%{query.strip()}%"] * 2
+        order = ("m.score IS NULL, m.score, " if sort_metric is not None else "") + "c.case_name, c.folder"
+        return sql, order, params
     
-    # 保存所有上传的文件到临时目录
-    saved_files = {}
-    for file in uploaded_files:
-        file_path = os.path.join(temp_dir, file.name)
-        with open(file_path, 'wb') as f:
-            f.write(file.getvalue())
-        saved_files[file.name] = file_path
+    def count_cases(self, query=None):
+        """符合筛选条件的病例数"""
+        sql, _, params = self._case_query(query)
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*)" + sql, params).fetchone()[0]
     
-    # 读取原始报告
-    report_data = None
-    for filename, file_path in saved_files.items():
-        if filename.endswith('report.json'):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    report_data = json.load(f)
-                data['report'] = report_data
-                break
-            except Exception as e:
-                st.error(f"读取report.json失败: {e}")
+    def case_position(self, folder, query=None, sort_metric=None):
+        """病例在list_cases结果中的位置（从0开始），不在结果中时返回None"""
+        sql, order, params = self._case_query(query, sort_metric)
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT position FROM (SELECT c.folder, ROW_NUMBER() OVER (ORDER BY {order}) - 1 AS position"
+                + sql + ") WHERE folder = ?", params + [folder]
+            ).fetchone()
+        return row[0] if row else None
     
-    # 从report.json中提取subject_id和study_id
-    if report_data:
-        subject_id = report_data.get('subject_id', 'unknown')
-        study_id = report_data.get('study_id', 'unknown')
-        data['case_name'] = f"subject_{subject_id}_study_{study_id}"
-    else:
-        data['case_name'] = "unknown_case"
+    def list_cases(self, query=None, limit=None, sort_metric=None, offset=0):
+        """列出索引中的病例，可按病例名称/文件夹名筛选，limit/offset用于分页
+        
+        sort_metric为自动指标名称时，按病例中该指标最低的模型升序排列（未计算的排在最后）。
+        """
+        sql, order, params = self._case_query(query, sort_metric)
+        sql = "SELECT c.folder, c.case_name, c.n_models, c.n_reviewed, c.dir_mtime" + sql + " ORDER BY " + order
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [
+            {'folder': folder, 'case_name': case_name, 'n_models': n_models, 'n_reviewed': n_reviewed,
+             'dir_mtime': dir_mtime}
+            for folder, case_name, n_models, n_reviewed, dir_mtime in rows
+        ]
+    
+    def case_reviewers(self, folders=None):
+        """返回[(folder, model_name, 已有review文件的用户集合)]，folders为空时返回全部病例"""
+        with self.lock:
+            if folders is None:
+                case_rows = self.conn.execute("SELECT folder, models FROM cases").fetchall()
+                review_rows = self.conn.execute("SELECT folder, model_name, name FROM review_files").fetchall()
+            else:
+                case_rows, review_rows = [], []
+                for folder in folders:
+                    case_rows += self.conn.execute(
+                        "SELECT folder, models FROM cases WHERE folder = ?", (folder,)
+                    ).fetchall()
+                    review_rows += self.conn.execute(
+                        "SELECT folder, model_name, name FROM review_files WHERE folder = ?", (folder,)
+                    ).fetchall()
+        reviewers = {}
+        for folder, model_name, name in review_rows:
+            username = review_file_username(name, model_name)
+            if username:
+                reviewers.setdefault((folder, model_name), set()).add(username)
+        return [
+            (folder, model_name, reviewers.get((folder, model_name), set()))
+            for folder, models in case_rows
+            for model_name in json.loads(models)
+        ]
     
-    # 读取图像文件 - 选择image_{n}.jpg中n最小的文件
-    image_files = {name: path for name, path in saved_files.items() 
-                  if name.startswith('image_') and name.endswith(('.jpg', '.png'))}
+    def get_case(self, folder):
+        """返回病例的索引记录（格式同scan_case_folder，另含索引时的dir_mtime），不存在时返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT images, models, dir_mtime FROM cases WHERE folder = ?", (folder,)
+            ).fetchone()
+            if row is None:
+                return None
+            review_rows = self.conn.execute(
+                "SELECT model_name, name, mtime FROM review_files WHERE folder = ?", (folder,)
+            ).fetchall()
+        models = json.loads(row[1])
+        review_files = {model_name: [] for model_name in models}
+        for model_name, name, mtime in review_rows:
+            review_files.setdefault(model_name, []).append((name, mtime))
+        return {'images': json.loads(row[0]), 'models': models, 'review_files': review_files, 'dir_mtime': row[2]}
+
+    def model_names(self):
+        """数据集中出现过的所有模型名称"""
+        with self.lock:
+            if self.model_names_cache is None:
+                names = set()
+                for (models,) in self.conn.execute("SELECT DISTINCT models FROM cases"):
+                    names.update(json.loads(models))
+                self.model_names_cache = sorted(names)
+            return self.model_names_cache
     
-    if image_files:
-        # 提取文件名中的数字并排序，选择n最小的
-        def extract_number(filename):
-            import re
-            match = re.search(r'image_(\d+)\.', filename)
-            return int(match.group(1)) if match else float('inf')
+    def search(self, text, source=None, reviewed=None, limit=200):
+        """在报告和模型预测的findings/impression中全文检索
         
-        sorted_images = sorted(image_files.items(), key=lambda x: extract_number(x[0]))
-        data['image'] = sorted_images[0][1]  # 取n最小的图像文件路径
-        data['temp_dir'] = temp_dir  # 保存临时目录路径以便后续清理
+        text中的词（或双引号括起的短语）需全部出现；source为'report'或模型名称时只检索该来源；
+        reviewed为True/False时只返回已有/没有review文件的结果（source为模型时按该模型判断）。
+        返回[(folder, case_name, source, 摘要)]，按病例名称排序。
+        """
+        terms = [phrase or word for phrase, word in SEARCH_TERM_PATTERN.findall(text)]
+        if not terms:
+            return []
+        long_terms = [term for term in terms if len(term) >= 3]
+        gram_terms = [term for term in terms if len(term) == 2 and CJK_RUN_PATTERN.fullmatch(term)]
+        sql = (
+            "SELECT t.folder, c.case_name, t.source, t.findings, t.impression"
+            " FROM case_text t JOIN cases c ON c.folder = t.folder WHERE 1"
+        )
+        params = []
+        if long_terms:
+            sql += " AND case_text MATCH ?"
+            params.append(" ".join('"' + term.replace('"', '""') + '"' for term in long_terms))
+        if gram_terms:
+            sql += " AND t.rowid IN (SELECT rowid FROM case_grams WHERE case_grams MATCH ?)"
+            params.append(" ".join(f'"[{term}]"' for term in gram_terms))
+        for term in terms:
+            # 其余短词（单字、英文缩写）索引无法匹配，只能逐行LIKE过滤
+            if len(term) < 3 and term not in gram_terms:
+                sql += " AND (t.findings LIKE ? OR t.impression LIKE ?)"
+                params += [f"%{term}%"] * 2
+        if source is not None:
+            sql += " AND t.source = ?"
+            params.append(source)
+        if reviewed is not None:
+            sql += (" AND " + ("" if reviewed else "NOT ")
+                    + "EXISTS (SELECT 1 FROM review_files r WHERE r.folder = t.folder")
+            if source not in (None, 'report'):
+                sql += " AND r.model_name = ?"
+                params.append(source)
+            sql += ")"
+        # 不按相关度排序：常见词命中大量文档时排序会扫描全部结果
+        sql += " LIMIT ?"
+        params.append(int(limit))
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        results = [
+            (folder, case_name, source, search_snippet(findings, impression, terms))
+            for folder, case_name, source, findings, impression in rows
+        ]
+        return sorted(results, key=lambda row: (row[1], row[0], row[2] != 'report', row[2]))
     
-    # 读取所有模型预测文件
-    data['models'] = {}
+    def iter_metric_jobs(self, chunk_size):
+        """分批产出需要计算自动指标的[(folder, 模型, 内容哈希, 报告文本, 预测文本)]
+        
+        文本取自全文索引，不再读取文件；报告和预测内容都未变（哈希相同）的跳过。
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            known = {(folder, model_name): content_hash for folder, model_name, content_hash
+                     in conn.execute("SELECT folder, model_name, content_hash FROM case_metrics")}
+            cursor = conn.execute("SELECT folder, source, findings, impression FROM case_text ORDER BY folder")
+            chunk = []
+            for folder, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+                texts = {source: f"{findings}\n{impression}" for _, source, findings, impression in rows}
+                reference = texts.pop('report', None)
+                if reference is None:
+                    continue
+                for model_name, candidate in texts.items():
+                    content_hash = hashlib.sha256(json.dumps(
+                        [score_workers.METRICS_VERSION, reference, candidate], ensure_ascii=False
+                    ).encode('utf-8')).hexdigest()
+                    if known.get((folder, model_name)) == content_hash:
+                        continue
+                    chunk.append((folder, model_name, content_hash, reference, candidate))
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            conn.close()
     
-    for filename, file_path in saved_files.items():
-        if filename.endswith('_predict.json'):
-            model_name = filename.replace('_predict.json', '')
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data['models'][model_name] = json.load(f)
-            except Exception as e:
-                st.error(f"读取{filename}失败: {e}")
+    def store_metrics(self, results):
+        """保存score_workers.compute_metrics的结果"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO case_metrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(folder, model_name, content_hash) + tuple(metrics[name] for name in METRIC_NAMES)
+                 for folder, model_name, content_hash, metrics in results]
+            )
+            self.conn.commit()
     
-    # 检查是否已有review文件（支持新的命名规则）
-    data['reviews'] = {}
-    data['review_files'] = {}
+    def get_metrics(self, folder):
+        """病例各模型的自动指标：{模型: {指标: 值}}"""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT model_name, {', '.join(METRIC_NAMES)} FROM case_metrics WHERE folder = ?", (folder,)
+            ).fetchall()
+        return {row[0]: dict(zip(METRIC_NAMES, row[1:])) for row in rows}
     
-    for model_name in data['models'].keys():
-        # 查找所有相关的review文件
-        review_files = {name: path for name, path in saved_files.items() 
-                       if name.startswith(f"{model_name}_review")}
-        data['review_files'][model_name] = list(review_files.values())
-        
-        # 如果有review文件，加载最新的一个
-        if review_files:
-            # 按文件名排序，取最新的（假设文件名包含时间戳或序号）
-            latest_review_path = sorted(review_files.values())[-1]
-            try:
-                with open(latest_review_path, 'r', encoding='utf-8') as f:
-                    data['reviews'][model_name] = json.load(f)
-            except Exception as e:
-                st.error(f"读取review文件失败: {e}")
+    def metrics_progress(self):
+        """(已计算自动指标的模型预测数, 模型预测总数)"""
+        with self.lock:
+            done = self.conn.execute(
+                "SELECT COUNT(*) FROM case_metrics m JOIN cases c ON c.folder = m.folder"
+            ).fetchone()[0]
+            total = self.conn.execute("SELECT SUM(n_models) FROM cases").fetchone()[0]
+        return done, total or 0
     
-    return data
-
-def clear_uploaded_session():
-    """清空当前上传数据及相关会话状态"""
-    st.session_state.uploader_key_seed += 1
-    st.session_state.current_data = None
-    st.session_state.last_selected_case = None
-    st.cache_data.clear()
+    def count_review_files(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM review_files").fetchone()[0]
+    
+    def review_file_changes(self, since=None):
+        """返回(当前代数, {folder: [(model_name, 文件名, mtime)]})
+        
+        since为None时返回全部病例文件夹，否则只返回代数大于since（此后重新扫描过或已删除）的文件夹，
+        已删除的文件夹对应空列表。
+        """
+        with self.lock:
+            generation = self.conn.execute("SELECT COALESCE(MAX(generation), 0) FROM folder_changes").fetchone()[0]
+            if since is None:
+                folders = [row[0] for row in self.conn.execute("SELECT folder FROM cases")]
+                rows = self.conn.execute("SELECT folder, model_name, name, mtime FROM review_files").fetchall()
+            else:
+                folders = [row[0] for row in self.conn.execute(
+                    "SELECT folder FROM folder_changes WHERE generation > ?", (since,)
+                )]
+                rows = []
+                for folder in folders:
+                    rows += self.conn.execute(
+                        "SELECT folder, model_name, name, mtime FROM review_files WHERE folder = ?", (folder,)
+                    ).fetchall()
+        changes = {folder: [] for folder in folders}
+        for folder, model_name, name, mtime in rows:
+            changes.setdefault(folder, []).append((model_name, name, mtime))
+        return generation, changes
+    
+    def has_review_files(self, files):
+        """返回files[(folder, 文件名)]中已登记在索引中的集合"""
+        found = set()
+        with self.lock:
+            for folder, name in files:
+                if self.conn.execute(
+                    "SELECT 1 FROM review_files WHERE folder = ? AND name = ?", (folder, name)
+                ).fetchone():
+                    found.add((folder, name))
+        return found
+    
+    def iter_review_files(self, chunk_size):
+        """分批产出[(folder, case_name, model_name, 文件名)]
+        
+        使用单独的只读连接逐批读取，导出期间不占用索引锁。
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(
+                "SELECT r.folder, c.case_name, r.model_name, r.name"
+                " FROM review_files r JOIN cases c ON c.folder = r.folder"
+                " ORDER BY r.folder, r.name"
+            )
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
 
+@process_resource
+def get_case_index(dataset_root):
+    """获取（进程内共享的）数据集索引，首次打开时完成一次刷新"""
+    index = CaseIndex(dataset_root)
+    index.refresh()
+    return index
 
-def main():
-    st.markdown('<div class="main-header">报告评估系统</div>', unsafe_allow_html=True)
+class CasePrefetcher:
+    """在后台线程池中预取接下来的病例（解析JSON并生成显示尺寸图像）
     
-    # 初始化session state
-    if 'current_data' not in st.session_state:
-        st.session_state.current_data = None
-    if 'last_selected_case' not in st.session_state:
-        st.session_state.last_selected_case = None
-    if 'uploader_key_seed' not in st.session_state:
-        st.session_state.uploader_key_seed = 0
+    评分者给当前病例打分时预取后续病例，切换到下一病例时直接从内存取用。
+    预取数据占用的内存按读取文件的字节数估算，超出预算时丢弃最早的预取结果。
+    """
     
-    # 用户名输入
-    st.sidebar.header("👤 用户信息")
-    username = st.sidebar.text_input("用户名:", placeholder="请输入您的用户名", 
-                                   key="username_input")
+    def __init__(self, index, image_cache, workers, memory_budget):
+        self.index = index
+        self.image_cache = image_cache
+        self.memory_budget = memory_budget
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="case-prefetch")
+        self.lock = threading.Lock()
+        self.ready = OrderedDict()  # folder -> (data, 估算字节数)
+        self.pending = {}  # folder -> Future
+        self.hits = 0
+        self.misses = 0
     
-
-    # 侧边栏 - 上传文件夹（包含report、预测结果、图像）
-    st.sidebar.header("📁 上传数据文件夹")
+    def _load(self, folder):
+        folder_path = os.path.join(self.index.dataset_root, folder)
+        entry = self.index.get_case(folder)
+        data = load_folder_data(folder_path, entry)
+        if 'image' in data:
+            try:
+                self.image_cache.get_renditions(data['images'], THUMBNAIL_SIZE)
+                self.image_cache.get_rendition(data['image'], DISPLAY_IMAGE_SIZE)
+            except Exception:
+                pass
+        # 预先读取第一个模型（切换病例后默认选中）
+        names = ['report.json']
+        if data['models']:
+            first_model = next(iter(data['models']))
+            get_model_report(data, first_model)
+            names.append(entry['models'][first_model])
+        # 估算内存占用：已读取文件的大小
+        size = sum(os.path.getsize(os.path.join(folder_path, name))
+                   for name in names if os.path.exists(os.path.join(folder_path, name)))
+        return data, size
     
-    # 显示需要的文件类型
-    with st.sidebar.expander("📋 文件夹中需要的文件", expanded=False):
-        st.markdown("""
-        **必需文件:**
-        - `image_{n}.jpg` - 医学图像 (n为数字，系统会选择n最小的图像)
-        - `report.json` - 原始报告
+    def _on_done(self, folder, future):
+        with self.lock:
+            if self.pending.get(folder) is not future:
+                return
+            del self.pending[folder]
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.ready[folder] = future.result()
+            total = sum(size for _, size in self.ready.values())
+            while total > self.memory_budget and self.ready:
+                _, (_, size) = self.ready.popitem(last=False)
+                total -= size
+    
+    def get(self, folder, dir_mtime=None):
+        """取出病例数据：已预取则直接返回（命中），否则同步加载
         
-        **模型预测文件 (至少一个):**
-        - `{model_name}_predict.json` 文件
-        """)
-
-    if st.sidebar.button("清空上传数据"):
-        clear_uploaded_session()
+        给出dir_mtime时，预取之后索引中文件夹已有变化的结果不再使用。
+        """
+        with self.lock:
+            ready = self.ready.pop(folder, None)
+            future = self.pending.pop(folder, None)
+            if ready is not None and (dir_mtime is None or ready[0].get('dir_mtime') == dir_mtime):
+                self.hits += 1
+                return ready[0]
+            self.misses += 1
+        if future is not None:
+            try:
+                data = future.result()[0]
+                if dir_mtime is None or data.get('dir_mtime') == dir_mtime:
+                    return data
+            except Exception:
+                pass
+        return self._load(folder)[0]
+    
+    def schedule(self, folders):
+        """预取给定的病例，丢弃不再需要的预取结果"""
+        wanted = set(folders)
+        with self.lock:
+            for folder in list(self.ready):
+                if folder not in wanted:
+                    del self.ready[folder]
+            # 取消时Future会同步调用回调（回调要获取self.lock），只能在释放锁之后取消
+            stale = [self.pending.pop(folder) for folder in list(self.pending) if folder not in wanted]
+            submitted = []
+            for folder in folders:
+                if folder in self.ready or folder in self.pending:
+                    continue
+                future = self.executor.submit(self._load, folder)
+                self.pending[folder] = future
+                submitted.append((folder, future))
+        for future in stale:
+            future.cancel()
+        # 已完成的Future会在add_done_callback中同步回调，必须在释放锁之后注册
+        for folder, future in submitted:
+            future.add_done_callback(lambda f, folder=folder: self._on_done(folder, f))
+    
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'ready': len(self.ready),
+                'pending': len(self.pending),
+                'bytes': sum(size for _, size in self.ready.values()),
+            }
 
-    # 上传组件：请选择包含report.json、*_predict.json、image_*.jpg/png的所有文件
-    uploaded_files = st.sidebar.file_uploader(
-        "上传病例文件夹文件",
-        type=['jpg', 'jpeg', 'png', 'json'],
-        accept_multiple_files=True,
-        help="请选择该病例文件夹中的所有文件（图像、报告、预测结果）",
-        key=f"file_uploader_widget_{st.session_state.uploader_key_seed}",
+def is_case_file(filename):
+    """是否为病例文件夹中使用的文件（报告、预测、review、图像）"""
+    return (
+        filename == 'report.json'
+        or filename.endswith('_predict.json')
+        or ('_review' in filename and filename.endswith('.json'))
+        or (filename.startswith('image_') and filename.endswith(('.jpg', '.png')))
     )
 
-    # 处理上传
-    if uploaded_files:
-        try:
-            data = create_data_from_uploaded_files(uploaded_files)
-            st.session_state.current_data = data
-            st.sidebar.success("✅ 已加载上传的病例数据")
-        except Exception as e:
-            st.error(f"❌ 解析上传数据失败: {e}")
-            data = None
-    else:
-        data = st.session_state.current_data
-
-    if data:
-        # 侧边栏 - 模型选择
-        st.sidebar.header("🤖 模型选择")
-        if data.get('models'):
-            with st.sidebar.expander("选择模型", expanded=True):
-                model_options = []
-                for model_name in data['models'].keys():
-                    # status = "✅" if model_name in data.get('reviews', {}) else "❌"
-                    # model_options.append(f"{status} {model_name}")
-                    model_options.append(f"{model_name}")
-                selected_option = st.radio(
-                    "可用模型:",
-                    model_options,
-                    key="model_selection"
-                )
-                selected_model = selected_option.split(" ", 1)[1] if " " in selected_option else selected_option
-
-            # 主界面显示
-            display_main_interface(data, selected_model, username)
-        else:
-            st.error("未找到任何模型预测文件 (*_predict.json)")
-    else:
-        st.info("💡 请上传文件夹中的所有文件（图像、报告、预测结果）")
-
-def display_main_interface(data, selected_model, username):
-    """显示主界面"""
+def iter_archive_members(source):
+    """逐个产出压缩包中的文件：(成员路径, 可读文件对象, 完成比例)
     
-    # 使用从数据中提取的病例名称
-    case_name = data.get('case_name', 'unknown_case')
+    source为本地路径或已打开的文件对象。zip按中央目录逐项解压，tar以流模式读取，
+    都不会把整个压缩包读入内存。
+    """
+    import tarfile
+    import zipfile
     
-    # 检查处理状态
-    if selected_model in data.get('reviews', {}):
-        status_text = "✅ 已处理"
-        status_class = "status-processed"
-        is_processed = True
+    if zipfile.is_zipfile(source):
+        if not isinstance(source, str):
+            source.seek(0)
+        with zipfile.ZipFile(source) as zf:
+            infos = [info for info in zf.infolist() if not info.is_dir()]
+            for i, info in enumerate(infos):
+                with zf.open(info) as f:
+                    yield info.filename, f, (i + 1) / len(infos)
+        return
+    
+    if isinstance(source, str):
+        raw = open(source, 'rb')
+        total = os.path.getsize(source)
     else:
-        status_text = "❌ 未处理"
-        status_class = "status-unprocessed"
-        is_processed = False
+        raw = source
+        raw.seek(0, os.SEEK_END)
+        total = raw.tell()
+        raw.seek(0)
+    try:
+        with tarfile.open(fileobj=raw, mode='r|*') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                f = tar.extractfile(member)
+                yield member.name, f, raw.tell() / total if total else 0.0
+    finally:
+        if isinstance(source, str):
+            raw.close()
+
+def ingest_archive(source, dataset_root, index, progress=None, workers=None):
+    """把zip/tar压缩包中的病例文件夹流式导入数据集目录
     
-    # 在同一行显示病例名称和状态
-    st.markdown(f"**当前病例:** {case_name} <span class='status-badge {status_class}'>{status_text}</span>", unsafe_allow_html=True)
+    压缩包中每个文件按"病例文件夹/文件名"写入dataset_root（更深的目录层级被忽略），
+    JSON文件先校验再写入，图像在进程池中预先生成显示尺寸缓存，
+    每导入INGEST_INDEX_BATCH个病例增量刷新一次索引。返回导入统计。
+    """
+    from concurrent.futures import ProcessPoolExecutor
     
-    # 创建三列布局：图像、报告、打分系统
-    col1, col2, col3 = st.columns([1, 1, 1])
+    workers = workers or os.cpu_count() or 1
+    image_cache = get_image_cache()
+    stats = {'files': 0, 'bytes': 0, 'cases': 0, 'skipped': 0, 'thumbnails': 0, 'errors': [], 'changed': set()}
+    touched = set()
+    renditions = []
+    futures = set()
+    last_report = 0.0
     
-    with col1:
-        # 图像显示
-        if 'image' in data and os.path.exists(data['image']):
-            with st.expander("🖼️ 医学图像", expanded=True):
-                try:
-                    # 使用PIL打开图像以确保兼容性
-                    image = Image.open(data['image'])
-                    st.image(image, caption="胸部X光片", use_container_width=True)
-                except Exception as e:
-                    st.error(f"图像加载失败: {e}")
-                    # 显示调试信息
-                    st.write(f"图像路径: {data['image']}")
-                    st.write(f"文件存在: {os.path.exists(data['image'])}")
-        else:
-            st.warning("未找到图像文件")
-            if 'image' in data:
-                st.write(f"图像路径: {data['image']}")
+    def collect(done):
+        for future in done:
+            try:
+                renditions.append(future.result())
+                stats['thumbnails'] += 1
+            except Exception as e:
+                stats['errors'].append(f"生成缩略图失败: {e}")
     
-    with col2:
-        # 原始报告显示
-        if 'report' in data:
-            with st.expander("📋 原始报告", expanded=True):
-                findings = data['report'].get('findings', '')
-                impression = data['report'].get('impression', '')
-                
-                # Findings部分
-                st.markdown("**Findings:**")
-                st.text_area(
-                    "原始报告Findings",
-                    value=findings,
-                    height=140,
-                    disabled=False,
-                    label_visibility="collapsed"
-                )
-                
-                # Impression部分
-                st.markdown("**Impression:**")
-                st.text_area(
-                    "原始报告Impression",
-                    value=impression,
-                    height=140,
-                    disabled=False,
-                    label_visibility="collapsed"
-                )
-        # 预测报告显示
-        if selected_model in data.get('models', {}):
-            model_data = data['models'][selected_model]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for member_name, f, fraction in iter_archive_members(source):
+            parts = [part for part in member_name.replace('\\', '/').split('/') if part]
+            if len(parts) < 2 or parts[-2].startswith('.') or parts[-2] == '..' or not is_case_file(parts[-1]):
+                stats['skipped'] += 1
+                continue
+            case_folder, filename = parts[-2], parts[-1]
+            target_dir = os.path.join(dataset_root, case_folder)
+            target_path = os.path.join(target_dir, filename)
             
-            with st.expander("🤖 模型预测报告", expanded=True):
-                model_findings = model_data.get('findings', '')
-                model_impression = model_data.get('impression', '')
-                
-                # 模型Findings部分
-                st.markdown("**Findings:**")
-                st.text_area(
-                    "模型预测Findings",
-                    value=model_findings,
-                    height=140,
-                    disabled=False,
-                    label_visibility="collapsed"
-                )
-                
-                # 模型Impression部分
-                st.markdown("**Impression:**")
-                st.text_area(
-                    "模型预测Impression",
-                    value=model_impression,
-                    height=140,
-                    disabled=False,
-                    label_visibility="collapsed"
-                )
+            if filename.endswith('.json'):
+                content = f.read()
+                try:
+                    json.loads(content)
+                except ValueError as e:
+                    stats['errors'].append(f"{member_name}: JSON格式错误 ({e})")
+                    continue
+                # 校验通过后再创建病例文件夹，只含无效文件的文件夹不会成为空病例
+                os.makedirs(target_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".part")
+                with os.fdopen(fd, 'wb') as out:
+                    out.write(content)
+                size = len(content)
+            else:
+                os.makedirs(target_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".part")
+                with os.fdopen(fd, 'wb') as out:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+                size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, target_path)
+            stats['files'] += 1
+            stats['bytes'] += size
+            
+            if filename.startswith('image_'):
+                futures.add(pool.submit(score_workers.prepare_rendition, target_path,
+                                        image_cache.root, DISPLAY_IMAGE_SIZE))
+                # 限制进行中的缩略图任务数，内存占用不随压缩包大小增长
+                if len(futures) >= 4 * workers:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(done)
+            
+            if case_folder not in touched:
+                touched.add(case_folder)
+                stats['cases'] += 1
+                if stats['cases'] % INGEST_INDEX_BATCH == 0:
+                    index.refresh()
+                    stats['changed'].update(index.last_changed)
+                    image_cache.register(renditions)
+                    renditions = []
+            
+            if progress is not None and time.time() - last_report > 0.2:
+                progress(stats, fraction)
+                last_report = time.time()
+        
+        done, _ = wait(futures)
+        collect(done)
     
-    with col3:
-        # 用户名验证
-        if not username or not username.strip():
-            st.warning("⚠️ 请输入用户名后才能进行评分")
+    image_cache.register(renditions)
+    index.refresh()
+    stats['changed'].update(index.last_changed)
+    if progress is not None:
+        progress(stats, 1.0)
+    return stats
+
+def display_ingest_panel(index):
+    """侧边栏批量导入面板：导入本地或上传的病例压缩包"""
+    with st.sidebar.expander("📦 批量导入数据集", expanded=False):
+        archive_path = st.text_input(
+            "服务器上的压缩包路径:",
+            placeholder="/path/to/cases.tar.gz",
+            key="ingest_archive_path"
+        ).strip()
+        archive_file = st.file_uploader(
+            "或上传压缩包（大文件建议使用路径）",
+            type=['zip', 'tar', 'gz', 'tgz', 'bz2', 'xz'],
+            key="ingest_archive_upload"
+        )
+        if not st.button("开始导入", disabled=not (archive_path or archive_file)):
+            return
+        if archive_path and not os.path.isfile(archive_path):
+            st.error("压缩包不存在")
             return
         
-        # 打分系统
-        st.markdown('<div class="section-title">📊 打分系统</div>', unsafe_allow_html=True)
-        
-        # 显示用户名信息
-        st.info(f"👤 当前用户: {username}")
-        
-        # 获取之前的review数据（如果存在）
-        previous_review = data.get('reviews', {}).get(selected_model, {})
+        progress_bar = st.progress(0.0, text="正在导入...")
         
-        # PEER打分
-        st.markdown("**PEER打分 (0-5分):**")
+        def report(stats, fraction):
+            progress_bar.progress(
+                min(fraction, 1.0),
+                text=f"已导入 {stats['cases']} 个病例，{stats['files']} 个文件（{stats['bytes'] / 2**20:.0f} MB）"
+            )
         
-        peer_score = st.slider(
-            "评分",
-            min_value=0,
-            max_value=5,
-            value=previous_review.get('peer_score', 0),
-            step=1,
-            key=f"peer_score_{selected_model}",
-            label_visibility="collapsed"
+        import tarfile
+        import zipfile
+        try:
+            stats = ingest_archive(archive_path or archive_file, index.dataset_root, index, report)
+        except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+            st.error(f"❌ 导入失败: {e}")
+            return
+        get_task_scheduler().sync(index, sorted(stats['changed']))
+        st.success(
+            f"✅ 导入完成：{stats['cases']} 个病例，{stats['files']} 个文件，"
+            f"生成缩略图 {stats['thumbnails']} 张，跳过 {stats['skipped']} 个文件"
         )
-        
-        # 添加帮助信息
-        with st.expander("📖 PEER评分标准说明", expanded=True):
-            st.markdown("""
-            **PEER评分详细标准：**
-            
-            **5分 - 正确**
-            - 大部分诊断结果正确
-            - 大部分描述相同
-            - 存在一些错误描述，但不太可能具有临床意义
-            
-            **4分 - 基本正确**
-            - 75%的诊断结果正确
-            - 大部分描述相同
-            - 存在一些可能具有临床意义的错误描述
-            
-            **3分 - 部分正确**
-            - 50%的诊断结果正确
+        if stats['errors']:
+            st.warning(f"⚠️ {len(stats['errors'])} 个文件未导入")
+            st.text("\n".join(stats['errors'][:50]))
+
+class ReviewTableWriter:
+    """把导出行分批追加写入CSV和/或Parquet文件，内存中只保留当前一批"""
+    
+    def __init__(self, output_dir, formats):
+        os.makedirs(output_dir, exist_ok=True)
+        self.paths = {}
+        self.csv_file = None
+        self.parquet_writer = None
+        if 'csv' in formats:
+            import csv
+            self.paths['csv'] = os.path.join(output_dir, "reviews.csv")
+            self.csv_file = open(self.paths['csv'], 'w', encoding='utf-8-sig', newline='')
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(EXPORT_COLUMNS)
+        if 'parquet' in formats:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.pa = pa
+            self.schema = pa.schema([
+                ('case_name', pa.string()), ('model_name', pa.string()), ('username', pa.string()),
+                ('review_number', pa.int64()), ('peer_score', pa.int64()), ('timestamp', pa.string()),
+            ])
+            self.paths['parquet'] = os.path.join(output_dir, "reviews.parquet")
+            self.parquet_writer = pq.ParquetWriter(self.paths['parquet'], self.schema)
+    
+    def write(self, rows):
+        if not rows:
+            return
+        if self.csv_file is not None:
+            self.csv_writer.writerows(rows)
+        if self.parquet_writer is not None:
+            columns = list(zip(*rows))
+            self.parquet_writer.write_table(self.pa.Table.from_arrays(
+                [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+                schema=self.schema
+            ))
+    
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+def export_reviews(index, output_dir, formats, store=None, progress=None, workers=None):
+    """把数据集中的所有review和评分结果存储中的记录流式导出为表格（CSV/Parquet），返回导出统计
+    
+    导出前先刷新索引。review文件按索引分批交给进程池读取，进行中的批次数有上限，结果按顺序写出，
+    内存占用与review总数无关。随后导出存储中的记录（上传病例、保存到自定义目录、
+    以及REVIEW_WRITE_FILES关闭时的评分），其review文件已在索引中的不重复导出。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    if store is None:
+        store = get_review_store()
+    workers = workers or os.cpu_count() or 1
+    stats = {'rows': 0, 'errors': [], 'paths': {}}
+    index.refresh()
+    total = index.count_review_files()
+    read = 0
+    writer = ReviewTableWriter(output_dir, formats)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
             
-            **2分 - 部分错误**
-            - 25%的诊断结果正确
+            def drain(limit):
+                nonlocal read
+                while len(pending) > limit:
+                    size, future = pending.popleft()
+                    rows, errors = future.result()
+                    writer.write(rows)
+                    read += size
+                    stats['rows'] += len(rows)
+                    stats['errors'] += errors
+                    if progress is not None:
+                        progress(stats, read / total if total else 1.0)
             
-            **1分 - 存在重大错误**
-            - 诊断错误
-            - 可能只有一些阴性描述是相同的实现分类精度测试
+            for chunk in index.iter_review_files(EXPORT_CHUNK_SIZE):
+                pending.append((len(chunk), pool.submit(score_workers.read_review_rows, index.dataset_root, chunk)))
+                drain(2 * workers)
+            drain(0)
+        
+        for chunk in store.iter_export_rows(EXPORT_CHUNK_SIZE):
+            # 保存在数据集病例文件夹中的评分对应的review文件（按病例、模型、用户、编号）
+            files = [
+                (os.path.basename(target_path), review_file_name(row[1], row[2], row[3]))
+                if os.path.dirname(target_path) == index.dataset_root else None
+                for target_path, row in chunk
+            ]
+            exported = index.has_review_files(file for file in files if file is not None)
+            rows = [row for (_, row), file in zip(chunk, files) if file is None or file not in exported]
+            writer.write(rows)
+            stats['rows'] += len(rows)
+    finally:
+        writer.close()
+    stats['paths'] = writer.paths
+    return stats
+
+def search_snippet(findings, impression, terms, context=30):
+    """截取文本中第一个命中词附近的片段，命中词加粗"""
+    for text in (findings, impression):
+        lowered = text.lower()
+        hits = [(lowered.find(term.lower()), term) for term in terms if term.lower() in lowered]
+        if hits:
+            position, term = min(hits)
+            start, end = max(0, position - context), position + len(term) + context
+            return (("…" if start else "") + text[start:position] + "**" + text[position:position + len(term)]
+                    + "**" + text[position + len(term):end] + ("…" if end < len(text) else ""))
+    return findings[:2 * context]
+
+def open_search_result(folder, source):
+    """打开检索结果对应的病例（命中模型预测时同时切换到该模型）（按钮回调）"""
+    # 清空筛选条件，保证病例出现在选择框中
+    st.session_state.case_filter = ""
+    st.session_state.case_selection = folder
+    if source != 'report':
+        st.session_state.pending_model_selection = source
+
+def display_search_panel(index):
+    """侧边栏全文检索面板：按报告/模型预测的findings和impression查找病例"""
+    with st.sidebar.expander("🔍 全文检索", expanded=False):
+        text = st.text_input("关键词:", placeholder='如 pneumothorax 或 "pleural effusion"',
+                             key="search_text").strip()
+        source = st.selectbox("检索范围:", ["全部", "原始报告"] + index.model_names(), key="search_source")
+        status = st.radio("评分状态:", ["全部", "未评分", "已评分"], key="search_status", horizontal=True)
+        if not text:
+            return
+        start = time.perf_counter()
+        results = index.search(
+            text,
+            source={"全部": None, "原始报告": 'report'}.get(source, source),
+            reviewed={"全部": None, "未评分": False, "已评分": True}[status]
+        )
+        st.caption(f"找到 {len(results)} 条结果（{(time.perf_counter() - start) * 1000:.0f} ms）")
+        for i, (folder, case_name, result_source, snippet) in enumerate(results):
+            label = "原始报告" if result_source == 'report' else result_source
+            st.button(f"{case_name} · {label}", key=f"search_result_{i}",
+                      on_click=open_search_result, args=(folder, result_source))
+            st.caption(snippet)
+
+def compute_case_metrics(index, progress=None, workers=None):
+    """批量计算数据集中所有(病例, 模型)的自动指标，只计算内容有变化的，返回计算的数量
+    
+    与导出相同，进程池中进行中的批次数有上限，结果按批写回索引。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    workers = workers or os.cpu_count() or 1
+    total = max(index.metrics_progress()[1], 1)
+    computed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        
+        def drain(limit):
+            nonlocal computed
+            while len(pending) > limit:
+                results = pending.popleft().result()
+                index.store_metrics(results)
+                computed += len(results)
+                if progress is not None:
+                    progress(computed, computed / total)
+        
+        for chunk in index.iter_metric_jobs(METRICS_CHUNK_SIZE):
+            pending.append(pool.submit(score_workers.compute_metrics, chunk))
+            drain(2 * workers)
+        drain(0)
+    return computed
+
+def display_metrics_panel(index):
+    """侧边栏自动指标面板：批量计算模型预测与原始报告的相似度"""
+    with st.sidebar.expander("🧮 自动指标", expanded=False):
+        done, total = index.metrics_progress()
+        st.caption(f"已计算 {done}/{total} 个模型预测")
+        if not st.button("计算/更新自动指标"):
+            return
+        progress_bar = st.progress(0.0, text="正在计算...")
+        computed = compute_case_metrics(
+            index,
+            lambda count, fraction: progress_bar.progress(min(fraction, 1.0), text=f"已计算 {count} 个模型预测")
+        )
+        st.success(f"✅ 已更新 {computed} 个模型预测的指标" if computed else "✅ 指标均为最新")
+
+def display_export_panel(index):
+    """侧边栏导出面板：把数据集的全部评分结果导出为表格"""
+    with st.sidebar.expander("📊 导出评分结果", expanded=False):
+        output_dir = st.text_input(
+            "导出目录:",
+            value=os.path.join(index.dataset_root, "exports"),
+            key="export_output_dir"
+        ).strip()
+        formats = st.multiselect("格式", ["csv", "parquet"], default=["csv"], key="export_formats")
+        if not st.button("开始导出", disabled=not (output_dir and formats)):
+            return
+        if 'parquet' in formats:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                st.error("导出Parquet需要安装pyarrow")
+                return
+        
+        progress_bar = st.progress(0.0, text="正在导出...")
+        
+        def report(stats, fraction):
+            progress_bar.progress(min(fraction, 1.0), text=f"已导出 {stats['rows']} 条review")
+        
+        try:
+            stats = export_reviews(index, output_dir, formats, progress=report)
+        except OSError as e:
+            st.error(f"❌ 导出失败: {e}")
+            return
+        st.success(f"✅ 已导出 {stats['rows']} 条review")
+        for path in stats['paths'].values():
+            st.code(path)
+        if stats['errors']:
+            st.warning(f"⚠️ {len(stats['errors'])} 个review文件无法读取")
+            st.text("\n".join(stats['errors'][:50]))
+
+@process_resource
+def get_case_prefetcher(dataset_root):
+    """获取数据集对应的（进程内共享的）病例预取器"""
+    return CasePrefetcher(
+        get_case_index(dataset_root),
+        get_image_cache(),
+        PREFETCH_WORKERS,
+        int(PREFETCH_MEMORY_MB * 1024 * 1024)
+    )
+
+def get_next_review_number(folder_path, model_name, username):
+    """获取下一个review文件编号"""
+    pattern = os.path.join(folder_path, f"{model_name}_review_{username}_*.json")
+    existing_files = glob.glob(pattern)
+    
+    if not existing_files:
+        return 0
+    
+    # 提取现有的编号
+    numbers = []
+    for file_path in existing_files:
+        filename = os.path.basename(file_path)
+        # 提取编号部分
+        try:
+            # 格式: {model_name}_review_{username}_{N}.json
+            parts = filename.replace('.json', '').split('_')
+            if len(parts) >= 4 and parts[-1].isdigit():
+                numbers.append(int(parts[-1]))
+        except:
+            continue
+    
+    return max(numbers) + 1 if numbers else 0
+
+def review_file_name(model_name, username, review_number):
+    """review文件名: {model_name}_review_{username}_{N}.json"""
+    return f"{model_name}_review_{username}_{review_number}.json"
+
+def review_file_username(filename, model_name):
+    """从{model_name}_review_{username}_{N}.json中解析用户名，格式不符时返回None"""
+    parsed = score_workers.parse_review_file_name(filename, model_name)
+    return parsed[0] if parsed else None
+
+def write_json_atomic(file_path, data, fsync=False):
+    """先写临时文件再原子替换，读者不会看到写了一半的JSON"""
+    directory = os.path.dirname(file_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class ReviewStore:
+    """评分结果存储（SQLite）
+    
+    review编号在写事务中分配（BEGIN IMMEDIATE），多个标签页、多个评分者
+    或多个进程同时保存也不会拿到相同编号；保存时不再扫描已有的review文件。
+    原有的逐文件JSON布局作为导出格式保留（见export_files）。
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS reviews (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                target_path TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                username TEXT NOT NULL,
+                review_number INTEGER NOT NULL,
+                case_name TEXT,
+                peer_score INTEGER,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (target_path, model_name, username, review_number)
+            );
+            CREATE TABLE IF NOT EXISTS review_counters (
+                target_path TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                username TEXT NOT NULL,
+                next_number INTEGER NOT NULL,
+                PRIMARY KEY (target_path, model_name, username)
+            );
+        """)
+        # review_id：后台写入队列为每条review生成的唯一ID，保证日志重放幂等
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(reviews)")]
+        if 'review_id' not in columns:
+            conn.execute("ALTER TABLE reviews ADD COLUMN review_id TEXT")
+        # case_path：评分的病例文件夹（指定了保存目录时与target_path不同），任务进度和统计按病例计
+        if 'case_path' not in columns:
+            conn.execute("ALTER TABLE reviews ADD COLUMN case_path TEXT")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_review_id ON reviews(review_id)")
+        # 多评分者任务分配：每个(病例, 模型)的评分人数、已评分的用户、以及领取任务的租约
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                case_path TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                dataset_root TEXT NOT NULL,
+                review_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (case_path, model_name)
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks(dataset_root, review_count, case_path, model_name);
+            CREATE TABLE IF NOT EXISTS task_reviewers (
+                case_path TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                username TEXT NOT NULL,
+                PRIMARY KEY (case_path, model_name, username)
+            );
+            CREATE TABLE IF NOT EXISTS task_leases (
+                case_path TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                username TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (case_path, model_name, username)
+            );
+            CREATE INDEX IF NOT EXISTS idx_task_leases_user ON task_leases(username, expires_at);
+        """)
+        # 每个用户的评分进度（JSON：数据来源、当前病例、模型、未保存的打分），会话重连后恢复
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS grading_sessions (
+                username TEXT PRIMARY KEY,
+                progress TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    
+    def _conn(self):
+        """每个线程一个连接；autocommit模式，事务显式开启"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=FULL")
+            self.local.conn = conn
+        return conn
+    
+    def add(self, target_path, model_name, username, review_data):
+        """写入一条review，返回分配的review编号（review_data中补充username和review_number）"""
+        return self.add_many([(target_path, model_name, username, review_data, None, target_path)])[0]
+    
+    def add_many(self, entries):
+        """在同一个事务中写入多条review，entries为(保存目录, 模型, 用户, review_data, review_id, 病例文件夹)
+        
+        review_id不为空且已存在的条目不会重复写入（用于日志重放），返回每条的review编号。
+        任务进度按病例文件夹记录，并释放该用户对该任务的租约。
+        """
+        conn = self._conn()
+        numbers = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for target_path, model_name, username, review_data, review_id, case_path in entries:
+                target_path = os.path.abspath(target_path)
+                case_path = os.path.abspath(case_path)
+                if review_id is not None:
+                    row = conn.execute(
+                        "SELECT review_number FROM reviews WHERE review_id = ?", (review_id,)
+                    ).fetchone()
+                    if row is not None:
+                        review_data['username'] = username
+                        review_data['review_number'] = row[0]
+                        numbers.append(row[0])
+                        continue
+                
+                row = conn.execute(
+                    "SELECT next_number FROM review_counters WHERE target_path = ? AND model_name = ? AND username = ?",
+                    (target_path, model_name, username)
+                ).fetchone()
+                if row is None:
+                    # 首次为该(目录, 模型, 用户)分配编号时，接续目录中已有的review文件
+                    review_number = get_next_review_number(target_path, model_name, username)
+                else:
+                    review_number = row[0]
+                
+                review_data['username'] = username
+                review_data['review_number'] = review_number
+                conn.execute(
+                    "INSERT INTO reviews (target_path, model_name, username, review_number, case_name, "
+                    "peer_score, data, created_at, review_id, case_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (target_path, model_name, username, review_number, review_data.get('case_name'),
+                     review_data.get('peer_score'), json.dumps(review_data, ensure_ascii=False),
+                     time.time(), review_id, case_path)
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO review_counters VALUES (?, ?, ?, ?)",
+                    (target_path, model_name, username, review_number + 1)
+                )
+                record_task_review(conn, case_path, model_name, username)
+                numbers.append(review_number)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return numbers
+    
+    def _progress_conn(self):
+        """评分进度使用的连接（每个线程一个）：进度随每次操作更新，丢失最近一次无关紧要，提交时不等待fsync"""
+        conn = getattr(self.local, 'progress_conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.progress_conn = conn
+        return conn
+    
+    def save_progress(self, username, progress):
+        """保存用户的评分进度（每个用户一条，覆盖旧的）"""
+        self._progress_conn().execute(
+            "INSERT INTO grading_sessions (username, progress, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET progress = excluded.progress, updated_at = excluded.updated_at",
+            (username, json.dumps(progress, ensure_ascii=False), time.time())
+        )
+    
+    def load_progress(self, username):
+        """用户上次保存的评分进度，没有时返回None"""
+        row = self._progress_conn().execute(
+            "SELECT progress FROM grading_sessions WHERE username = ?", (username,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def clear_progress(self, username):
+        self._progress_conn().execute("DELETE FROM grading_sessions WHERE username = ?", (username,))
+    
+    def has_review_ids(self, review_ids):
+        """返回已写入存储的review_id集合"""
+        conn = self._conn()
+        found = set()
+        review_ids = list(review_ids)
+        for i in range(0, len(review_ids), 500):
+            chunk = review_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in conn.execute(
+                f"SELECT review_id FROM reviews WHERE review_id IN ({placeholders})", chunk
+            ))
+        return found
+    
+    def export_files(self, output_root=None):
+        """按原有布局导出为逐文件JSON，返回写出的文件数
+        
+        output_root为空时写回各review的保存目录，否则按保存目录名分子目录写到output_root下。
+        """
+        count = 0
+        rows = self._conn().execute(
+            "SELECT target_path, model_name, username, review_number, data FROM reviews ORDER BY id"
+        )
+        for target_path, model_name, username, review_number, data in rows:
+            directory = target_path if not output_root else os.path.join(output_root, os.path.basename(target_path))
+            os.makedirs(directory, exist_ok=True)
+            write_json_atomic(os.path.join(directory, review_file_name(model_name, username, review_number)),
+                              json.loads(data))
+            count += 1
+        return count
+
+    def rows_since(self, last_id):
+        """返回id大于last_id的评分：[(id, 病例文件夹, 模型, 用户, review编号, peer_score)]
+        
+        早期没有记录病例文件夹的评分以保存目录代替。
+        """
+        return self._conn().execute(
+            "SELECT id, COALESCE(case_path, target_path), model_name, username, review_number, peer_score"
+            " FROM reviews WHERE id > ? ORDER BY id", (last_id,)
+        ).fetchall()
+    
+    def iter_export_rows(self, chunk_size):
+        """分批产出[(保存目录, 导出行)]，导出行格式同score_workers.read_review_rows"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(
+                "SELECT case_name, model_name, username, review_number, peer_score, data, created_at, target_path"
+                " FROM reviews ORDER BY id"
+            )
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield [(row[7], row[:5] + (score_workers.review_timestamp(json.loads(row[5]).get('timestamp'),
+                                                                          row[6]),))
+                       for row in chunk]
+        finally:
+            conn.close()
+
+@process_resource
+def get_review_store():
+    """获取进程内共享的评分结果存储"""
+    return ReviewStore(REVIEW_DB_PATH)
+
+def record_task_review(conn, case_path, model_name, username):
+    """记录用户已评分该(病例, 模型)：计数加一（同一用户只计一次）并释放其租约"""
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO task_reviewers VALUES (?, ?, ?)", (case_path, model_name, username)
+    )
+    if cursor.rowcount:
+        conn.execute(
+            "UPDATE tasks SET review_count = review_count + 1 WHERE case_path = ? AND model_name = ?",
+            (case_path, model_name)
+        )
+    conn.execute(
+        "DELETE FROM task_leases WHERE case_path = ? AND model_name = ? AND username = ?",
+        (case_path, model_name, username)
+    )
+
+class TaskScheduler:
+    """多评分者任务分配：为每个用户分配下一个需要评分的(病例, 模型)
+    
+    任务表保存在评分结果存储中，评分人数随review写入同步更新，
+    查找下一个任务是一次按(评分人数, 病例)排序的索引查询，不扫描文件系统。
+    领取任务时获得限时租约，租约有效期内其他用户不会拿到同一任务的同一名额。
+    """
+    
+    def __init__(self, store, reviews_per_task, lease_seconds):
+        self.store = store
+        self.reviews_per_task = reviews_per_task
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.synced_roots = set()
+    
+    def sync(self, index, folders=None):
+        """把数据集索引中的(病例, 模型)同步为任务，已有的review文件计入评分人数"""
+        rows = index.case_reviewers(folders)
+        conn = self.store._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for folder, model_name, reviewers in rows:
+                case_path = os.path.join(index.dataset_root, folder)
+                conn.execute(
+                    "INSERT OR IGNORE INTO tasks (case_path, model_name, dataset_root) VALUES (?, ?, ?)",
+                    (case_path, model_name, index.dataset_root)
+                )
+                for username in reviewers:
+                    record_task_review(conn, case_path, model_name, username)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self.lock:
+            self.synced_roots.add(index.dataset_root)
+    
+    def ensure_synced(self, index):
+        """进程内首次使用某数据集时完整同步一次（之后由索引刷新时同步变化的病例）"""
+        with self.lock:
+            synced = index.dataset_root in self.synced_roots
+        if not synced:
+            self.sync(index)
+    
+    def current_lease(self, dataset_root, username):
+        """用户在该数据集上尚未过期的租约：(case_path, model_name, expires_at)，没有时返回None"""
+        return self.store._conn().execute(
+            "SELECT l.case_path, l.model_name, l.expires_at FROM task_leases l "
+            "JOIN tasks t ON t.case_path = l.case_path AND t.model_name = l.model_name "
+            "WHERE l.username = ? AND l.expires_at > ? AND t.dataset_root = ? "
+            "ORDER BY l.expires_at LIMIT 1",
+            (username, time.time(), dataset_root)
+        ).fetchone()
+    
+    def next_task(self, dataset_root, username):
+        """领取下一个任务并获得租约，返回(case_path, model_name)，没有待评分任务时返回None
+        
+        用户已有未过期的租约时续期并返回该任务。
+        """
+        now = time.time()
+        conn = self.store._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM task_leases WHERE expires_at <= ?", (now,))
+            lease = self.current_lease(dataset_root, username)
+            if lease is not None:
+                task = lease[:2]
+            else:
+                # 评分人数 + 其他用户持有的租约数 未达到目标，且该用户尚未评过
+                task = conn.execute(
+                    "SELECT t.case_path, t.model_name FROM tasks t "
+                    "WHERE t.dataset_root = ? AND t.review_count < ? "
+                    "AND NOT EXISTS (SELECT 1 FROM task_reviewers r WHERE r.case_path = t.case_path "
+                    "AND r.model_name = t.model_name AND r.username = ?) "
+                    "AND t.review_count + (SELECT COUNT(*) FROM task_leases l WHERE l.case_path = t.case_path "
+                    "AND l.model_name = t.model_name) < ? "
+                    "ORDER BY t.review_count, t.case_path, t.model_name LIMIT 1",
+                    (dataset_root, self.reviews_per_task, username, self.reviews_per_task)
+                ).fetchone()
+            if task is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO task_leases VALUES (?, ?, ?, ?)",
+                    (task[0], task[1], username, now + self.lease_seconds)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return tuple(task) if task is not None else None
+    
+    def progress(self, dataset_root):
+        """数据集的任务进度：(已达到目标评分人数的任务数, 任务总数)"""
+        return self.store._conn().execute(
+            "SELECT SUM(review_count >= ?), COUNT(*) FROM tasks WHERE dataset_root = ?",
+            (self.reviews_per_task, dataset_root)
+        ).fetchone()
+
+@process_resource
+def get_task_scheduler():
+    """获取进程内共享的任务分配器"""
+    return TaskScheduler(get_review_store(), REVIEWS_PER_TASK, TASK_LEASE_SECONDS)
+
+def review_target_path(folder_path, save_path=None):
+    """review的保存目录：指定了保存路径时使用保存路径，否则使用病例文件夹"""
+    if save_path and save_path.strip():
+        return save_path.strip()
+    return folder_path
+
+def save_reviews(items, store=None, write_files=True, fsync=False):
+    """批量保存review：在一个事务中分配编号写入存储，再写出对应的review文件
+    
+    items中每项包含folder_path、model_name、username、review_data，
+    可选save_path和review_id。返回写出的文件路径列表（不写文件时为None）。
+    """
+    entries, numbers = add_reviews(items, store)
+    
+    review_files = []
+    directories = set()
+    for entry, review_number in zip(entries, numbers):
+        if not write_files:
+            review_files.append(None)
+            continue
+        review_files.append(write_review_file(entry, review_number, fsync=fsync))
+        directories.add(entry[0])
+    
+    if fsync:
+        for directory in directories:
+            fsync_directory(directory)
+    return review_files
+
+def add_reviews(items, store=None):
+    """在一个事务中为items分配编号并写入存储，返回(存储条目列表, 编号列表)"""
+    if store is None:
+        store = get_review_store()
+    entries = []
+    for item in items:
+        if not item['username'].strip():
+            raise ValueError("用户名不能为空")
+        target_path = review_target_path(item['folder_path'], item.get('save_path'))
+        entries.append((target_path, item['model_name'], item['username'],
+                        item['review_data'], item.get('review_id'), item['folder_path']))
+    
+    # 分配编号并写入存储（会在review_data中添加username和review_number）
+    return entries, store.add_many(entries)
+
+def write_review_file(entry, review_number, fsync=False):
+    """写出add_reviews返回的一个条目对应的review文件，返回文件路径"""
+    target_path, model_name, username, review_data = entry[:4]
+    # 确保保存路径存在
+    os.makedirs(target_path, exist_ok=True)
+    review_file = os.path.join(target_path, review_file_name(model_name, username, review_number))
+    write_json_atomic(review_file, review_data, fsync=fsync)
+    return review_file
+
+def fsync_directory(directory):
+    """fsync目录本身，使文件的创建/重命名持久化"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def save_review(folder_path, model_name, username, review_data, save_path=None, store=None):
+    """保存review（编号由评分结果存储在事务中分配，同时写出对应的review文件）"""
+    if not username.strip():
+        raise ValueError("用户名不能为空")
+    item = {
+        'folder_path': folder_path,
+        'model_name': model_name,
+        'username': username,
+        'review_data': review_data,
+        'save_path': save_path,
+    }
+    return save_reviews([item], store=store)[0]
+
+class ReviewWriter:
+    """评分结果的后台批量写入（write-behind）
+    
+    点击保存时只把review追加到内存队列和日志文件（flush到操作系统），立即返回；
+    后台线程攒满一批或超过刷新间隔后，在一个事务中写入存储，再逐条写出review文件
+    并fsync，然后从日志中移除已写入的条目。进程崩溃后重启时重放日志，
+    按review_id去重，不会重复写入。
+    
+    单条review写入失败时只重试该条，其余条目照常写入；连续失败max_attempts次的
+    条目移到失败日志（journal_path + ".failed"），需要人工处理。
+    """
+    
+    def __init__(self, store, journal_path, batch_size, flush_interval, write_files, max_attempts=3):
+        self.store = store
+        self.journal_path = journal_path
+        self.failed_path = journal_path + ".failed"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_files = write_files
+        self.max_attempts = max_attempts
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.queue = []
+        self.closed = False
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        # 各用户最近一次写入失败的原因，该用户的review写入成功后清除
+        self.errors = {}
+        
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        self.queue = self._read_journal()
+        self.journal = open(journal_path, 'a', encoding='utf-8')
+        if self.queue:
+            self.flush()
+        
+        self.thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+    
+    def _read_journal(self):
+        """读取日志中尚未写入存储的条目"""
+        if not os.path.exists(self.journal_path):
+            return []
+        items = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时可能留下写了一半的最后一行
+                    continue
+        if self.write_files:
+            # 已写入存储的条目也可能还没有写出review文件，全部重放（编号按review_id复用）
+            return items
+        done = self.store.has_review_ids(item['review_id'] for item in items)
+        return [item for item in items if item['review_id'] not in done]
+    
+    def submit(self, folder_path, model_name, username, review_data, save_path=None):
+        """加入写入队列并立即返回review_id；保存目录不可用时直接报错，不进入队列"""
+        if not username.strip():
+            raise ValueError("用户名不能为空")
+        if self.write_files and save_path and save_path.strip():
+            try:
+                os.makedirs(save_path.strip(), exist_ok=True)
+            except OSError as e:
+                raise ValueError(f"保存目录不可用: {e}")
+            if not os.access(save_path.strip(), os.W_OK):
+                raise ValueError(f"保存目录不可写: {save_path.strip()}")
+        item = {
+            'review_id': uuid.uuid4().hex,
+            'folder_path': folder_path,
+            'model_name': model_name,
+            'username': username,
+            'review_data': review_data,
+            'save_path': save_path,
+        }
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("写入队列已关闭")
+            self.journal.write(json.dumps(item, ensure_ascii=False) + "\n")
+            self.journal.flush()
+            self.queue.append(item)
+            if len(self.queue) >= self.batch_size:
+                self.cond.notify()
+        return item['review_id']
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.closed or len(self.queue) >= self.batch_size,
+                                   timeout=self.flush_interval)
+                closed = self.closed
+            self.flush()
+            if closed:
+                return
+    
+    def flush(self):
+        """把队列中的review批量写入存储，返回写入的条数"""
+        with self.flush_lock:
+            with self.cond:
+                batch, self.queue = self.queue, []
+            if not batch:
+                return 0
+            try:
+                results = self._save(batch)
+            except Exception as e:
+                # 存储本身不可用：整批放回队列，下次刷新重试；日志中的条目保持不变
+                with self.cond:
+                    self.queue = batch + self.queue
+                    for item in batch:
+                        self.errors[item['username']] = str(e)
+                return 0
             
-            **0分 - 不可接受**
-            - 所描述的信息完全没有重叠
-            """)
+            done, retry, dead = [], [], []
+            for item, error in results:
+                if error is None:
+                    done.append(item)
+                    continue
+                item['attempts'] = item.get('attempts', 0) + 1
+                item['error'] = error
+                (dead if item['attempts'] >= self.max_attempts else retry).append(item)
+            with self.cond:
+                if dead:
+                    self._append_failed(dead)
+                self.queue = retry + self.queue
+                self._rewrite_journal(self.queue)
+                self.flushed += len(done)
+                self.failed += len(dead)
+                self.batches += 1
+                for item in done:
+                    self.errors.pop(item['username'], None)
+                for item in retry + dead:
+                    self.errors[item['username']] = item['error']
+            return len(done)
+    
+    def _save(self, batch):
+        """写入一批review，返回[(条目, 错误信息或None)]
+        
+        整批在一个事务中写入存储；事务失败时逐条写入，找出出错的条目。
+        review文件逐条写出，一个文件写入失败不影响其它条目。
+        """
+        try:
+            saved = list(zip(*add_reviews(batch, store=self.store)))
+            errors = [None] * len(batch)
+        except sqlite3.OperationalError:
+            # 数据库锁定、磁盘已满等与条目无关的错误：整批重试
+            raise
+        except Exception:
+            saved, errors = [], []
+            for item in batch:
+                try:
+                    entries, numbers = add_reviews([item], store=self.store)
+                    saved.append((entries[0], numbers[0]))
+                    errors.append(None)
+                except sqlite3.OperationalError:
+                    raise
+                except Exception as e:
+                    saved.append(None)
+                    errors.append(str(e))
+        
+        directories = set()
+        if self.write_files:
+            for position, result in enumerate(saved):
+                if result is None:
+                    continue
+                try:
+                    write_review_file(*result, fsync=True)
+                    directories.add(result[0][0])
+                except OSError as e:
+                    errors[position] = str(e)
+        for directory in directories:
+            fsync_directory(directory)
+        return list(zip(batch, errors))
+    
+    def _append_failed(self, items):
+        """把多次写入失败的条目追加到失败日志"""
+        with open(self.failed_path, 'a', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _rewrite_journal(self, remaining):
+        """日志只保留尚未写入的条目（先写临时文件并fsync，再原子替换）"""
+        self.journal.close()
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for item in remaining:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        fsync_directory(directory)
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+    
+    def close(self):
+        """停止后台线程并写入剩余的review"""
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        self.thread.join(timeout=30)
+        self.flush()
+    
+    def stats(self, username=None):
+        """写入统计；last_error为该用户最近一次写入失败的原因"""
+        with self.cond:
+            return {
+                'pending': len(self.queue),
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'failed': self.failed,
+                'last_error': self.errors.get(username),
+            }
+
+@process_resource
+def get_review_writer():
+    """获取进程内共享的后台review写入队列"""
+    return ReviewWriter(
+        get_review_store(),
+        REVIEW_JOURNAL_PATH,
+        REVIEW_BATCH_SIZE,
+        REVIEW_FLUSH_INTERVAL,
+        REVIEW_WRITE_FILES,
+        REVIEW_MAX_ATTEMPTS
+    )
+
+def fleiss_kappa(counts):
+    """Fleiss' kappa，counts[i, j]为对象i获得评分j的评分者数；评分者数可以不同，少于2人的对象不参与"""
+    n = counts.sum(axis=1)
+    counts, n = counts[n >= 2], n[n >= 2]
+    if len(n) == 0:
+        return float('nan')
+    p_i = ((counts ** 2).sum(axis=1) - n) / (n * (n - 1))
+    p_j = counts.sum(axis=0) / n.sum()
+    p_e = (p_j ** 2).sum()
+    return float((p_i.mean() - p_e) / (1 - p_e)) if p_e < 1 else float('nan')
+
+def cohen_kappa(x, y, levels):
+    """两个评分者对同一批对象评分的Cohen's kappa"""
+    import numpy as np
+    
+    confusion = np.bincount(x * levels + y, minlength=levels * levels).reshape(levels, levels)
+    n = confusion.sum()
+    p_o = np.trace(confusion) / n
+    p_e = confusion.sum(axis=1) @ confusion.sum(axis=0) / n ** 2
+    return float((p_o - p_e) / (1 - p_e)) if p_e < 1 else float('nan')
+
+class ReviewAnalytics:
+    """评分结果的紧凑内存表（NumPy数组），按reviews表的id增量追加新评分
+    
+    评分对象为(病例文件夹, 模型)，每个(评分对象, 评分者)只保留编号最大的一次评分。
+    已登记的数据集中原有的review文件（不经过评分存储写入的）也计入：按索引记录的文件夹代数
+    只读取此后重新扫描过的文件夹，其中新增或mtime变化的文件重新读取，已删除的文件撤回其评分；
+    存储写出的review文件与存储中的记录编号相同，不会重复计数。
+    统计量均在需要时对整张表做向量化计算。
+    """
+    
+    def __init__(self, store, levels=SCORE_LEVELS):
+        import numpy as np
+        
+        self.store = store
+        self.levels = levels
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.size = 0
+        self.models, self.users, self.items = {}, {}, {}  # 名称 -> 编号
+        self.item_model = []  # 评分对象编号 -> 模型编号
+        self.positions = {}  # (评分对象, 评分者) -> 行号
+        self.ratings = {}  # (评分对象, 评分者) -> {(review编号, 来源): 分数}
+        self.indexes = {}  # dataset_root -> CaseIndex，其中的review文件计入统计
+        self.generations = {}  # dataset_root -> 已读入的索引代数
+        self.files = {}  # 病例文件夹 -> {文件名: (模型, 评分者, 编号, mtime)}，已读入的review文件
+        self.columns = {name: np.zeros(1024, dtype=np.int64)
+                        for name in ('item', 'model', 'user', 'number', 'score')}
+    
+    def _append(self, item, model, user):
+        if self.size == len(self.columns['item']):
+            import numpy as np
+            for name, column in self.columns.items():
+                self.columns[name] = np.concatenate([column, np.zeros_like(column)])
+        self.columns['item'][self.size] = item
+        self.columns['model'][self.size] = model
+        self.columns['user'][self.size] = user
+        self.positions[(item, user)] = self.size
+        self.size += 1
+        return self.size - 1
+    
+    def _delete(self, key):
+        """删除一行：表的最后一行移到该行的位置"""
+        position = self.positions.pop(key)
+        last = self.size - 1
+        if position != last:
+            for column in self.columns.values():
+                column[position] = column[last]
+            self.positions[(int(self.columns['item'][position]), int(self.columns['user'][position]))] = position
+        self.size -= 1
+    
+    def _key(self, case_path, model_name, username):
+        model = self.models.setdefault(model_name, len(self.models))
+        user = self.users.setdefault(username, len(self.users))
+        item = self.items.get((case_path, model_name))
+        if item is None:
+            item = self.items[(case_path, model_name)] = len(self.items)
+            self.item_model.append(model)
+        return item, user
+    
+    def _record(self, case_path, model_name, username, number, score, source):
+        if not isinstance(score, int) or not 0 <= score < self.levels:
+            return
+        key = self._key(case_path, model_name, username)
+        self.ratings.setdefault(key, {})[(number, source)] = score
+        self._update_row(key)
+    
+    def _retract(self, case_path, model_name, username, number, source):
+        key = self._key(case_path, model_name, username)
+        ratings = self.ratings.get(key)
+        if ratings is not None and ratings.pop((number, source), None) is not None:
+            self._update_row(key)
+    
+    def _update_row(self, key):
+        """按该(评分对象, 评分者)编号最大的评分更新表中的行，没有评分时删除该行"""
+        ratings = self.ratings.get(key)
+        if not ratings:
+            self.ratings.pop(key, None)
+            if key in self.positions:
+                self._delete(key)
+            return
+        latest = max(ratings)
+        position = self.positions.get(key)
+        if position is None:
+            position = self._append(key[0], self.item_model[key[0]], key[1])
+        self.columns['number'][position] = latest[0]
+        self.columns['score'][position] = ratings[latest]
+    
+    def watch(self, index):
+        """登记数据集索引：其中已有的review文件在update时计入统计"""
+        with self.lock:
+            self.indexes[index.dataset_root] = index
+    
+    def _read_review_files(self, index):
+        """按索引的变化读入新增/修改的review文件并撤回已删除文件的评分，返回读入的文件数"""
+        generation, changes = index.review_file_changes(self.generations.get(index.dataset_root))
+        added = 0
+        for folder, rows in changes.items():
+            case_path = os.path.join(index.dataset_root, folder)
+            known = self.files.pop(case_path, {})
+            current = {}
+            for model_name, name, mtime in rows:
+                previous = known.pop(name, None)
+                if previous is not None and previous[3] == mtime:
+                    current[name] = previous
+                    continue
+                if previous is not None:
+                    self._retract(case_path, *previous[:3], 'file')
+                parsed = score_workers.parse_review_file_name(name, model_name)
+                if parsed is None:
+                    continue
+                try:
+                    with open(os.path.join(case_path, name), 'r', encoding='utf-8') as f:
+                        review = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if isinstance(review, dict):
+                    self._record(case_path, model_name, parsed[0], parsed[1], review.get('peer_score'), 'file')
+                    current[name] = (model_name, parsed[0], parsed[1], mtime)
+                    added += 1
+            for previous in known.values():
+                self._retract(case_path, *previous[:3], 'file')
+            if current:
+                self.files[case_path] = current
+        self.generations[index.dataset_root] = generation
+        return added
+    
+    def update(self):
+        """读入上次更新之后新增的评分和变化的review文件，返回新增的条数"""
+        with self.lock:
+            rows = self.store.rows_since(self.last_id)
+            for review_id, case_path, model_name, username, number, score in rows:
+                self.last_id = review_id
+                self._record(case_path, model_name, username, number, score, 'db')
+            added = len(rows)
+            for index in list(self.indexes.values()):
+                added += self._read_review_files(index)
+            return added
+    
+    def _snapshot(self):
+        import numpy as np
+        
+        with self.lock:
+            return ({name: column[:self.size].copy() for name, column in self.columns.items()},
+                    list(self.models), list(self.users), np.array(self.item_model, dtype=np.int64))
+    
+    def _item_counts(self, table, n_items):
+        """counts[i, j]：对象i获得评分j的评分者数"""
+        import numpy as np
+        
+        return np.bincount(
+            table['item'] * self.levels + table['score'], minlength=n_items * self.levels
+        ).reshape(n_items, self.levels)
+    
+    def model_summary(self):
+        """每个模型的评分分布、均值及95%置信区间和Fleiss' kappa"""
+        import numpy as np
         
-        # 准备保存的数据
-        review_data = {
-            "model_name": selected_model,
-            "peer_score": peer_score,
-            "timestamp": str(Path().cwd()),
-            "case_name": data.get('case_name', 'unknown_case')
+        table, models, users, item_model = self._snapshot()
+        levels = self.levels
+        scores = np.arange(levels)
+        distribution = np.bincount(
+            table['model'] * levels + table['score'], minlength=len(models) * levels
+        ).reshape(len(models), levels)
+        n = distribution.sum(axis=1)
+        mean = distribution @ scores / np.maximum(n, 1)
+        variance = (distribution @ scores ** 2 - n * mean ** 2) / np.maximum(n - 1, 1)
+        half_width = 1.96 * np.sqrt(np.maximum(variance, 0) / np.maximum(n, 1))
+        item_counts = self._item_counts(table, len(item_model))
+        return [
+            {
+                'model_name': model_name,
+                'n': int(n[m]),
+                'distribution': distribution[m].tolist(),
+                'mean': float(mean[m]),
+                'ci': (float(mean[m] - half_width[m]), float(mean[m] + half_width[m])),
+                'fleiss_kappa': fleiss_kappa(item_counts[item_model == m]),
+            }
+            for m, model_name in enumerate(models)
+        ]
+    
+    def rater_agreement(self, model_name=None):
+        """评分者两两之间的Cohen's kappa（可只统计某个模型），返回[(评分者A, 评分者B, 共同对象数, kappa)]"""
+        import numpy as np
+        
+        table, models, users, item_model = self._snapshot()
+        if model_name is not None:
+            if model_name not in models:
+                return []
+            mask = table['model'] == models.index(model_name)
+            table = {name: column[mask] for name, column in table.items()}
+        ratings = np.full((len(item_model), len(users)), -1, dtype=np.int64)
+        ratings[table['item'], table['user']] = table['score']
+        rated = ratings >= 0
+        results = []
+        for a in range(len(users)):
+            for b in range(a + 1, len(users)):
+                both = rated[:, a] & rated[:, b]
+                n_both = int(both.sum())
+                if n_both < 2:
+                    continue
+                results.append((users[a], users[b], n_both,
+                                cohen_kappa(ratings[both, a], ratings[both, b], self.levels)))
+        return results
+    
+    def overall(self):
+        """总评分数、评分者数、评分对象数和所有模型合并的Fleiss' kappa"""
+        table, models, users, item_model = self._snapshot()
+        return {
+            'reviews': len(table['item']),
+            'users': len(users),
+            'items': len(item_model),
+            'fleiss_kappa': fleiss_kappa(self._item_counts(table, len(item_model))),
         }
+
+@process_resource
+def get_review_analytics():
+    """获取进程内共享的评分统计表（配置了默认数据集时计入其中已有的review文件）"""
+    analytics = ReviewAnalytics(get_review_store())
+    if DEFAULT_DATASET_ROOT and os.path.isdir(DEFAULT_DATASET_ROOT):
+        analytics.watch(get_case_index(DEFAULT_DATASET_ROOT))
+    return analytics
+
+def uploaded_file_digest(file):
+    """计算上传文件内容的SHA-256（按file_id缓存在session中，rerun时不重复计算）"""
+    digests = st.session_state.setdefault('upload_digests', {})
+    file_id = getattr(file, 'file_id', None) or f"{file.name}:{file.size}"
+    if file_id not in digests:
+        digests[file_id] = hashlib.sha256(file.getvalue()).hexdigest()
+    return digests[file_id]
+
+def upload_content_key(uploaded_files):
+    """由所有上传文件的(文件名, 内容哈希)生成本次上传的缓存键"""
+    entries = sorted((file.name, uploaded_file_digest(file)) for file in uploaded_files)
+    # 只保留当前上传文件的哈希，避免session中无限累积
+    current_ids = {getattr(file, 'file_id', None) or f"{file.name}:{file.size}" for file in uploaded_files}
+    digests = st.session_state['upload_digests']
+    for file_id in list(digests):
+        if file_id not in current_ids:
+            del digests[file_id]
+    return hashlib.sha256(json.dumps(entries).encode('utf-8')).hexdigest()
+
+def current_session_id():
+    """当前浏览器会话的ID（脚本不在Streamlit中运行时返回"local"）"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+def is_session_active(session_id):
+    """会话是否仍然连接；无法判断时返回None"""
+    try:
+        from streamlit import runtime
+        if runtime.exists():
+            return runtime.get_instance().is_active_session(session_id)
+    except Exception:
+        pass
+    return None
+
+class UploadStore:
+    """有磁盘配额、按内容寻址的上传病例存储
+    
+    文件内容按SHA-256在blobs目录中只存一份，多个评分者上传相同的图像或JSON文件时不重复写入；
+    每个上传病例（按内容键）占用一个目录，其中的文件是指向内容文件的硬链接，保留原文件名。
+    内容文件的引用计数为链接它的病例目录数，病例目录删除后计数归零的内容文件随即删除。
+    病例目录记录引用它的会话，超出配额时按LRU顺序淘汰没有会话引用的病例目录；会话断开、
+    空闲超时或清空上传数据时释放其引用。相同内容的JSON解析结果也按内容哈希缓存，只解析一次。
+    """
+    
+    BLOB_DIR = "blobs"
+    
+    def __init__(self, root, quota_bytes, parsed_cache_size=UPLOAD_PARSED_CACHE_SIZE):
+        self.root = root
+        self.blob_root = os.path.join(root, self.BLOB_DIR)
+        self.quota_bytes = quota_bytes
+        self.parsed_cache_size = parsed_cache_size
+        self.lock = threading.Lock()
+        # key -> {'files': {文件名: 内容哈希}, 'bytes': 文件总字节数, 'own_bytes': 未链接到内容文件的字节数,
+        #         'refs': 会话集合}，按最近使用排序
+        self.entries = OrderedDict()
+        self.blobs = {}  # 内容哈希 -> {'bytes': int, 'refs': 链接它的病例目录数}
+        self.disk_bytes = 0  # 内容文件与未链接文件的总字节数（配额按此计算）
+        self.parsed = OrderedDict()  # (内容哈希, 类型) -> 解析结果
+        self.session_keys = {}  # session_id -> key
+        self.session_seen = {}  # session_id -> 最近访问时间
+        self.last_reap = time.time()
+        self.evictions = 0
+        self.evicted_bytes = 0
+        os.makedirs(self.blob_root, exist_ok=True)
+        self._adopt_existing()
+    
+    def _adopt_existing(self):
+        """接管上次运行遗留的内容文件和病例目录（无会话引用，可被淘汰）
+        
+        病例目录中与内容文件是同一文件（硬链接）的计入该内容文件的引用，其余文件（旧版本的布局）
+        按病例自身占用计算。
+        """
+        inodes = {}
+        for directory, _, names in os.walk(self.blob_root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith('.part'):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                inodes[(stat.st_dev, stat.st_ino)] = name
+                self.blobs[name] = {'bytes': stat.st_size, 'refs': 0}
+                self.disk_bytes += stat.st_size
+        existing = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name != self.BLOB_DIR:
+                    existing.append((entry.stat().st_mtime, entry.name))
+        for _, key in sorted(existing):
+            case = self._entry(key)
+            for directory, _, names in os.walk(self.case_dir(key)):
+                for name in names:
+                    stat = os.stat(os.path.join(directory, name))
+                    digest = inodes.get((stat.st_dev, stat.st_ino))
+                    case['files'][name] = digest
+                    case['bytes'] += stat.st_size
+                    if digest is not None:
+                        self.blobs[digest]['refs'] += 1
+                    else:
+                        case['own_bytes'] += stat.st_size
+                        self.disk_bytes += stat.st_size
+        with self.lock:
+            for digest in [digest for digest, blob in self.blobs.items() if not blob['refs']]:
+                self._remove_blob(digest)
+            self._enforce_quota()
+    
+    def case_dir(self, key):
+        return os.path.join(self.root, key)
+    
+    def blob_path(self, digest):
+        return os.path.join(self.blob_root, digest[:2], digest)
+    
+    def _entry(self, key):
+        return self.entries.setdefault(key, {'files': {}, 'bytes': 0, 'own_bytes': 0, 'refs': set()})
+    
+    def write(self, key, filename, content, digest=None):
+        """将上传文件放入病例目录（内容已存在时只建立链接），已存在时直接复用，返回文件路径"""
+        digest = digest or hashlib.sha256(content).hexdigest()
+        file_path = os.path.join(self.case_dir(key), filename)
+        with self.lock:
+            entry = self._entry(key)
+            self.entries.move_to_end(key)
+            if entry['files'].get(filename) == digest and os.path.exists(file_path):
+                return file_path
+            self._remove_file(key, filename)
+            blob_path = self._store_blob(digest, content)
+            os.makedirs(self.case_dir(key), exist_ok=True)
+            try:
+                os.link(blob_path, file_path)
+                entry['files'][filename] = digest
+                self.blobs[digest]['refs'] += 1
+            except OSError:
+                # 文件系统不支持硬链接时复制一份，按病例自身占用计算
+                shutil.copyfile(blob_path, file_path)
+                entry['files'][filename] = None
+                entry['own_bytes'] += len(content)
+                self.disk_bytes += len(content)
+                if not self.blobs[digest]['refs']:
+                    self._remove_blob(digest)
+            entry['bytes'] += len(content)
+            self._enforce_quota()
+        return file_path
+    
+    def _store_blob(self, digest, content):
+        """内容文件不存在时写入（先写临时文件再原子替换），返回路径"""
+        blob_path = self.blob_path(digest)
+        if digest in self.blobs and os.path.exists(blob_path):
+            return blob_path
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix=".part")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, blob_path)
+        if digest not in self.blobs:
+            self.blobs[digest] = {'bytes': len(content), 'refs': 0}
+            self.disk_bytes += len(content)
+        return blob_path
+    
+    def _remove_file(self, key, filename):
+        """从病例目录中移除文件（同名文件被不同内容覆盖时）"""
+        entry = self.entries[key]
+        if filename not in entry['files']:
+            return
+        digest = entry['files'].pop(filename)
+        file_path = os.path.join(self.case_dir(key), filename)
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        with contextlib.suppress(OSError):
+            os.remove(file_path)
+        entry['bytes'] -= size
+        if digest is None:
+            entry['own_bytes'] -= size
+            self.disk_bytes -= size
+        else:
+            self._unref_blob(digest)
+    
+    def _unref_blob(self, digest):
+        blob = self.blobs.get(digest)
+        if blob is None:
+            return
+        blob['refs'] -= 1
+        if blob['refs'] <= 0:
+            self._remove_blob(digest)
+    
+    def _remove_blob(self, digest):
+        blob = self.blobs.pop(digest)
+        with contextlib.suppress(OSError):
+            os.remove(self.blob_path(digest))
+            os.rmdir(os.path.dirname(self.blob_path(digest)))
+        self.disk_bytes -= blob['bytes']
+        for kind_key in [kind_key for kind_key in self.parsed if kind_key[0] == digest]:
+            del self.parsed[kind_key]
+    
+    def case_files(self, key):
+        """病例目录中的文件（文件名 -> 内容哈希，未链接到内容文件的为None）
+        
+        病例不在存储中或文件已不完整时返回None。
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or not entry['files']:
+                return None
+            if not all(os.path.exists(os.path.join(self.case_dir(key), name)) for name in entry['files']):
+                return None
+            self.entries.move_to_end(key)
+            return dict(entry['files'])
+    
+    def parsed_content(self, digest, kind, parse):
+        """按(内容哈希, 类型)缓存的解析结果，首次请求时调用parse()
+        
+        解析结果在会话间共享，调用方只能读取。
+        """
+        key = (digest, kind)
+        with self.lock:
+            if key in self.parsed:
+                self.parsed.move_to_end(key)
+                return self.parsed[key]
+        value = parse()
+        with self.lock:
+            self.parsed[key] = value
+            while len(self.parsed) > self.parsed_cache_size:
+                self.parsed.popitem(last=False)
+        return value
+    
+    def acquire(self, session_id, key):
+        """记录会话正在使用该病例（会话只引用一个上传病例）"""
+        with self.lock:
+            previous = self.session_keys.get(session_id)
+            if previous != key:
+                self._release(session_id)
+                self.session_keys[session_id] = key
+                self._entry(key)['refs'].add(session_id)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            self.session_seen[session_id] = time.time()
+            if time.time() - self.last_reap > 60:
+                self._reap_sessions()
+    
+    def release_session(self, session_id, purge=True):
+        """释放会话的引用；purge为True时立即删除不再被引用的病例目录"""
+        with self.lock:
+            key = self._release(session_id)
+            self.session_seen.pop(session_id, None)
+            if purge and key in self.entries and not self.entries[key]['refs']:
+                self._evict(key)
+    
+    def _release(self, session_id):
+        key = self.session_keys.pop(session_id, None)
+        if key in self.entries:
+            self.entries[key]['refs'].discard(session_id)
+        return key
+    
+    def _reap_sessions(self):
+        """释放已断开或空闲超时的会话的引用"""
+        now = time.time()
+        for session_id, seen in list(self.session_seen.items()):
+            active = is_session_active(session_id)
+            if active is False or now - seen > SESSION_IDLE_TIMEOUT:
+                self._release(session_id)
+                del self.session_seen[session_id]
+        self.last_reap = now
+        self._enforce_quota()
+    
+    def _evict(self, key):
+        """删除病例目录，释放其链接的内容文件"""
+        entry = self.entries.pop(key)
+        shutil.rmtree(self.case_dir(key), ignore_errors=True)
+        for digest in entry['files'].values():
+            if digest is not None:
+                self._unref_blob(digest)
+        self.disk_bytes -= entry['own_bytes']
+        self.evictions += 1
+        self.evicted_bytes += entry['bytes']
+    
+    def _enforce_quota(self):
+        for key in list(self.entries):
+            if self.disk_bytes <= self.quota_bytes:
+                break
+            if not self.entries[key]['refs']:
+                self._evict(key)
+    
+    def stats(self):
+        """存储指标：磁盘占用、去重前的总字节数、病例数、被引用病例数、淘汰次数等"""
+        with self.lock:
+            return {
+                'bytes_held': self.disk_bytes,
+                'logical_bytes': sum(entry['bytes'] for entry in self.entries.values()),
+                'quota_bytes': self.quota_bytes,
+                'cases': len(self.entries),
+                'referenced_cases': sum(1 for entry in self.entries.values() if entry['refs']),
+                'blobs': len(self.blobs),
+                'shared_blobs': sum(1 for blob in self.blobs.values() if blob['refs'] > 1),
+                'sessions': len(self.session_keys),
+                'evictions': self.evictions,
+                'evicted_bytes': self.evicted_bytes,
+            }
+
+@process_resource
+def get_upload_store():
+    """获取进程内共享的上传存储"""
+    return UploadStore(UPLOAD_STORE_DIR, int(UPLOAD_QUOTA_MB * 1024 * 1024))
+
+class ImageCache:
+    """显示尺寸图像及解码后灰度数组的磁盘缓存，按原图内容哈希和尺寸命名，超出配额时按LRU淘汰"""
+    
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.lock = threading.Lock()
+        self.files = OrderedDict()  # 缓存文件名 -> 字节数，按最近使用排序
+        self.digests = {}  # (路径, 大小, mtime) -> 内容哈希
+        self.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="image-cache")
+        os.makedirs(root, exist_ok=True)
+        existing = []
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    existing.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(existing):
+            self.files[name] = size
+        with self.lock:
+            self._enforce_quota()
+    
+    def file_digest(self, path):
+        """原图内容的SHA-256，按(路径, 大小, mtime)记忆，文件未变时不重复读取"""
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self.digests.get(key)
+        if digest is None:
+            digest = score_workers.file_sha256(path)
+            self.digests[key] = digest
+        return digest
+    
+    def get_rendition(self, path, max_side):
+        """返回长边不超过max_side的JPEG缓存文件路径，不存在时生成"""
+        name = score_workers.rendition_name(self.file_digest(path), max_side)
+        return self._get_cached(name, "image.render_jpeg",
+                                lambda cached_path: score_workers.render_rendition(path, cached_path, max_side))
+    
+    def get_buffer(self, path, max_side=None):
+        """返回图像解码后的灰度数组（内存映射，只读），max_side为空时为原始分辨率"""
+        name = score_workers.buffer_name(self.file_digest(path), max_side)
+        cached_path = self._get_cached(name, "image.decode_buffer",
+                                       lambda cached_path: score_workers.decode_buffer(path, cached_path, max_side))
+        import numpy as np
+        return np.load(cached_path, mmap_mode='r')
+    
+    def _get_cached(self, name, span, build):
+        """缓存文件的路径，不存在时调用build(路径)生成（耗时计入span阶段）"""
+        cached_path = os.path.join(self.root, name)
+        with self.lock:
+            if name in self.files and os.path.exists(cached_path):
+                self.files.move_to_end(name)
+                return cached_path
         
-        # 将数据转换为JSON字符串
-        json_data = json.dumps(review_data, ensure_ascii=False, indent=2)
-        
-        # 生成文件名
-        review_number = 0
-        if selected_model in data.get('reviews', {}):
-            current_review = data['reviews'][selected_model]
-            if current_review.get('username') == username and 'review_number' in current_review:
-                review_number = current_review.get('review_number', 0) + 1
-        
-        # 从report或case_name提取subject_id, study_id
-        subject_id = data.get('report', {}).get('subject_id') if data else None
-        study_id = data.get('report', {}).get('study_id') if data else None
-        case_name = data.get('case_name', '') if data else ''
-        if (not subject_id or not study_id) and case_name.startswith('subject_') and '_study_' in case_name:
+        # 缓存目录中已有（例如批量导入时在子进程中生成）的直接登记，否则现在生成
+        if not os.path.exists(cached_path):
+            with timed(span):
+                build(cached_path)
+        with self.lock:
+            self.files[name] = os.path.getsize(cached_path)
+            self.files.move_to_end(name)
+            self._enforce_quota()
+        return cached_path
+    
+    def get_renditions(self, paths, max_side):
+        """并行生成多张图像的缓存版本（如多视图的缩略图），按输入顺序返回路径"""
+        return list(self.executor.map(lambda path: self.get_rendition(path, max_side), paths))
+    
+    def register(self, cached_paths):
+        """登记在其他进程中生成到缓存目录的文件，并按配额淘汰"""
+        with self.lock:
+            for cached_path in cached_paths:
+                name = os.path.basename(cached_path)
+                if os.path.exists(cached_path):
+                    self.files[name] = os.path.getsize(cached_path)
+                    self.files.move_to_end(name)
+            self._enforce_quota()
+    
+    def _enforce_quota(self):
+        total = sum(self.files.values())
+        while total > self.quota_bytes and len(self.files) > 1:
+            name, size = self.files.popitem(last=False)
             try:
-                subject_id = case_name.split('subject_')[1].split('_study_')[0]
-                study_id = case_name.split('_study_')[1]
-            except Exception:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
                 pass
-        subject_id = subject_id if subject_id is not None else 'unknown'
-        study_id = study_id if study_id is not None else 'unknown'
-
-        filename = f"subject_{subject_id}_study_{study_id}_{selected_model}_review_{username}_{review_number}.json"
-        
-        # 下载按钮
-        st.download_button(
-            label="💾 下载评分结果",
-            data=json_data,
-            file_name=filename,
-            mime="application/json",
-            key=f"download_{selected_model}",
-            type="primary"
+            total -= size
+
+@process_resource
+def get_image_cache():
+    """获取进程内共享的图像缓存"""
+    return ImageCache(IMAGE_CACHE_DIR, int(IMAGE_CACHE_QUOTA_MB * 1024 * 1024))
+
+class SharedCaseCache:
+    """进程内跨会话共享的病例缓存（引用计数）
+    
+    同一病例（按case_key）在进程中只解析一份，各会话只在session state中保存病例键。
+    每个会话同时只引用一个病例；没有会话引用的病例按LRU保留最多max_unreferenced个。
+    会话断开或空闲超时后释放其引用。缓存中的病例数据对会话是只读的。
+    """
+    
+    def __init__(self, max_unreferenced):
+        self.max_unreferenced = max_unreferenced
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> {'data': dict, 'refs': set}，按最近使用排序
+        self.session_keys = {}  # session_id -> key
+        self.session_seen = {}  # session_id -> 最近访问时间
+        self.last_reap = time.time()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """返回缓存中的病例数据，不存在时返回None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry['data']
+    
+    def discard(self, key):
+        """丢弃已过期的病例数据（引用它的会话下次访问时重新加载）"""
+        with self.lock:
+            self.entries.pop(key, None)
+            # 引用它的会话重新加载后重新登记引用
+            for session_id in [session_id for session_id, value in self.session_keys.items() if value == key]:
+                del self.session_keys[session_id]
+    
+    def acquire(self, session_id, key, data):
+        """会话引用病例；缓存中已有相同键时返回已有数据，否则放入data"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {'data': data, 'refs': set()}
+            self.entries.move_to_end(key)
+            if self.session_keys.get(session_id) != key:
+                self._release(session_id)
+                self.session_keys[session_id] = key
+                entry['refs'].add(session_id)
+            self.session_seen[session_id] = time.time()
+            if time.time() - self.last_reap > 60:
+                self._reap_sessions()
+            self._trim()
+            return entry['data']
+    
+    def touch(self, session_id):
+        with self.lock:
+            if session_id in self.session_keys:
+                self.session_seen[session_id] = time.time()
+    
+    def release_session(self, session_id):
+        """释放会话对病例的引用"""
+        with self.lock:
+            self._release(session_id)
+            self.session_seen.pop(session_id, None)
+            self._trim()
+    
+    def _release(self, session_id):
+        key = self.session_keys.pop(session_id, None)
+        if key in self.entries:
+            self.entries[key]['refs'].discard(session_id)
+    
+    def _reap_sessions(self):
+        now = time.time()
+        for session_id, seen in list(self.session_seen.items()):
+            if is_session_active(session_id) is False or now - seen > SESSION_IDLE_TIMEOUT:
+                self._release(session_id)
+                del self.session_seen[session_id]
+        self.last_reap = now
+    
+    def _trim(self):
+        unreferenced = [key for key, entry in self.entries.items() if not entry['refs']]
+        for key in unreferenced[:max(0, len(unreferenced) - self.max_unreferenced)]:
+            del self.entries[key]
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'cases': len(self.entries),
+                'referenced_cases': sum(1 for entry in self.entries.values() if entry['refs']),
+                'sessions': len(self.session_keys),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+@process_resource
+def get_case_cache():
+    """获取进程内跨会话共享的病例缓存"""
+    return SharedCaseCache(CASE_CACHE_SIZE)
+
+def get_current_data():
+    """当前会话正在查看的病例数据（病例已被淘汰时返回None）"""
+    key = st.session_state.get('current_case_key')
+    if key is None:
+        return None
+    cache = get_case_cache()
+    data = cache.get(key)
+    if data is not None:
+        cache.touch(current_session_id())
+    return data
+
+def set_current_data(data):
+    """把病例放入共享缓存并设为当前会话的病例，返回缓存中的数据"""
+    key = case_key(data)
+    data = get_case_cache().acquire(current_session_id(), key, data)
+    st.session_state.current_case_key = key
+    return data
+
+def upload_files_present(data):
+    """上传病例写入存储的文件是否都还在（会话空闲超时后可能已被淘汰）"""
+    paths = list(data.get('models', {}).values())
+    paths += [path for files in data.get('review_files', {}).values() for path in files]
+    paths += data.get('images', [])
+    return all(os.path.exists(path) for path in paths)
+
+def create_data_from_uploaded_files(uploaded_files):
+    """从上传的文件创建数据
+    
+    解析结果按上传文件的内容哈希缓存：内容未变化的rerun直接复用当前数据。
+    病例文件按内容哈希写入上传存储（不同上传中的相同文件只存一份），报告直接从内存缓冲区解析，
+    模型预测在选中时才读取。报告和预测的解析结果按内容哈希在进程内共享。
+    """
+    with timed("upload.digest"):
+        upload_key = upload_content_key(uploaded_files)
+    store = get_upload_store()
+    store.acquire(current_session_id(), upload_key)
+    # 内容相同的上传（本会话的rerun或其他评分者上传的同一病例）直接复用共享缓存中的数据
+    cached_data = get_case_cache().get(upload_key)
+    if cached_data is not None and upload_files_present(cached_data):
+        return cached_data
+    
+    files = {file.name: file for file in uploaded_files if is_case_file(file.name) or file.name.endswith('report.json')}
+    digests = {name: uploaded_file_digest(file) for name, file in files.items()}
+    with timed("upload.write_files"):
+        paths = {name: store.write(upload_key, name, file.getvalue(), digests[name]) for name, file in files.items()}
+    return build_upload_data(upload_key, paths, digests, lambda name: files[name].getvalue())
+
+def restore_uploaded_case(upload_key):
+    """从上传存储恢复之前上传的病例（会话重连后无需重新上传），存储中已没有该病例时返回None"""
+    store = get_upload_store()
+    digests = store.case_files(upload_key)
+    if digests is None:
+        return None
+    store.acquire(current_session_id(), upload_key)
+    cached_data = get_case_cache().get(upload_key)
+    if cached_data is not None and upload_files_present(cached_data):
+        return cached_data
+    
+    paths = {name: os.path.join(store.case_dir(upload_key), name) for name in digests}
+    
+    def read(name):
+        with open(paths[name], 'rb') as f:
+            return f.read()
+    
+    return build_upload_data(upload_key, paths, digests, read)
+
+def build_upload_data(upload_key, paths, digests, read):
+    """由上传存储中的病例文件构建病例数据
+    
+    paths和digests为文件名到存储路径、内容哈希的映射，read(文件名)返回文件内容（用于解析报告）。
+    """
+    store = get_upload_store()
+    data = {'upload_key': upload_key, 'lock': threading.RLock()}
+    
+    # 读取原始报告
+    report_data = None
+    with timed("upload.report_json"):
+        for filename in paths:
+            if filename.endswith('report.json'):
+                try:
+                    digest = digests.get(filename)
+                    if digest:
+                        report_data = store.parsed_content(digest, 'report', lambda: json.loads(read(filename)))
+                    else:
+                        report_data = json.loads(read(filename))
+                    data['report'] = report_data
+                    break
+                except Exception as e:
+                    st.error(f"读取report.json失败: {e}")
+    
+    # 从report.json中提取subject_id和study_id
+    data['case_name'] = case_name_from_report(report_data, "unknown_case")
+    
+    # 图像文件按image_{n}中的n排序，默认显示n最小的视图
+    image_names = sorted((name for name in paths
+                          if name.startswith('image_') and name.endswith(('.jpg', '.png'))),
+                         key=extract_image_number)
+    data['images'] = [paths[name] for name in image_names]
+    if data['images']:
+        data['image'] = data['images'][0]
+    
+    # 模型预测文件已在上传存储中，选中模型时才读取
+    data['models'] = {}
+    data['model_digests'] = {}
+    data['model_cache'] = OrderedDict()
+    for filename in paths:
+        if filename.endswith('_predict.json'):
+            model_name = filename.replace('_predict.json', '')
+            data['models'][model_name] = paths[filename]
+            if digests.get(filename):
+                data['model_digests'][model_name] = digests[filename]
+    
+    # 检查是否已有review文件（支持新的命名规则）
+    data['reviews'] = {}
+    data['review_files'] = {}
+    
+    for model_name in data['models'].keys():
+        # 查找所有相关的review文件，按文件名排序，最新的在最后（假设文件名包含时间戳或序号）
+        review_names = sorted(name for name in paths if name.startswith(f"{model_name}_review"))
+        data['review_files'][model_name] = [paths[name] for name in review_names]
+    
+    return data
+
+def clear_uploaded_session():
+    """清空当前上传数据及相关会话状态"""
+    st.session_state.uploader_key_seed += 1
+    # 只释放本会话的引用，其他会话的缓存不受影响
+    session_id = current_session_id()
+    get_upload_store().release_session(session_id)
+    get_case_cache().release_session(session_id)
+    st.session_state.current_case_key = None
+    st.session_state.last_selected_case = None
+    # 已清空的病例不再在重连时恢复
+    username = (st.session_state.get('username_input') or "").strip()
+    if username:
+        get_review_store().clear_progress(username)
+    st.session_state.pop('session_progress', None)
+
+
+def display_upload_panel():
+    """侧边栏上传面板，返回当前病例数据"""
+    # 侧边栏 - 上传文件夹（包含report、预测结果、图像）
+    st.sidebar.header("📁 上传数据文件夹")
+    
+    # 显示需要的文件类型
+    with st.sidebar.expander("📋 文件夹中需要的文件", expanded=False):
+        st.markdown("""
+        **必需文件:**
+        - `image_{n}.jpg` - 医学图像 (n为数字，系统会选择n最小的图像)
+        - `report.json` - 原始报告
+        
+        **模型预测文件 (至少一个):**
+        - `{model_name}_predict.json` 文件
+        """)
+
+    if st.sidebar.button("清空上传数据"):
+        clear_uploaded_session()
+    
+    with st.sidebar.expander("💽 上传存储", expanded=False):
+        stats = get_upload_store().stats()
+        st.caption(
+            f"已占用 {stats['bytes_held'] / 2**20:.1f} / {stats['quota_bytes'] / 2**20:.0f} MB"
+            f"（去重前 {stats['logical_bytes'] / 2**20:.1f} MB，{stats['shared_blobs']} 个文件被多个病例共用），"
+            f"{stats['cases']} 个病例（{stats['referenced_cases']} 个使用中），"
+            f"已淘汰 {stats['evictions']} 个（{stats['evicted_bytes'] / 2**20:.1f} MB）"
+        )
+
+    # 上传组件：请选择包含report.json、*_predict.json、image_*.jpg/png的所有文件
+    uploaded_files = st.sidebar.file_uploader(
+        "上传病例文件夹文件",
+        type=['jpg', 'jpeg', 'png', 'json'],
+        accept_multiple_files=True,
+        help="请选择该病例文件夹中的所有文件（图像、报告、预测结果）",
+        key=f"file_uploader_widget_{st.session_state.uploader_key_seed}",
+    )
+
+    st.session_state.upcoming_cases = []
+
+    # 处理上传
+    if uploaded_files:
+        try:
+            data = set_current_data(create_data_from_uploaded_files(uploaded_files))
+            st.session_state.last_selected_case = None
+            st.sidebar.success("✅ 已加载上传的病例数据")
+        except Exception as e:
+            st.error(f"❌ 解析上传数据失败: {e}")
+            data = None
+    else:
+        data = get_current_data()
+    return data
+
+def display_case_browser(username):
+    """侧边栏病例浏览器（基于数据集索引），返回当前病例数据"""
+    st.sidebar.header("🗂️ 数据集病例")
+    dataset_root = st.sidebar.text_input(
+        "数据集目录:",
+        value=DEFAULT_DATASET_ROOT,
+        placeholder="包含各病例文件夹的目录",
+        key="dataset_root_input"
+    ).strip()
+    if not dataset_root:
+        return None
+    if not os.path.isdir(dataset_root):
+        st.sidebar.error("数据集目录不存在")
+        return None
+    
+    index = get_case_index(dataset_root)
+    get_review_analytics().watch(index)
+    scheduler = get_task_scheduler()
+    scheduler.ensure_synced(index)
+    if st.sidebar.button("🔄 刷新索引") or index.is_stale():
+        updated = index.refresh()
+        if updated:
+            scheduler.sync(index, index.last_changed)
+            st.sidebar.caption(f"索引已更新 {updated} 个病例")
+    
+    display_search_panel(index)
+    display_metrics_panel(index)
+    display_ingest_panel(index)
+    display_export_panel(index)
+    
+    # 多评分者任务分配：领取下一个需要评分的(病例, 模型)
+    if username and username.strip():
+        st.sidebar.button(
+            "🎯 领取下一个任务",
+            on_click=claim_next_task,
+            args=(index.dataset_root, username.strip())
+        )
+        message = st.session_state.pop('task_message', None)
+        if message:
+            st.sidebar.info(message)
+        lease = scheduler.current_lease(index.dataset_root, username.strip())
+        if lease:
+            remaining = max(0, int(lease[2] - time.time()))
+            st.sidebar.caption(
+                f"当前任务: {os.path.basename(lease[0])} / {lease[1]}（租约剩余 {remaining // 60} 分 {remaining % 60} 秒）"
+            )
+        done, total = scheduler.progress(index.dataset_root)
+        st.sidebar.caption(f"任务进度: {done or 0}/{total}（每项需 {REVIEWS_PER_TASK} 人评分）")
+    
+    query = st.sidebar.text_input("筛选病例:", placeholder="病例名称或文件夹名", key="case_filter")
+    sort_options = {"病例名称": None}
+    sort_options.update({f"{METRIC_LABELS[name]}（低→高）": name for name in METRIC_NAMES})
+    sort_label = st.sidebar.selectbox("排序:", list(sort_options), key="case_sort")
+    sort_metric = sort_options[sort_label]
+    total = index.count_cases(query)
+    if not total:
+        st.sidebar.warning("未找到病例")
+        return None
+    
+    # 分页：选择框只包含当前页的病例
+    pages = (total + CASE_PAGE_SIZE - 1) // CASE_PAGE_SIZE
+    page = min(st.session_state.get('case_page', 1), pages)
+    paged = page != st.session_state.get('case_page_shown', page)
+    pending_case = st.session_state.pop('pending_case_selection', None)
+    if pending_case is not None:
+        st.session_state.case_selection = pending_case
+    cases = index.list_cases(query, limit=CASE_PAGE_SIZE, offset=(page - 1) * CASE_PAGE_SIZE, sort_metric=sort_metric)
+    selected = st.session_state.get('case_selection')
+    # 选中的病例（领取任务、检索结果、自动跳转）不在当前页时翻到其所在页；用户刚手动翻页时除外
+    if selected is not None and not paged and selected not in {case['folder'] for case in cases}:
+        position = index.case_position(selected, query, sort_metric)
+        if position is not None and position // CASE_PAGE_SIZE + 1 != page:
+            page = position // CASE_PAGE_SIZE + 1
+            cases = index.list_cases(query, limit=CASE_PAGE_SIZE, offset=(page - 1) * CASE_PAGE_SIZE,
+                                     sort_metric=sort_metric)
+    st.session_state.case_page = page
+    st.session_state.case_page_shown = page
+    if pages > 1:
+        st.sidebar.number_input(f"页码（共{pages}页，每页{CASE_PAGE_SIZE}个）:", min_value=1, max_value=pages,
+                                step=1, key="case_page")
+    
+    labels = {}
+    for case in cases:
+        status = "✅" if case['n_models'] and case['n_reviewed'] >= case['n_models'] else "❌"
+        labels[case['folder']] = f"{status} {case['case_name']} ({case['n_reviewed']}/{case['n_models']})"
+    folders = list(labels.keys())
+    if st.session_state.get('case_selection') not in labels:
+        st.session_state.case_selection = folders[0]
+    folder = st.sidebar.selectbox(
+        f"病例 (共{total}个):",
+        folders,
+        format_func=lambda f: labels[f],
+        key="case_selection"
+    )
+    
+    # 当前病例之后的未评分病例（当前页不够时接着取下一页），在后台预取
+    position = folders.index(folder)
+    upcoming = [case['folder'] for case in cases[position + 1:]
+                if case['n_reviewed'] < case['n_models']][:PREFETCH_DEPTH]
+    if len(upcoming) < PREFETCH_DEPTH and page < pages:
+        upcoming += [case['folder'] for case in index.list_cases(query, limit=CASE_PAGE_SIZE,
+                                                                 offset=page * CASE_PAGE_SIZE, sort_metric=sort_metric)
+                     if case['n_reviewed'] < case['n_models']][:PREFETCH_DEPTH - len(upcoming)]
+    st.session_state.upcoming_cases = upcoming
+    st.sidebar.button(
+        "⏭️ 下一个未评分病例",
+        on_click=select_case,
+        args=(upcoming[0] if upcoming else None,),
+        disabled=not upcoming
+    )
+    
+    # 切换病例时才加载，文件列表直接取自索引
+    prefetcher = get_case_prefetcher(index.dataset_root)
+    dir_mtime = cases[position]['dir_mtime']
+    data = get_current_data() if folder == st.session_state.last_selected_case else None
+    # 索引刷新后病例文件夹有变化（例如其他评分者保存了review）时重新加载
+    if data is not None and data.get('dir_mtime') != dir_mtime:
+        data = None
+    if data is None:
+        folder_path = os.path.join(index.dataset_root, folder)
+        # 其他评分者已打开的病例直接从共享缓存取用
+        cache = get_case_cache()
+        data = cache.get(folder_path)
+        if data is not None and data.get('dir_mtime') != dir_mtime:
+            cache.discard(folder_path)
+            data = None
+        try:
+            if data is None:
+                data = prefetcher.get(folder, dir_mtime)
+            data = set_current_data(data)
+            st.session_state.last_selected_case = folder
+        except (OSError, ValueError) as e:
+            st.error(f"❌ 加载病例失败: {e}")
+            return None
+    prefetcher.schedule(upcoming)
+    
+    stats = prefetcher.stats()
+    st.sidebar.caption(
+        f"预取命中率 {stats['hit_rate']:.0%}（{stats['hits']}/{stats['hits'] + stats['misses']}），"
+        f"已缓存 {stats['ready']} 个病例 {stats['bytes'] / 2**20:.1f} MB"
+    )
+    return data
+
+def claim_next_task(dataset_root, username):
+    """领取下一个任务并切换到对应的病例和模型（按钮回调）"""
+    # 先写入队列中的评分，刚评完的任务计入进度、租约已释放，不会再次分配给该用户
+    get_review_writer().flush()
+    task = get_task_scheduler().next_task(dataset_root, username)
+    if task is None:
+        st.session_state.task_message = "🎉 当前没有需要评分的任务"
+        return
+    case_path, model_name = task
+    # 清空筛选条件，保证任务病例出现在选择框中
+    st.session_state.case_filter = ""
+    st.session_state.case_selection = os.path.basename(case_path)
+    st.session_state.pending_model_selection = model_name
+
+def select_case(folder):
+    """切换病例选择框到指定病例（按钮回调）"""
+    if folder is not None:
+        st.session_state.case_selection = folder
+
+def format_kappa(value):
+    return "—" if value != value else f"{value:.3f}"
+
+def display_analytics_page():
+    """统计分析页：各模型的PEER评分分布、均值置信区间与评分者一致性"""
+    analytics = get_review_analytics()
+    analytics.update()
+    overall = analytics.overall()
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("评分数", overall['reviews'])
+    col2.metric("评分者", overall['users'])
+    col3.metric("评分对象", overall['items'])
+    col4.metric("Fleiss' kappa", format_kappa(overall['fleiss_kappa']))
+    if not overall['reviews']:
+        st.info("💡 暂无保存到服务器的评分")
+        return
+    
+    summary = analytics.model_summary()
+    st.subheader("📊 各模型PEER评分")
+    st.dataframe(
+        [
+            dict(
+                {
+                    "模型": row['model_name'],
+                    "评分数": row['n'],
+                    "平均分": round(row['mean'], 3),
+                    "95%置信区间": f"{row['ci'][0]:.2f} – {row['ci'][1]:.2f}",
+                    "Fleiss' kappa": format_kappa(row['fleiss_kappa']),
+                },
+                **{f"{score}分": count for score, count in enumerate(row['distribution'])}
+            )
+            for row in summary
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    st.bar_chart({row['model_name']: row['distribution'] for row in summary})
+    
+    st.subheader("🤝 评分者一致性（Cohen's kappa）")
+    model_option = st.selectbox("模型:", ["全部模型"] + [row['model_name'] for row in summary],
+                                key="agreement_model")
+    pairs = analytics.rater_agreement(None if model_option == "全部模型" else model_option)
+    if pairs:
+        st.dataframe(
+            [{"评分者A": a, "评分者B": b, "共同评分数": n, "Cohen's kappa": format_kappa(kappa)}
+             for a, b, n, kappa in pairs],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("没有两位评分者共同评过至少2个对象")
+
+def warm_up(dataset_root=None, cases=WARMUP_CASES):
+    """预热进程内共享对象，返回已安排预取的病例文件夹
+    
+    导入首屏延后加载的依赖，建立评分存储、写入队列、上传存储和图像缓存；指定数据集目录时刷新索引，
+    并在后台预取排在最前面的cases个病例（解析JSON，生成显示尺寸图像和缩略图缓存）。
+    """
+    with timed("warmup.imports"):
+        import numpy  # noqa: F401
+        import PIL.Image  # noqa: F401
+        # 提示框文字以非ASCII字符开头时，Streamlit要加载emoji目录来提取开头的emoji
+        with contextlib.suppress(ImportError):
+            import streamlit.emojis  # noqa: F401
+    with timed("warmup.resources"):
+        get_task_scheduler()
+        get_review_writer()
+        get_upload_store()
+        get_image_cache()
+        get_case_cache()
+    if not dataset_root or not os.path.isdir(dataset_root):
+        return []
+    with timed("warmup.index"):
+        index = get_case_index(dataset_root)
+    folders = [case['folder'] for case in index.list_cases(limit=cases)]
+    get_case_prefetcher(dataset_root).schedule(folders)
+    return folders
+
+@process_resource
+def get_warmup():
+    """启动本进程的后台预热线程（只启动一次，在第一个会话的首屏之后）"""
+    thread = threading.Thread(target=warm_up, args=(DEFAULT_DATASET_ROOT,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def warm_up_command(args):
+    """部署时在启动服务器之前运行：python streamlit_app.py --warmup [数据集目录]
+    
+    刷新数据集索引并生成前几个病例的图像缓存，两者都在磁盘上，服务器进程启动后直接复用。
+    """
+    dataset_root = args[0] if args else DEFAULT_DATASET_ROOT
+    start = time.perf_counter()
+    folders = warm_up(dataset_root)
+    prefetcher = get_case_prefetcher(dataset_root) if folders else None
+    for folder in folders:
+        prefetcher.get(folder)
+    print(f"预热完成，用时 {time.perf_counter() - start:.1f} 秒，预取 {len(folders)} 个病例")
+    for name, (count, p50, _) in sorted(get_timing_stats().summary().items()):
+        print(f"  {name}: {p50:.1f} ms" + (f"（{count} 次）" if count > 1 else ""))
+
+def main():
+    st.markdown('<div class="main-header">报告评估系统</div>', unsafe_allow_html=True)
+    
+    page = st.sidebar.radio("页面:", ["📝 评分", "📈 统计分析"], key="page",
+                            horizontal=True, label_visibility="collapsed")
+    if page == "📈 统计分析":
+        display_analytics_page()
+        return
+    
+    # 初始化session state
+    if 'current_case_key' not in st.session_state:
+        st.session_state.current_case_key = None
+    if 'last_selected_case' not in st.session_state:
+        st.session_state.last_selected_case = None
+    if 'uploader_key_seed' not in st.session_state:
+        st.session_state.uploader_key_seed = 0
+    
+    # 用户名输入
+    st.sidebar.header("👤 用户信息")
+    # 用户名同时写入页面地址，刷新页面后自动填入，随后恢复该用户的评分进度
+    if 'username_input' not in st.session_state and st.query_params.get('user'):
+        st.session_state.username_input = st.query_params['user']
+    username = st.sidebar.text_input("用户名:", placeholder="请输入您的用户名", 
+                                   key="username_input")
+    if username.strip() and st.query_params.get('user') != username.strip():
+        st.query_params['user'] = username.strip()
+    save_path = st.sidebar.text_input("评分保存目录（可选）:", placeholder="默认保存到病例文件夹",
+                                      key="save_path_input")
+    st.sidebar.toggle("⚡ 快速评分模式", key="rapid_mode",
+                      help="数字键0-5直接打分并保存，自动跳到下一个未评分的模型/病例")
+    display_throughput_stats()
+    display_timing_panel()
+    restore_session_progress(username)
+    
+
+    # 侧边栏 - 数据来源：逐个上传病例文件，或直接浏览服务器上的数据集目录
+    st.sidebar.header("📂 数据来源")
+    data_source = st.sidebar.radio(
+        "数据来源:",
+        ["上传文件", "数据集目录"],
+        key="data_source",
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+
+    with timed("main.load_case"):
+        if data_source == "数据集目录":
+            data = display_case_browser(username)
+        else:
+            data = display_upload_panel()
+
+    if data:
+        # 记录当前病例的开始时间，用于统计评分效率
+        if st.session_state.get('case_timer_key') != case_key(data):
+            st.session_state.case_timer_key = case_key(data)
+            st.session_state.case_started_at = time.time()
+        
+        # 侧边栏 - 模型选择
+        st.sidebar.header("🤖 模型选择")
+        if data.get('models'):
+            with st.sidebar.expander("选择模型", expanded=True):
+                model_options = []
+                for model_name in data['models'].keys():
+                    # status = "✅" if model_name in data.get('reviews', {}) else "❌"
+                    # model_options.append(f"{status} {model_name}")
+                    model_options.append(f"{model_name}")
+                # 快速评分模式自动跳转的模型，须在单选框创建前写入其状态
+                pending_model = st.session_state.pop('pending_model_selection', None)
+                if pending_model is not None:
+                    if pending_model not in model_options:
+                        # 未指定模型时从第一个尚无review的模型开始
+                        pending_model = next((name for name in model_options if not is_model_reviewed(data, name)),
+                                             model_options[0])
+                    st.session_state.model_selection = pending_model
+                selected_option = st.radio(
+                    "可用模型:",
+                    model_options,
+                    key="model_selection"
+                )
+                selected_model = selected_option.split(" ", 1)[1] if " " in selected_option else selected_option
+
+            # 主界面显示
+            with timed("main.interface"):
+                display_main_interface(data, selected_model, username, save_path)
+        else:
+            st.error("未找到任何模型预测文件 (*_predict.json)")
+    else:
+        # 显式给出Material图标：Streamlit不必为提取文字开头的emoji加载emoji目录（首屏）
+        st.info("请上传文件夹中的所有文件（图像、报告、预测结果），或在侧边栏选择数据集目录",
+                icon=":material/lightbulb:")
+
+def case_key(data):
+    """病例的唯一键：上传病例为内容键，数据集病例为文件夹路径"""
+    return data.get('upload_key') or data.get('folder_path') or data.get('case_name', 'unknown_case')
+
+def build_review_data(data, model_name, peer_score):
+    """生成要保存的review数据"""
+    return {
+        "model_name": model_name,
+        "peer_score": peer_score,
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "case_name": data.get('case_name', 'unknown_case')
+    }
+
+def save_session_progress(data, model_name, username, peer_score=None):
+    """按用户名把评分进度（当前病例、模型、未保存的打分）保存到评分数据库，进度未变化时不写入
+    
+    peer_score为该模型尚未保存的打分，None表示没有。
+    """
+    username = username.strip()
+    key = case_key(data)
+    progress = st.session_state.get('session_progress') or {}
+    pending = dict(progress.get('pending_scores', {})) if progress.get('case_key') == key else {}
+    if peer_score is None:
+        pending.pop(model_name, None)
+    else:
+        pending[model_name] = peer_score
+    progress = {'case_key': key, 'model_name': model_name, 'pending_scores': pending}
+    if data.get('folder_path'):
+        progress.update(data_source="数据集目录",
+                        dataset_root=(st.session_state.get('dataset_root_input') or "").strip(),
+                        case_folder=st.session_state.get('last_selected_case'))
+    else:
+        progress['data_source'] = "上传文件"
+    st.session_state.session_progress = progress
+    if st.session_state.get('saved_progress') != (username, progress):
+        get_review_store().save_progress(username, progress)
+        st.session_state.saved_progress = (username, progress)
+
+def restore_session_progress(username):
+    """新会话输入用户名后，恢复该用户上次的评分进度（病例、模型、未保存的打分）
+    
+    数据集病例重新选中原文件夹（从共享缓存或预取加载）；上传病例从上传存储恢复，无需重新上传。
+    """
+    username = (username or "").strip()
+    if not username or st.session_state.get('restored_username') == username:
+        return
+    st.session_state.restored_username = username
+    # 会话中已经打开了病例（例如中途修改用户名）时不覆盖
+    if st.session_state.current_case_key is not None:
+        return
+    with timed("session.restore"):
+        progress = get_review_store().load_progress(username)
+        if not progress:
+            return
+        if progress.get('data_source') == "数据集目录":
+            if not progress.get('dataset_root') or not progress.get('case_folder'):
+                return
+            st.session_state.data_source = "数据集目录"
+            st.session_state.dataset_root_input = progress['dataset_root']
+            st.session_state.pending_case_selection = progress['case_folder']
+        else:
+            data = restore_uploaded_case(progress['case_key'])
+            if data is None:
+                st.sidebar.warning("上次上传的病例已从服务器清理，请重新上传")
+                return
+            set_current_data(data)
+            st.session_state.data_source = "上传文件"
+    if progress.get('model_name'):
+        st.session_state.pending_model_selection = progress['model_name']
+    # 未保存的打分作为打分滑块的初始值
+    st.session_state.restored_scores = {
+        (progress['case_key'], model): score for model, score in progress.get('pending_scores', {}).items()
+    }
+    st.session_state.session_progress = progress
+    st.session_state.saved_progress = (username, progress)
+    st.toast("已恢复上次的评分进度", icon=":material/history:")
+
+def submit_score(data, model_name, username, save_path, peer_score, mode):
+    """把评分加入后台写入队列，并更新评分效率统计（mode: "normal" 或 "rapid"）"""
+    review_data = build_review_data(data, model_name, peer_score)
+    review_data['scoring_mode'] = mode
+    # 任务进度和租约随后台写入一起更新（按病例文件夹记录），点击后不等待数据库事务
+    get_review_writer().submit(case_save_folder(data), model_name, username, dict(review_data), save_path)
+    # 提交的评分只记在本会话中，共享的病例数据保持只读
+    st.session_state.setdefault('session_reviews', {})[(case_key(data), model_name)] = dict(
+        review_data, username=username
+    )
+    save_session_progress(data, model_name, username)
+    
+    # 本会话中该病例的所有模型都评完后，计入对应模式的评分效率
+    key = case_key(data)
+    scored = st.session_state.setdefault('scored_models', {}).setdefault(key, set())
+    scored.add(model_name)
+    completed = st.session_state.setdefault('completed_cases', set())
+    if key not in completed and len(scored) >= len(data.get('models', {})):
+        completed.add(key)
+        elapsed = time.time() - st.session_state.get('case_started_at', time.time())
+        stats = st.session_state.setdefault('throughput', {}).setdefault(mode, {'cases': 0, 'seconds': 0.0})
+        stats['cases'] += 1
+        stats['seconds'] += elapsed
+
+def display_throughput_stats():
+    """侧边栏显示本会话各模式的评分效率（病例/小时）"""
+    throughput = st.session_state.get('throughput')
+    if not throughput:
+        return
+    labels = {'normal': "普通模式", 'rapid': "快速模式"}
+    parts = []
+    for mode, stats in throughput.items():
+        per_hour = stats['cases'] * 3600 / stats['seconds'] if stats['seconds'] else 0.0
+        parts.append(f"{labels.get(mode, mode)} {per_hour:.0f} 例/小时（{stats['cases']} 例）")
+    st.sidebar.caption("⏱️ 评分效率：" + "，".join(parts))
+
+def advance_after_score(data, model_name):
+    """跳到本病例下一个未评分的模型；都已评分时跳到下一个未评分病例
+    
+    已有review文件的模型（包括以前的会话或其他评分者保存的）也视为已评分。
+    """
+    models = list(data.get('models', {}).keys())
+    scored = st.session_state.get('scored_models', {}).get(case_key(data), set())
+    start = models.index(model_name) + 1 if model_name in models else 0
+    for candidate in models[start:] + models[:start]:
+        if candidate not in scored and not is_model_reviewed(data, candidate):
+            st.session_state.pending_model_selection = candidate
+            return
+    
+    upcoming = st.session_state.get('upcoming_cases') or []
+    if upcoming:
+        st.session_state.pending_case_selection = upcoming[0]
+        # 新病例从第一个未评分的模型开始
+        st.session_state.pending_model_selection = ""
+    else:
+        st.toast("✅ 本病例的所有模型都已评分")
+
+# 快速评分快捷键：在父页面注册一次keydown监听，按下0-5时点击对应的"N分"按钮
+RAPID_SHORTCUT_SCRIPT = """
+<script>
+const doc = window.parent.document;
+if (!doc.__rapidScoreShortcuts) {
+    doc.__rapidScoreShortcuts = true;
+    doc.addEventListener('keydown', (event) => {
+        if (event.ctrlKey || event.metaKey || event.altKey || !/^[0-5]$/.test(event.key)) {
+            return;
+        }
+        const target = event.target;
+        const tag = (target.tagName || '').toLowerCase();
+        if (tag === 'input' || tag === 'textarea' || target.isContentEditable) {
+            return;
+        }
+        const label = event.key + '分';
+        const button = Array.from(doc.querySelectorAll('button')).find((b) => b.innerText.trim() === label);
+        if (button) {
+            event.preventDefault();
+            button.click();
+        }
+    });
+}
+</script>
+"""
+
+def display_rapid_scoring(data, selected_model, username, save_path):
+    """快速评分面板：按键0-5打分、保存并自动跳转"""
+    st.info(f"👤 当前用户: {username}")
+    previous_review = get_previous_review(data, selected_model)
+    st.markdown(f"**{selected_model}** - PEER打分 (0-5分)，可直接按数字键")
+    if 'peer_score' in previous_review:
+        st.caption(f"已有评分: {previous_review['peer_score']}")
+    
+    clicked = None
+    for score, col in enumerate(st.columns(6)):
+        if col.button(f"{score}分", key=f"rapid_score_{score}", use_container_width=True):
+            clicked = score
+    components.html(RAPID_SHORTCUT_SCRIPT, height=0)
+    
+    if clicked is not None:
+        try:
+            submit_score(data, selected_model, username, save_path, clicked, "rapid")
+        except (ValueError, RuntimeError) as e:
+            st.error(f"❌ 保存失败: {e}")
+            return
+        advance_after_score(data, selected_model)
+        # 跳转到其他模型/病例需要整页重跑以更新图像和报告
+        st.rerun()
+
+def case_save_folder(data):
+    """病例review的默认保存目录：数据集病例为其文件夹，上传病例为保存根目录下的case_name子目录"""
+    if data.get('folder_path'):
+        return data['folder_path']
+    return os.path.join(REVIEW_SAVE_ROOT, data.get('case_name', 'unknown_case'))
+
+def display_main_interface(data, selected_model, username, save_path=None):
+    """显示主界面"""
+    
+    # 使用从数据中提取的病例名称
+    case_name = data.get('case_name', 'unknown_case')
+    
+    # 检查处理状态
+    if is_model_reviewed(data, selected_model):
+        status_text = "✅ 已处理"
+        status_class = "status-processed"
+        is_processed = True
+    else:
+        status_text = "❌ 未处理"
+        status_class = "status-unprocessed"
+        is_processed = False
+    
+    # 在同一行显示病例名称和状态
+    st.markdown(f"**当前病例:** {case_name} <span class='status-badge {status_class}'>{status_text}</span>", unsafe_allow_html=True)
+    
+    # 创建三列布局：图像、报告、打分系统
+    # 三个面板都是独立重跑的片段：拖动评分滑块只重跑打分面板，不会重新渲染图像和报告
+    col1, col2, col3 = st.columns([1, 1, 1])
+    
+    with col1:
+        display_image_pane(data)
+    
+    with col2:
+        display_report_pane(data, selected_model)
+    
+    with col3:
+        display_scoring_pane(data, selected_model, username, save_path)
+
+def select_image_view(state_key, position):
+    """切换显示的图像视图（按钮回调）"""
+    st.session_state[state_key] = position
+
+def display_thumbnail_strip(images, state_key, selected):
+    """多视图缩略图条：缩略图并行生成并缓存，点击切换显示的视图"""
+    thumbnails = get_image_cache().get_renditions(images, THUMBNAIL_SIZE)
+    columns = st.columns(max(len(images), 4))
+    for position, (column, image_path, thumbnail) in enumerate(zip(columns, images, thumbnails)):
+        with column:
+            st.image(thumbnail, use_container_width=True)
+            st.button(
+                f"视图 {extract_image_number(os.path.basename(image_path))}",
+                key=f"{state_key}_{position}",
+                type="primary" if position == selected else "secondary",
+                on_click=select_image_view,
+                args=(state_key, position),
+                use_container_width=True
+            )
+
+def window_lut(max_value, center, width, invert):
+    """窗宽窗位查找表：把0..max_value的像素值映射到0-255"""
+    import numpy as np
+    
+    values = np.arange(max_value + 1, dtype=np.float32)
+    lut = np.clip((values - (center - width / 2)) * (255 / max(width, 1)), 0, 255).astype(np.uint8)
+    return 255 - lut if invert else lut
+
+def image_window_defaults(buffer):
+    """像素值上限与默认窗宽窗位（取0.5%-99.5%分位数，排除极端值）"""
+    import numpy as np
+    
+    low, high = np.percentile(buffer[::4, ::4], [0.5, 99.5])
+    return {
+        'max_value': 255 if buffer.dtype == np.uint8 else max(int(buffer.max()), 1),
+        'center': int((low + high) / 2),
+        'width': max(int(high - low), 1),
+    }
+
+def reset_image_adjustments(prefix, defaults, force=True):
+    """恢复默认窗宽窗位并取消反色和缩放（按钮回调；force为False时只补充尚未设置的控件状态）"""
+    values = {'center': defaults['center'], 'width': defaults['width'], 'invert': False,
+              'zoom': 1.0, 'pan_x': 0.5, 'pan_y': 0.5}
+    for name, value in values.items():
+        if force or f"{prefix}_{name}" not in st.session_state:
+            st.session_state[f"{prefix}_{name}"] = value
+
+def adjusted_image(image_path, center, width, invert, zoom, pan_x, pan_y):
+    """窗宽窗位、反色和缩放后的8位图像
+    
+    不缩放时在显示尺寸的缓存数组上计算；放大时只从原始分辨率数组（内存映射）中读取可见区域，
+    区域大于显示尺寸时按步长抽样。
+    """
+    import numpy as np
+    
+    cache = get_image_cache()
+    if zoom <= 1:
+        region = cache.get_buffer(image_path, DISPLAY_IMAGE_SIZE)
+    else:
+        full = cache.get_buffer(image_path)
+        height, width_px = full.shape
+        region_height, region_width = max(int(height / zoom), 1), max(int(width_px / zoom), 1)
+        top = int((height - region_height) * pan_y)
+        left = int((width_px - region_width) * pan_x)
+        step = max(1, -(-max(region_height, region_width) // DISPLAY_IMAGE_SIZE))
+        region = full[top:top + region_height:step, left:left + region_width:step]
+    lut = window_lut(int(np.iinfo(region.dtype).max), center, width, invert)
+    return lut[region]
+
+def display_image_adjustments(image_path):
+    """窗宽窗位/反色/缩放工具，返回调整后的图像"""
+    buffer = get_image_cache().get_buffer(image_path, DISPLAY_IMAGE_SIZE)
+    prefix = f"image_adjust_{get_image_cache().file_digest(image_path)[:16]}"
+    defaults = st.session_state.get(f"{prefix}_defaults")
+    if defaults is None:
+        defaults = st.session_state[f"{prefix}_defaults"] = image_window_defaults(buffer)
+    
+    # 控件的初始值写入会话状态，恢复默认时可直接覆盖
+    reset_image_adjustments(prefix, defaults, force=False)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        center = st.slider("窗位", 0, defaults['max_value'], key=f"{prefix}_center")
+        zoom = st.slider("缩放", 1.0, 8.0, step=0.5, key=f"{prefix}_zoom")
+        invert = st.checkbox("反色", key=f"{prefix}_invert")
+    with col2:
+        width = st.slider("窗宽", 1, defaults['max_value'] + 1, key=f"{prefix}_width")
+        pan_x = st.slider("水平位置", 0.0, 1.0, disabled=zoom <= 1, key=f"{prefix}_pan_x")
+        pan_y = st.slider("垂直位置", 0.0, 1.0, disabled=zoom <= 1, key=f"{prefix}_pan_y")
+    st.button("↺ 恢复默认", key=f"{prefix}_reset", on_click=reset_image_adjustments, args=(prefix, defaults))
+    return adjusted_image(image_path, center, width, invert, zoom, pan_x, pan_y)
+
+@st.fragment
+@timed("pane.image")
+def display_image_pane(data):
+    """图像面板"""
+    images = data.get('images') or ([data['image']] if 'image' in data else [])
+    # 图像显示
+    if images and os.path.exists(images[0]):
+        with st.expander("🖼️ 医学图像", expanded=True):
+            state_key = f"image_view_{case_key(data)}"
+            selected = min(st.session_state.get(state_key, 0), len(images) - 1)
+            image_path = images[selected]
+            try:
+                if len(images) > 1:
+                    display_thumbnail_strip(images, state_key, selected)
+                # 只解码选中的视图；默认只发送缓存的显示尺寸图像，原图按需查看
+                caption = f"胸部X光片（{os.path.basename(image_path)}）"
+                if st.toggle("🎚️ 窗宽窗位 / 缩放", key=f"image_adjust_{case_key(data)}"):
+                    st.image(display_image_adjustments(image_path), caption=caption, use_container_width=True)
+                else:
+                    display_path = get_image_cache().get_rendition(image_path, DISPLAY_IMAGE_SIZE)
+                    st.image(display_path, caption=caption, use_container_width=True)
+                if st.toggle("🔍 查看原图", key=f"full_image_{case_key(data)}"):
+                    st.image(image_path, caption="原始分辨率")
+            except Exception as e:
+                st.error(f"图像加载失败: {e}")
+                # 显示调试信息
+                st.write(f"图像路径: {image_path}")
+                st.write(f"文件存在: {os.path.exists(image_path)}")
+    else:
+        st.warning("未找到图像文件")
+        if 'image' in data:
+            st.write(f"图像路径: {data['image']}")
+
+@st.fragment
+@timed("pane.report")
+def display_report_pane(data, selected_model):
+    """原始报告与模型预测报告面板"""
+    # 原始报告显示
+    if 'report' in data:
+        with st.expander("📋 原始报告", expanded=True):
+            findings = data['report'].get('findings', '')
+            impression = data['report'].get('impression', '')
+            
+            # Findings部分
+            st.markdown("**Findings:**")
+            st.text_area(
+                "原始报告Findings",
+                value=findings,
+                height=140,
+                disabled=False,
+                label_visibility="collapsed"
+            )
+            
+            # Impression部分
+            st.markdown("**Impression:**")
+            st.text_area(
+                "原始报告Impression",
+                value=impression,
+                height=140,
+                disabled=False,
+                label_visibility="collapsed"
+            )
+    # 预测报告显示
+    if selected_model in data.get('models', {}):
+        try:
+            model_data = get_model_report(data, selected_model)
+        except (OSError, ValueError) as e:
+            st.error(f"读取{selected_model}预测文件失败: {e}")
+            return
+        
+        with st.expander("🤖 模型预测报告", expanded=True):
+            model_findings = model_data.get('findings', '')
+            model_impression = model_data.get('impression', '')
+            
+            # 模型Findings部分
+            st.markdown("**Findings:**")
+            st.text_area(
+                "模型预测Findings",
+                value=model_findings,
+                height=140,
+                disabled=False,
+                label_visibility="collapsed"
+            )
+            
+            # 模型Impression部分
+            st.markdown("**Impression:**")
+            st.text_area(
+                "模型预测Impression",
+                value=model_impression,
+                height=140,
+                disabled=False,
+                label_visibility="collapsed"
+            )
+
+def get_report_metrics(data, model_name):
+    """当前模型预测的自动指标：数据集病例取批量计算的结果，否则计算一次后保存在会话中"""
+    if data.get('folder_path'):
+        dataset_root, folder = os.path.split(data['folder_path'])
+        metrics = get_case_index(dataset_root).get_metrics(folder).get(model_name)
+        if metrics is not None:
+            return metrics
+    cache = st.session_state.setdefault('report_metrics', {})
+    key = (case_key(data), model_name)
+    if key not in cache:
+        report = data.get('report') or {}
+        model_data = get_model_report(data, model_name) or {}
+        cache[key] = score_workers.report_metrics(
+            f"{report.get('findings', '')}\n{report.get('impression', '')}",
+            f"{model_data.get('findings', '')}\n{model_data.get('impression', '')}"
         )
+    return cache[key]
+
+def display_report_metrics(data, model_name):
+    """在打分滑块旁显示自动指标，仅供参考"""
+    metrics = get_report_metrics(data, model_name)
+    st.caption(" · ".join(
+        f"{METRIC_LABELS[name]} {'—' if metrics[name] is None else f'{metrics[name]:.2f}'}"
+        for name in METRIC_NAMES
+    ) + "（自动指标，仅供参考）")
+
+@st.fragment
+@timed("pane.scoring")
+def display_scoring_pane(data, selected_model, username, save_path=None):
+    """打分面板"""
+    # 用户名验证
+    if not username or not username.strip():
+        st.warning("⚠️ 请输入用户名后才能进行评分")
+        return
+    
+    # 打分系统
+    st.markdown('<div class="section-title">📊 打分系统</div>', unsafe_allow_html=True)
+    
+    # 快速评分模式只渲染打分按钮（打分立即保存，没有未保存的打分）
+    if st.session_state.get('rapid_mode'):
+        save_session_progress(data, selected_model, username)
+        display_rapid_scoring(data, selected_model, username, save_path)
+        return
+    
+    # 显示用户名信息
+    st.info(f"👤 当前用户: {username}")
+    
+    # 获取之前的review数据（如果存在）
+    previous_review = get_previous_review(data, selected_model)
+    
+    # PEER打分
+    st.markdown("**PEER打分 (0-5分):**")
+    display_report_metrics(data, selected_model)
+    
+    default_score = previous_review.get('peer_score', 0)
+    peer_score = st.slider(
+        "评分",
+        min_value=0,
+        max_value=5,
+        value=st.session_state.get('restored_scores', {}).get((case_key(data), selected_model), default_score),
+        step=1,
+        key=f"peer_score_{selected_model}",
+        label_visibility="collapsed"
+    )
+    save_session_progress(data, selected_model, username, None if peer_score == default_score else peer_score)
+    
+    # 添加帮助信息
+    with st.expander("📖 PEER评分标准说明", expanded=True):
+        st.markdown("""
+        **PEER评分详细标准：**
+        
+        **5分 - 正确**
+        - 大部分诊断结果正确
+        - 大部分描述相同
+        - 存在一些错误描述，但不太可能具有临床意义
+        
+        **4分 - 基本正确**
+        - 75%的诊断结果正确
+        - 大部分描述相同
+        - 存在一些可能具有临床意义的错误描述
+        
+        **3分 - 部分正确**
+        - 50%的诊断结果正确
+        
+        **2分 - 部分错误**
+        - 25%的诊断结果正确
+        
+        **1分 - 存在重大错误**
+        - 诊断错误
+        - 可能只有一些阴性描述是相同的实现分类精度测试
+        
+        **0分 - 不可接受**
+        - 所描述的信息完全没有重叠
+        """)
+    
+    # 准备保存的数据
+    review_data = build_review_data(data, selected_model, peer_score)
+    
+    # 将数据转换为JSON字符串
+    json_data = json.dumps(review_data, ensure_ascii=False, indent=2)
+    
+    # 生成文件名
+    review_number = 0
+    if is_model_reviewed(data, selected_model):
+        current_review = previous_review
+        if current_review.get('username') == username and 'review_number' in current_review:
+            review_number = current_review.get('review_number', 0) + 1
+    
+    # 从report或case_name提取subject_id, study_id
+    subject_id = data.get('report', {}).get('subject_id') if data else None
+    study_id = data.get('report', {}).get('study_id') if data else None
+    case_name = data.get('case_name', '') if data else ''
+    if (not subject_id or not study_id) and case_name.startswith('subject_') and '_study_' in case_name:
+        try:
+            subject_id = case_name.split('subject_')[1].split('_study_')[0]
+            study_id = case_name.split('_study_')[1]
+        except Exception:
+            pass
+    subject_id = subject_id if subject_id is not None else 'unknown'
+    study_id = study_id if study_id is not None else 'unknown'
+
+    filename = f"subject_{subject_id}_study_{study_id}_{selected_model}_review_{username}_{review_number}.json"
+    
+    # 下载按钮
+    st.download_button(
+        label="💾 下载评分结果",
+        data=json_data,
+        file_name=filename,
+        mime="application/json",
+        key=f"download_{selected_model}",
+        type="primary"
+    )
+    
+    # 服务器端保存：加入后台写入队列后立即返回，由后台线程批量落盘
+    writer = get_review_writer()
+    if st.button("📤 保存到服务器", key=f"save_{selected_model}"):
+        try:
+            submit_score(data, selected_model, username, save_path, peer_score, "normal")
+            st.success("✅ 已加入保存队列")
+        except (ValueError, RuntimeError) as e:
+            st.error(f"❌ 保存失败: {e}")
+    writer_stats = writer.stats(username)
+    st.caption(
+        f"待写入 {writer_stats['pending']} 条，已写入 {writer_stats['flushed']} 条"
+        f"（{writer_stats['batches']} 批）"
+        + (f"，{writer_stats['failed']} 条写入失败" if writer_stats['failed'] else "")
+    )
+    if writer_stats['last_error']:
+        st.warning(f"⚠️ 您的评分后台写入失败: {writer_stats['last_error']}")
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["--warmup"]:
+        warm_up_command(sys.argv[2:])
+    else:
+        with timed("main.total"):
+            main()
+        if TIMING_LOG_AUTO:
+            get_timing_stats().flush(TIMING_LOG_PATH)
+        if WARMUP_ENABLED:
+            get_warmup()
@@ -0,0 +1,24 @@
+"""主界面面板的片段装饰器检查：在面板函数前插入辅助函数时，@st.fragment容易落到辅助函数上"""
+import ast
+import os
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+# 面板内的控件只重跑所在面板，不重跑整个页面
+FRAGMENT_PANES = {"display_image_pane", "display_report_pane", "display_scoring_pane"}
+
+
+def is_fragment_decorator(node):
+    if isinstance(node, ast.Call):
+        node = node.func
+    return isinstance(node, ast.Attribute) and node.attr == "fragment"
+
+
+def test_only_panes_are_fragments():
+    with open(APP_PATH, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    fragments = {
+        node.name for node in ast.walk(tree)
+        if isinstance(node, ast.FunctionDef) and any(is_fragment_decorator(d) for d in node.decorator_list)
+    }
+    assert fragments == FRAGMENT_PANES
@@ -0,0 +1,57 @@
+"""评分统计的增量更新：数据集中新增、修改、删除的review文件都反映到统计中"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit_app
+
+
+def write_review(case_dir, model_name, username, number, score):
+    path = os.path.join(case_dir, streamlit_app.review_file_name(model_name, username, number))
+    streamlit_app.write_json_atomic(path, {'peer_score': score})
+    return path
+
+
+def summary(analytics):
+    analytics.update()
+    return {row['model_name']: (row['n'], row['distribution']) for row in analytics.model_summary()}
+
+
+def refresh(index):
+    # 文件夹mtime的精度有限，等待后再刷新索引，保证变化被看到
+    time.sleep(0.01)
+    index.refresh()
+
+
+def test_review_file_changes_are_incremental(tmp_path):
+    dataset = tmp_path / "dataset"
+    case_dir = dataset / "case_1"
+    os.makedirs(case_dir)
+    with open(case_dir / "model_a_predict.json", 'w', encoding='utf-8') as f:
+        json.dump({'findings': "ok"}, f)
+    write_review(case_dir, "model_a", "alice", 0, 2)
+
+    index = streamlit_app.CaseIndex(str(dataset))
+    index.refresh()
+    analytics = streamlit_app.ReviewAnalytics(streamlit_app.ReviewStore(str(tmp_path / "reviews.sqlite3")))
+    analytics.watch(index)
+    assert summary(analytics) == {"model_a": (1, [0, 0, 1, 0, 0, 0])}
+
+    # 索引未变化时不再读取任何文件
+    assert analytics.update() == 0
+
+    # 原位置修改的文件重新读取
+    bob = write_review(case_dir, "model_a", "bob", 0, 4)
+    refresh(index)
+    assert summary(analytics) == {"model_a": (2, [0, 0, 1, 0, 1, 0])}
+    write_review(case_dir, "model_a", "bob", 0, 5)
+    refresh(index)
+    assert summary(analytics) == {"model_a": (2, [0, 0, 1, 0, 0, 1])}
+
+    # 删除的文件撤回其评分
+    os.remove(bob)
+    refresh(index)
+    assert summary(analytics) == {"model_a": (1, [0, 0, 1, 0, 0, 0])}
@@ -0,0 +1,72 @@
+"""评分结果存储的并发写入测试：多个进程、每个进程多个线程同时为同一(病例, 模型, 用户)保存review"""
+import json
+import multiprocessing
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit_app
+
+PROCESSES = 4
+THREADS = 4
+REVIEWS_PER_THREAD = 5
+MODEL = "model_a"
+USER = "alice"
+
+
+def save_from_threads(db_path, case_dir, worker):
+    """在一个进程中用多个线程保存review，返回分配到的编号"""
+    store = streamlit_app.ReviewStore(db_path)
+    numbers = []
+    lock = threading.Lock()
+
+    def run(thread):
+        for i in range(REVIEWS_PER_THREAD):
+            review_data = {'peer_score': (worker + thread + i) % 6, 'writer': f"{worker}-{thread}-{i}"}
+            path = streamlit_app.save_review(case_dir, MODEL, USER, review_data, store=store)
+            number = int(os.path.basename(path)[:-len('.json')].rsplit('_', 1)[1])
+            with lock:
+                numbers.append(number)
+
+    threads = [threading.Thread(target=run, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return numbers
+
+
+def test_concurrent_writers_get_distinct_contiguous_numbers(tmp_path):
+    db_path = str(tmp_path / "reviews.sqlite3")
+    case_dir = str(tmp_path / "case")
+    os.makedirs(case_dir)
+    # 目录中已有的review文件：编号从其后继续
+    with open(os.path.join(case_dir, streamlit_app.review_file_name(MODEL, USER, 0)), 'w', encoding='utf-8') as f:
+        json.dump({'peer_score': 1, 'writer': "existing"}, f)
+    streamlit_app.ReviewStore(db_path)
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(PROCESSES) as pool:
+        results = pool.starmap(save_from_threads, [(db_path, case_dir, worker) for worker in range(PROCESSES)])
+
+    total = PROCESSES * THREADS * REVIEWS_PER_THREAD
+    numbers = sorted(number for numbers in results for number in numbers)
+    assert numbers == list(range(1, total + 1))
+
+    # 每个编号对应一个文件，且文件内容来自不同的写入者（没有文件被覆盖）
+    writers = set()
+    for number in range(total + 1):
+        with open(os.path.join(case_dir, streamlit_app.review_file_name(MODEL, USER, number)), encoding='utf-8') as f:
+            review = json.load(f)
+        assert review.get('review_number', 0) == number
+        writers.add(review['writer'])
+    assert len(writers) == total + 1
+
+    store = streamlit_app.ReviewStore(db_path)
+    rows = store._conn().execute(
+        "SELECT COUNT(*), COUNT(DISTINCT review_number) FROM reviews WHERE model_name = ? AND username = ?",
+        (MODEL, USER)
+    ).fetchone()
+    assert rows == (total, total)
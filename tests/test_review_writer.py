@@ -0,0 +1,63 @@
+"""后台批量写入的失败处理：一条review写入失败不影响同一批的其它review"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit_app
+
+
+def make_writer(tmp_path):
+    store = streamlit_app.ReviewStore(str(tmp_path / "reviews.sqlite3"))
+    # 刷新间隔很长，只在测试中显式刷新
+    writer = streamlit_app.ReviewWriter(store, str(tmp_path / "reviews.journal"), 50, 3600, True, max_attempts=2)
+    return store, writer
+
+
+def read_journal(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_submit_rejects_unusable_save_path(tmp_path):
+    _, writer = make_writer(tmp_path)
+    not_a_directory = tmp_path / "file"
+    not_a_directory.write_text("")
+    with pytest.raises(ValueError):
+        writer.submit(str(tmp_path / "case"), "model_a", "alice", {'peer_score': 3}, str(not_a_directory))
+    assert writer.stats()['pending'] == 0
+    writer.close()
+
+
+def test_failing_item_does_not_block_batch(tmp_path):
+    store, writer = make_writer(tmp_path)
+    case_dir = tmp_path / "case"
+    bad_dir = tmp_path / "bad"
+    bad_dir.mkdir()
+    writer.submit(str(case_dir), "model_a", "alice", {'peer_score': 3})
+    writer.submit(str(case_dir), "model_a", "bob", {'peer_score': 4}, str(bad_dir))
+    # 提交之后保存目录变得不可用
+    bad_dir.rmdir()
+    bad_dir.write_text("")
+
+    assert writer.flush() == 1
+    assert os.path.exists(case_dir / streamlit_app.review_file_name("model_a", "alice", 0))
+    stats = writer.stats("bob")
+    assert (stats['pending'], stats['flushed'], stats['failed']) == (1, 1, 0)
+    assert stats['last_error']
+    assert writer.stats("alice")['last_error'] is None
+    assert [item['username'] for item in read_journal(writer.journal_path)] == ["bob"]
+
+    # 达到重试次数后移到失败日志，不再留在队列中
+    assert writer.flush() == 0
+    stats = writer.stats("bob")
+    assert (stats['pending'], stats['flushed'], stats['failed']) == (0, 1, 1)
+    assert read_journal(writer.journal_path) == []
+    failed = read_journal(writer.failed_path)
+    assert [(item['username'], item['attempts']) for item in failed] == [("bob", 2)]
+    writer.close()